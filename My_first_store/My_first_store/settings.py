@@ -95,6 +95,31 @@ DATABASES = {
         "PORT": os.getenv("DB_PORT", "5432"),
     }
 }
+
+# Кэш. По умолчанию — LocMemCache в памяти процесса; при нескольких
+# процессах (gunicorn, run_import_worker) кэш каталога требует общего
+# бэкенда, например CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# и CACHE_LOCATION=redis://127.0.0.1:6379/1
+#
+# "baskets" — отдельный кэш корзин (BASKET_CACHE_ENABLED): в нём лежат ещё
+# не записанные в БД изменения, поэтому он не делит место и вытеснение
+# с кэшем каталога. Нужен Redis без вытеснения ключей (проверка core.E001),
+# например BASKET_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# и BASKET_CACHE_LOCATION=redis://127.0.0.1:6379/2
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    },
+    "baskets": {
+        "BACKEND": os.getenv(
+            "BASKET_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("BASKET_CACHE_LOCATION", "baskets"),
+    },
+}
 # настройка подключения mail для рассылки
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.mail.ru")
@@ -159,3 +184,56 @@ REST_FRAMEWORK = {
         "rest_framework.renderers.JSONRenderer",
     ],
 }
+
+# Курсорная пагинация каталога (core.pagination.KeysetPagination)
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", 50))
+CATALOG_MAX_PAGE_SIZE = int(os.getenv("CATALOG_MAX_PAGE_SIZE", 500))
+
+# Кэш ответов каталога (core.cache): LRU в процессе + общий Django-кэш.
+# Включать только с общим для процессов бэкендом (проверка core.W001)
+CATALOG_CACHE_ENABLED = os.getenv("CATALOG_CACHE_ENABLED", "False").lower() == "true"
+CATALOG_CACHE_ALIAS = os.getenv("CATALOG_CACHE_ALIAS", "default")
+CATALOG_CACHE_LRU_SIZE = int(os.getenv("CATALOG_CACHE_LRU_SIZE", 1024))
+CATALOG_CACHE_LRU_TIMEOUT = float(os.getenv("CATALOG_CACHE_LRU_TIMEOUT", 5))
+CATALOG_CACHE_TIMEOUT = int(os.getenv("CATALOG_CACHE_TIMEOUT", 300))
+
+# Быстрая сериализация списков (core.fast_serializers): products, orders,
+# order_items, basket. Пустое значение — везде ModelSerializer
+FAST_SERIALIZATION_ENDPOINTS = [
+    name.strip()
+    for name in os.getenv(
+        "FAST_SERIALIZATION_ENDPOINTS", "products,orders,order_items,basket"
+    ).split(",")
+    if name.strip()
+]
+
+# Потоковая загрузка прайс-листов (core.importer): строк товаров в одной
+# транзакции
+PRICE_LIST_CHUNK_SIZE = int(os.getenv("PRICE_LIST_CHUNK_SIZE", 1000))
+
+# Фоновые загрузки прайс-листов (core.jobs, manage.py run_import_worker):
+# каталог для файлов заданий, число потоков воркера, опрос очереди и через
+# сколько секунд без отметки «жив» задание считается брошенным
+IMPORT_JOBS_DIR = os.getenv("IMPORT_JOBS_DIR", str(BASE_DIR / "import_jobs"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", 4))
+IMPORT_POLL_INTERVAL = float(os.getenv("IMPORT_POLL_INTERVAL", 2))
+IMPORT_JOB_STALE_SECONDS = int(os.getenv("IMPORT_JOB_STALE_SECONDS", 600))
+
+# Заголовок Idempotency-Key (core.idempotency): сколько секунд хранится
+# ответ, сколько повтор ждёт выполняющийся запрос с тем же ключом и через
+# сколько секунд незавершённый запрос считается брошенным
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", 24 * 60 * 60))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", 30))
+IDEMPOTENCY_STALE_SECONDS = int(os.getenv("IDEMPOTENCY_STALE_SECONDS", 600))
+
+# Корзины в кэше с отложенной записью в БД (core.baskets): алиас кэша
+# (отдельный и общий для всех процессов — Redis, см. CACHES), срок жизни
+# записи корзины, раз в сколько секунд и сколько корзин за транзакцию
+# фоновый поток пишет в БД (0 — только при оформлении заказа), через
+# сколько секунд брошенная блокировка корзины снимается
+BASKET_CACHE_ENABLED = os.getenv("BASKET_CACHE_ENABLED", "False").lower() == "true"
+BASKET_CACHE_ALIAS = os.getenv("BASKET_CACHE_ALIAS", "baskets")
+BASKET_CACHE_TIMEOUT = int(os.getenv("BASKET_CACHE_TIMEOUT", 7 * 24 * 60 * 60))
+BASKET_FLUSH_INTERVAL = float(os.getenv("BASKET_FLUSH_INTERVAL", 5))
+BASKET_FLUSH_BATCH_SIZE = int(os.getenv("BASKET_FLUSH_BATCH_SIZE", 500))
+BASKET_LOCK_TIMEOUT = int(os.getenv("BASKET_LOCK_TIMEOUT", 30))
@@ -0,0 +1,157 @@
+# Операции с корзиной, которые должны быть атомарными в БД, и проверка
+# корзины перед оформлением заказа.
+
+from django.db import connection, transaction
+
+from core.models import BasketItem, Product
+
+# Добавление товара — один запрос: вставка позиции или увеличение
+# количества существующей (unique_together basket+product) вместе с
+# проверкой остатка на складе. Количество складывается в БД, поэтому
+# параллельные добавления (двойной клик, несколько вкладок) не теряются.
+# Синтаксис общий для PostgreSQL и SQLite (3.35+).
+_ADD_SQL = """
+    INSERT INTO {item} (basket_id, product_id, quantity)
+    SELECT %(basket_id)s, p.id, %(quantity)s FROM {product} AS p
+    WHERE p.id = %(product_id)s AND p.quantity >= %(quantity)s
+    ON CONFLICT (basket_id, product_id) DO UPDATE
+    SET quantity = {item}.quantity + excluded.quantity
+    WHERE {item}.quantity + excluded.quantity <= (
+        SELECT quantity FROM {product} WHERE id = excluded.product_id
+    )
+    RETURNING id, quantity
+"""
+
+
+def add_to_basket(basket, product, quantity):
+    """
+    Добавляет ``quantity`` товара в корзину. Возвращает позицию с итоговым
+    количеством или None, если столько товара нет на складе.
+    """
+    if connection.vendor in ("postgresql", "sqlite"):
+        row = _add_upsert(basket, product, quantity)
+    else:
+        row = _add_locked(basket, product, quantity)
+    if row is None:
+        return None
+    item_id, total = row
+    return BasketItem(id=item_id, basket=basket, product=product, quantity=total)
+
+
+def _add_upsert(basket, product, quantity):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _ADD_SQL.format(
+                item=BasketItem._meta.db_table, product=Product._meta.db_table
+            ),
+            {"basket_id": basket.id, "product_id": product.id, "quantity": quantity},
+        )
+        return cursor.fetchone()
+
+
+def _add_locked(basket, product, quantity):
+    # Прочие СУБД: блокировка строки товара на время проверки и записи
+    with transaction.atomic():
+        stock = (
+            Product.objects.select_for_update()
+            .values_list("quantity", flat=True)
+            .get(id=product.id)
+        )
+        item, created = BasketItem.objects.get_or_create(
+            basket=basket, product=product, defaults={"quantity": 0}
+        )
+        if item.quantity + quantity > stock:
+            transaction.set_rollback(True)
+            return None
+        item.quantity += quantity
+        item.save(update_fields=["quantity"])
+    return item.id, item.quantity
+
+
+# То же для нескольких товаров сразу (пакетное изменение корзины): остаток
+# при вставке уже проверен вызывающим, при увеличении — здесь
+_ADD_MANY_SQL = """
+    INSERT INTO {item} (basket_id, product_id, quantity) VALUES {values}
+    ON CONFLICT (basket_id, product_id) DO UPDATE
+    SET quantity = {item}.quantity + excluded.quantity
+    WHERE {item}.quantity + excluded.quantity <= (
+        SELECT quantity FROM {product} WHERE id = excluded.product_id
+    )
+    RETURNING product_id
+"""
+
+
+def add_many_to_basket(basket, quantities):
+    """
+    Добавляет в корзину {product_id: количество} одним запросом. Возвращает
+    множество id добавленных товаров; остальных не хватило на складе.
+    """
+    if not quantities:
+        return set()
+    if connection.vendor not in ("postgresql", "sqlite"):
+        return {
+            product_id
+            for product_id, quantity in quantities.items()
+            if _add_locked(basket, Product(id=product_id), quantity) is not None
+        }
+    params = []
+    for product_id, quantity in quantities.items():
+        params += [basket.id, product_id, quantity]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _ADD_MANY_SQL.format(
+                item=BasketItem._meta.db_table,
+                product=Product._meta.db_table,
+                values=", ".join(["(%s, %s, %s)"] * len(quantities)),
+            ),
+            params,
+        )
+        return {product_id for (product_id,) in cursor.fetchall()}
+
+
+def stock_error(name, requested, available):
+    return f'Недостаточно товара "{name}" на складе. Запрошено: {requested}, доступно: {available}'
+
+
+def supplier_error(supplier_name, name):
+    return f'Поставщик "{supplier_name}" не принимает заказы. Невозможно оформить заказ с товаром "{name}".'
+
+
+def basket_items(basket, lock=False):
+    """
+    Позиции корзины с товарами и поставщиками (один запрос) в порядке
+    добавления. ``lock`` — строки товаров блокируются до конца транзакции:
+    остатки не изменятся между проверкой корзины и оформлением заказа.
+    """
+    items = (
+        BasketItem.objects.filter(basket=basket)
+        .select_related("product__supplier")
+        .order_by("id")
+    )
+    if lock:
+        items = items.select_for_update(of=("product",))
+    return list(items)
+
+
+def basket_errors(items):
+    """
+    Проблемы позиций из basket_items(): хватает ли товара на складе и
+    принимает ли поставщик заказы. Список [{"item_id", "product_id",
+    "error"}] в порядке позиций; пустой — корзину можно оформлять.
+    """
+    errors = []
+    for item in items:
+        product = item.product
+        if not product.supplier.accepts_orders:
+            error = supplier_error(product.supplier.name, product.name)
+        elif item.quantity > product.quantity:
+            error = stock_error(product.name, item.quantity, product.quantity)
+        else:
+            continue
+        errors.append({"item_id": item.id, "product_id": product.id, "error": error})
+    return errors
+
+
+def validate_basket(basket):
+    """Проверяет все позиции корзины одним запросом (см. basket_errors)."""
+    return basket_errors(basket_items(basket))
@@ -1,3 +1,417 @@
-from django.test import TestCase
+import pickle
+import threading
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from basket import services
+from core import baskets
+from core.checks import check_basket_cache
+from core.models import Basket, BasketItem, Category, DeliveryAddress, Order
+from core.tests import QueryBudgetMixin, make_product, make_supplier, make_user
+
+
+class BasketQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.supplier = make_supplier()
+        self.category = Category.objects.create(name="Смартфоны")
+        self.basket = Basket.objects.create(user=self.user)
+        self.add_item()
+
+    def add_item(self):
+        BasketItem.objects.create(
+            basket=self.basket,
+            product=make_product(self.supplier, self.category),
+            quantity=2,
+        )
+
+    def test_basket_view(self):
+        def grow():
+            for _ in range(5):
+                self.add_item()
+
+        def fetch():
+            response = self.client.get("/api/basket/")
+            self.assertEqual(response.status_code, 200)
+
+        self.assertQueryCountConstant(fetch, grow)
+
+    def test_sparse_fields_and_include(self):
+        response = self.client.get(
+            "/api/basket/?fields=items.quantity,items.product&include=products"
+        )
+        product_id = self.basket.items.get().product_id
+        self.assertEqual(
+            response.data["data"],
+            {"items": [{"quantity": 2, "product": product_id}]},
+        )
+        self.assertEqual(
+            [product["id"] for product in response.data["included"]["products"]],
+            [product_id],
+        )
+
+
+@override_settings(FAST_SERIALIZATION_ENDPOINTS=[])
+class BasketModelSerializerQueryBudgetTests(BasketQueryBudgetTests):
+    """Те же бюджеты без быстрой сериализации: ModelSerializer и prefetch."""
+
+
+class BasketBatchTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.supplier = make_supplier()
+        self.category = Category.objects.create(name="Смартфоны")
+        self.basket = Basket.objects.create(user=self.user)
+
+    def batch(self, operations):
+        response = self.client.post(
+            "/api/basket/batch/", {"operations": operations}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def quantities(self):
+        return dict(self.basket.items.values_list("product_id", "quantity"))
+
+    def test_operations_and_stock_errors(self):
+        kept, removed, scarce = (
+            make_product(self.supplier, self.category) for _ in range(3)
+        )
+        BasketItem.objects.create(basket=self.basket, product=removed, quantity=1)
+        data = self.batch(
+            [
+                {"op": "add", "product_id": kept.id, "quantity": 2},
+                {"op": "add", "product_id": kept.id, "quantity": 3},
+                {"op": "remove", "product_id": removed.id},
+                {"op": "set", "product_id": scarce.id, "quantity": 11},
+                {"op": "add", "product_id": 10**9},
+            ]
+        )
+        self.assertEqual(self.quantities(), {kept.id: 5})
+        self.assertEqual([error["index"] for error in data["errors"]], [3, 4])
+        self.assertEqual(data["basket"]["total_quantity"], 5)
+
+    def test_concurrent_add_is_not_lost(self):
+        existing, new, replaced = (
+            make_product(self.supplier, self.category) for _ in range(3)
+        )
+        BasketItem.objects.create(basket=self.basket, product=existing, quantity=1)
+        add_many = services.add_many_to_basket
+
+        def add_concurrently(basket, quantities):
+            # Между чтением корзины и записью другой запрос добавляет те же
+            # товары через /api/basket/add/
+            for product in (existing, new, replaced):
+                services.add_to_basket(basket, product, 2)
+            return add_many(basket, quantities)
+
+        with mock.patch("basket.views.add_many_to_basket", add_concurrently):
+            data = self.batch(
+                [
+                    {"op": "add", "product_id": existing.id, "quantity": 3},
+                    {"op": "add", "product_id": new.id, "quantity": 3},
+                    {"op": "set", "product_id": replaced.id, "quantity": 4},
+                ]
+            )
+        self.assertEqual(data["errors"], [])
+        # set задаёт итог, а не прибавляет
+        self.assertEqual(self.quantities(), {existing.id: 6, new.id: 5, replaced.id: 4})
+
+    def test_concurrent_add_beyond_stock_is_an_error(self):
+        product = make_product(self.supplier, self.category)
+        add_many = services.add_many_to_basket
+
+        def add_concurrently(basket, quantities):
+            services.add_to_basket(basket, product, 8)
+            return add_many(basket, quantities)
+
+        with mock.patch("basket.views.add_many_to_basket", add_concurrently):
+            data = self.batch([{"op": "add", "product_id": product.id, "quantity": 3}])
+        self.assertEqual([error["index"] for error in data["errors"]], [0])
+        self.assertEqual(self.quantities(), {product.id: 8})
+
+    def test_rejects_body_that_is_not_object(self):
+        product = make_product(self.supplier, self.category)
+        response = self.client.post(
+            "/api/basket/batch/",
+            [{"op": "add", "product_id": product.id}],
+            format="json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.basket.items.exists())
+
+    def test_query_count(self):
+        products = [make_product(self.supplier, self.category) for _ in range(12)]
+        # Сначала 2 товара, затем 10: запросов столько же
+        chunks = iter([products[:2], products[2:]])
+
+        def fetch():
+            chunk = next(chunks)
+            self.batch(
+                [{"op": "add", "product_id": p.id} for p in chunk]
+                + [{"op": "set", "product_id": p.id, "quantity": 3} for p in chunk]
+            )
+
+        self.assertQueryCountConstant(fetch, lambda: None)
+
+
+@override_settings(BASKET_CACHE_ENABLED=True, BASKET_FLUSH_INTERVAL=0)
+class CachedBasketTests(TestCase):
+    def setUp(self):
+        caches[settings.BASKET_CACHE_ALIAS].clear()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name="Смартфоны")
+        self.products = [
+            make_product(make_supplier(), category, quantity=10) for _ in range(2)
+        ]
+
+    def add(self, product, quantity):
+        response = self.client.post(
+            "/api/basket/add/",
+            {"product_id": product.id, "quantity": quantity},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def stored(self):
+        return dict(
+            BasketItem.objects.filter(basket__user=self.user).values_list(
+                "product_id", "quantity"
+            )
+        )
+
+    def test_changes_are_written_behind(self):
+        first, second = self.products
+        item = self.add(first, 2)
+        self.add(second, 1)
+        # Новые позиции записаны сразу, изменения количества — нет
+        self.assertEqual(self.add(first, 3)["quantity"], 5)
+        self.client.delete(f"/api/basket/remove/{item['id']}/")
+        self.assertEqual(self.stored(), {first.id: 2, second.id: 1})
+
+        response = self.client.get("/api/basket/")
+        self.assertEqual(
+            [(row["product"]["id"], row["quantity"]) for row in response.data["items"]],
+            [(second.id, 1)],
+        )
+
+        self.assertEqual(baskets.flush_dirty(), 1)
+        self.assertEqual(self.stored(), {second.id: 1})
+        self.assertEqual(self.add(first, 4)["quantity"], 4)
+
+    def test_same_output_as_database_basket(self):
+        item = self.add(self.products[0], 2)
+        self.add(self.products[1], 1)
+        self.client.put(
+            f"/api/basket/update/{item['id']}/", {"quantity": 3}, format="json"
+        )
+        cached = self.client.get("/api/basket/")
+        baskets.flush(self.user)
+        with self.settings(BASKET_CACHE_ENABLED=False):
+            stored = self.client.get("/api/basket/")
+        self.assertEqual(cached.content, stored.content)
+
+    def test_order_sees_flushed_basket(self):
+        product = self.products[0]
+        self.add(product, 1)
+        self.add(product, 2)
+        address = DeliveryAddress.objects.create(
+            user=self.user, city="Москва", street="Тверская", house="1"
+        )
+        response = self.client.post(
+            "/api/orders/create/", {"delivery_address_id": address.id}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(list(order.items.values_list("quantity", flat=True)), [3])
+
+    def test_failed_order_keeps_cached_changes(self):
+        product = self.products[0]
+        self.add(product, 1)
+        self.add(product, 4)
+        address = DeliveryAddress.objects.create(
+            user=self.user, city="Москва", street="Тверская", house="1"
+        )
+        with mock.patch("orders.views.send_mail", side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.client.post(
+                    "/api/orders/create/",
+                    {"delivery_address_id": address.id},
+                    format="json",
+                    HTTP_IDEMPOTENCY_KEY="order-1",
+                )
+        self.assertFalse(Order.objects.exists())
+        response = self.client.get("/api/basket/")
+        self.assertEqual([row["quantity"] for row in response.data["items"]], [5])
+
+    def test_unlock_keeps_lock_taken_by_other(self):
+        cache = caches[settings.BASKET_CACHE_ALIAS]
+        key = baskets.LOCK_PREFIX + str(self.user.id)
+        token = baskets._try_lock(self.user.id)
+        real_loads = pickle.loads
+        takers = []
+
+        def take_lock():
+            # Блокировка истекла и её занимает другой запрос
+            cache.set(key, "other")
+
+        def loads_then_take(data):
+            # Между сравнением токена и удалением
+            if not takers:
+                takers.append(threading.Thread(target=take_lock))
+                takers[0].start()
+                takers[0].join(0.1)
+            return real_loads(data)
+
+        with mock.patch.object(baskets.pickle, "loads", loads_then_take):
+            baskets._unlock(self.user.id, token)
+        takers[0].join()
+        # Снята только наша блокировка, занятая другим осталась
+        self.assertEqual(cache.get(key), "other")
+
+    def test_shared_dedicated_cache_is_required(self):
+        self.assertEqual(
+            [error.id for error in check_basket_cache(None)], ["core.E001"]
+        )
+        redis = {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": "redis://127.0.0.1:6379/2",
+        }
+        with self.settings(CACHES={**settings.CACHES, "baskets": redis}):
+            self.assertEqual(check_basket_cache(None), [])
+            # Общий с кэшем каталога алиас тоже не годится
+            with self.settings(
+                CATALOG_CACHE_ENABLED=True, CATALOG_CACHE_ALIAS="baskets"
+            ):
+                self.assertEqual(
+                    [error.id for error in check_basket_cache(None)], ["core.E001"]
+                )
+
+
+class BasketAddTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = make_product(
+            make_supplier(), Category.objects.create(name="К"), quantity=5
+        )
+
+    def add(self, quantity):
+        return self.client.post(
+            "/api/basket/add/",
+            {"product_id": self.product.id, "quantity": quantity},
+            format="json",
+        )
+
+    def test_increments_up_to_stock(self):
+        self.assertEqual(self.add(2).data["quantity"], 2)
+        self.assertEqual(self.add(3).data["quantity"], 5)
+        response = self.add(1)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Запрошено: 6, доступно: 5", response.data["error"])
+        self.assertEqual(BasketItem.objects.get().quantity, 5)
+
+
+# SQLite блокирует всю базу на запись: параллельные потоки падают с
+# "database table is locked" раньше, чем проверяется сама вставка
+@skipUnless(connection.vendor == "postgresql", "нужна PostgreSQL")
+class BasketAddConcurrencyTests(TransactionTestCase):
+    def test_parallel_adds_are_not_lost(self):
+        user = make_user()
+        Basket.objects.create(user=user)
+        product = make_product(
+            make_supplier(), Category.objects.create(name="К"), quantity=100
+        )
+        statuses = []
+        start = threading.Barrier(8)
+
+        def add():
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                start.wait()
+                for _ in range(5):
+                    response = client.post(
+                        "/api/basket/add/",
+                        {"product_id": product.id, "quantity": 2},
+                        format="json",
+                    )
+                    statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 80 штук при остатке 100: все добавления проходят и ни одно не теряется
+        self.assertEqual(statuses, [201] * 40)
+        self.assertEqual(BasketItem.objects.get(product=product).quantity, 80)
+
+
+class BasketValidationTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name="К")
+        self.basket = Basket.objects.create(user=self.user)
+
+    def add_item(self, quantity=1, stock=10, supplier=None):
+        product = make_product(
+            supplier or make_supplier(), self.category, quantity=stock
+        )
+        return BasketItem.objects.create(
+            basket=self.basket, product=product, quantity=quantity
+        )
+
+    def test_reports_every_problem_line(self):
+        self.add_item()
+        scarce = self.add_item(quantity=3, stock=2)
+        closed = make_supplier()
+        closed.accepts_orders = False
+        closed.save()
+        blocked = self.add_item(supplier=closed)
+
+        response = self.client.get("/api/basket/validate/")
+        self.assertFalse(response.data["valid"])
+        self.assertEqual(
+            [error["item_id"] for error in response.data["errors"]],
+            [scarce.id, blocked.id],
+        )
+        self.assertIn("Запрошено: 3, доступно: 2", response.data["errors"][0]["error"])
+
+        address = DeliveryAddress.objects.create(
+            user=self.user, city="Москва", street="Тверская", house="1"
+        )
+        response = self.client.post(
+            "/api/orders/create/", {"delivery_address_id": address.id}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data["errors"]), 2)
+        self.assertFalse(Order.objects.exists())
+
+    def test_query_count(self):
+        self.add_item()
+
+        def fetch():
+            self.assertTrue(self.client.get("/api/basket/validate/").data["valid"])
+
+        self.assertQueryCountConstant(
+            fetch, lambda: [self.add_item() for _ in range(5)]
+        )
@@ -4,6 +4,8 @@ from . import views
 urlpatterns = [
     path("api/basket/", views.basket_view, name="basket"),
     path("api/basket/add/", views.basket_add_view, name="basket-add"),
+    path("api/basket/batch/", views.basket_batch_view, name="basket-batch"),
+    path("api/basket/validate/", views.basket_validate_view, name="basket-validate"),
     path(
         "api/basket/remove/<int:item_id>/",
         views.basket_remove_view,
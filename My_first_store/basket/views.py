@@ -4,9 +4,24 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from django.db import transaction
 
 from core.models import Basket, BasketItem, Product
-from core.serializers import BasketSerializer, BasketItemSerializer
+from core.serializers import (
+    BasketSerializer,
+    BasketItemSerializer,
+    build_included,
+    sparse_context,
+)
+from core.querysets import prefetch_basket, products_for_serializer
+from core import baskets, fast_serializers
+
+from .services import (
+    add_many_to_basket,
+    add_to_basket,
+    stock_error,
+    validate_basket,
+)
 
 
 # логика работы с корзиной
@@ -14,9 +29,27 @@ from core.serializers import BasketSerializer, BasketItemSerializer
 @permission_classes([IsAuthenticated])
 def basket_view(request):
     """Возвращает корзину аутентифицированного пользователя."""
-    basket, created = Basket.objects.get_or_create(user=request.user)
-    serializer = BasketSerializer(basket)
-    return Response(serializer.data)
+    sparse = "fields" in request.query_params or "include" in request.query_params
+    if baskets.enabled() and not sparse:
+        state = baskets.get_state(request.user)
+        return Response(fast_serializers.serialize_basket_state(state))
+    # ?fields= и ?include= сериализуются из БД
+    with baskets.persisted(request.user):
+        basket, created = Basket.objects.get_or_create(user=request.user)
+        return Response(_basket_data(request, basket))
+
+
+def _basket_data(request, basket):
+    if fast_serializers.is_enabled("basket") and not (
+        "fields" in request.query_params or "include" in request.query_params
+    ):
+        return fast_serializers.serialize_basket(basket)
+    context = sparse_context(request)
+    data = BasketSerializer(prefetch_basket(basket), context=context).data
+    included = build_included(context)
+    if included is not None:
+        data = {"data": data, "included": included}
+    return data
 
 
 @api_view(["POST"])
@@ -38,18 +71,25 @@ def basket_add_view(request):
                 {"error": "Количество должно быть положительным числом"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        product = Product.objects.get(id=product_id)
+        product = products_for_serializer().get(id=product_id)
     except Product.DoesNotExist:
         return Response({"error": "Товар не найден"}, status=status.HTTP_404_NOT_FOUND)
 
-    basket, created = Basket.objects.get_or_create(user=request.user)
-    basket_item, created = BasketItem.objects.get_or_create(
-        basket=basket, product=product, defaults={"quantity": quantity}
-    )
+    if baskets.enabled():
+        added = baskets.add(request.user, product.id, quantity, product.quantity)
+        basket_item = added and BasketItem(
+            id=added[0], product=product, quantity=added[1]
+        )
+    else:
+        basket, created = Basket.objects.get_or_create(user=request.user)
+        basket_item = add_to_basket(basket, product, quantity)
 
-    if not created:
-        basket_item.quantity += quantity
-        basket_item.save()
+    if basket_item is None:
+        requested = _quantity_in_basket(request, product) + quantity
+        return Response(
+            {"error": stock_error(product.name, requested, product.quantity)},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
     serializer = BasketItemSerializer(basket_item)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -59,14 +99,14 @@ def basket_add_view(request):
 @permission_classes([IsAuthenticated])
 def basket_remove_view(request, item_id):
     """Удаляет товар из корзины аутентифицированного пользователя."""
-    try:
-        basket_item = BasketItem.objects.get(id=item_id, basket__user=request.user)
-    except BasketItem.DoesNotExist:
+    basket_item = _find_item(request, item_id)
+    if basket_item is None:
         return Response(
             {"error": "Товар не найден в корзине"}, status=status.HTTP_404_NOT_FOUND
         )
 
-    basket_item.delete()
+    basket_item.quantity = 0
+    _save_item(request, basket_item)
     return Response(
         {"message": "Товар удалён из корзины"}, status=status.HTTP_204_NO_CONTENT
     )
@@ -76,10 +116,8 @@ def basket_remove_view(request, item_id):
 @permission_classes([IsAuthenticated])
 def basket_update_quantity_view(request, item_id):
     """Обновляет количество товара в корзине аутентифицированного пользователя."""
-    try:
-
-        basket_item = BasketItem.objects.get(id=item_id, basket__user=request.user)
-    except BasketItem.DoesNotExist:
+    basket_item = _find_item(request, item_id)
+    if basket_item is None:
         return Response(
             {"error": "Товар не найден в корзине"}, status=status.HTTP_404_NOT_FOUND
         )
@@ -95,7 +133,8 @@ def basket_update_quantity_view(request, item_id):
         new_quantity = int(new_quantity)
         if new_quantity <= 0:
             # Если количество <= 0, можно автоматически удалить
-            basket_item.delete()
+            basket_item.quantity = 0
+            _save_item(request, basket_item)
             return Response(
                 {"message": "Товар удалён из корзины"}, status=status.HTTP_200_OK
             )
@@ -109,13 +148,218 @@ def basket_update_quantity_view(request, item_id):
     if basket_item.product.quantity < new_quantity:
         return Response(
             {
-                "error": f'Недостаточно товара "{basket_item.product.name}" на складе. Запрошено: {new_quantity}, доступно: {basket_item.product.quantity}'
+                "error": stock_error(
+                    basket_item.product.name,
+                    new_quantity,
+                    basket_item.product.quantity,
+                )
             },
             status=status.HTTP_400_BAD_REQUEST,
         )
 
     basket_item.quantity = new_quantity
-    basket_item.save()
+    _save_item(request, basket_item)
 
     serializer = BasketItemSerializer(basket_item)
     return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+def _quantity_in_basket(request, product):
+    if baskets.enabled():
+        entry = baskets.get_state(request.user)["items"].get(product.id)
+        return entry[1] if entry else 0
+    return (
+        BasketItem.objects.filter(basket__user=request.user, product=product)
+        .values_list("quantity", flat=True)
+        .first()
+        or 0
+    )
+
+
+def _find_item(request, item_id):
+    """Позиция корзины пользователя или None; корзина в кэше — без запроса к БД."""
+    if not baskets.enabled():
+        return (
+            BasketItem.objects.select_related("product")
+            .filter(id=item_id, basket__user=request.user)
+            .first()
+        )
+    found = baskets.find_item(baskets.get_state(request.user), item_id)
+    if found is None:
+        return None
+    product_id, quantity = found
+    return BasketItem(id=item_id, product_id=product_id, quantity=quantity)
+
+
+def _save_item(request, basket_item):
+    """Записывает количество позиции; 0 — удаляет её."""
+    if baskets.enabled():
+        baskets.set_quantity(request.user, basket_item.id, basket_item.quantity)
+    elif basket_item.quantity:
+        basket_item.save()
+    else:
+        basket_item.delete()
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@baskets.persisted_basket
+def basket_validate_view(request):
+    """Проверяет, можно ли оформить корзину: остатки и приём заказов поставщиками."""
+    basket, created = Basket.objects.get_or_create(user=request.user)
+    errors = validate_basket(basket)
+    return Response({"valid": not errors, "errors": errors}, status=status.HTTP_200_OK)
+
+
+# Пакетное изменение корзины: {"operations": [{"op": "add" | "set" |
+# "remove", "product_id": ..., "quantity": ...}, ...]}. Операции выполняются
+# по порядку одной транзакцией, постоянным числом запросов. Строки, которые
+# нельзя выполнить (нет товара, не хватает на складе), пропускаются и
+# попадают в "errors" с номером операции.
+BATCH_OPERATIONS = ("add", "set", "remove")
+MAX_BATCH_OPERATIONS = 1000
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+@baskets.persisted_basket
+def basket_batch_view(request):
+    """Добавляет, изменяет и удаляет товары корзины одним запросом."""
+    # Тело может быть и не объектом (например, JSON-массивом)
+    operations = (
+        request.data.get("operations") if isinstance(request.data, dict) else None
+    )
+    if not isinstance(operations, list) or not operations:
+        return Response(
+            {"error": 'Ожидается непустой список "operations"'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return Response(
+            {"error": f"Не больше {MAX_BATCH_OPERATIONS} операций за запрос"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        try:
+            op = operation.get("op")
+            product_id = int(operation["product_id"])
+            quantity = int(operation.get("quantity", 1))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return Response(
+                {
+                    "error": f"Операция #{index}: нужны целые product_id и quantity",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if op not in BATCH_OPERATIONS:
+            return Response(
+                {
+                    "error": f"Операция #{index}: op должен быть одним из {', '.join(BATCH_OPERATIONS)}"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if op == "add" and quantity <= 0:
+            return Response(
+                {"error": f"Операция #{index}: количество должно быть положительным"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        parsed.append((index, op, product_id, quantity))
+
+    product_ids = {product_id for _, _, product_id, _ in parsed}
+    errors = []
+    with transaction.atomic():
+        basket, created = Basket.objects.get_or_create(user=request.user)
+        products = Product.objects.only("id", "name", "quantity").in_bulk(product_ids)
+        items = {
+            item.product_id: item
+            for item in BasketItem.objects.filter(
+                basket=basket, product_id__in=product_ids
+            )
+        }
+        # Итоговое количество по товару; 0 — строки в корзине не будет
+        quantities = {product_id: item.quantity for product_id, item in items.items()}
+        # Товары, количество которых задали set/remove: итог записывается
+        # как есть. У остальных к корзине прибавляется разница — так
+        # параллельные добавления того же товара не теряются
+        replaced = set()
+        # Последняя операция add по товару — для ошибки, если не хватит остатка
+        add_index = {}
+
+        for index, op, product_id, quantity in parsed:
+            product = products.get(product_id)
+            if product is None:
+                errors.append(
+                    {
+                        "index": index,
+                        "product_id": product_id,
+                        "error": "Товар не найден",
+                    }
+                )
+                continue
+            current = quantities.get(product_id, 0)
+            if op == "remove":
+                new_quantity = 0
+            elif op == "add":
+                new_quantity = current + quantity
+            else:
+                new_quantity = max(quantity, 0)
+            if new_quantity > product.quantity:
+                errors.append(
+                    {
+                        "index": index,
+                        "product_id": product_id,
+                        "error": stock_error(
+                            product.name, new_quantity, product.quantity
+                        ),
+                    }
+                )
+                continue
+            quantities[product_id] = new_quantity
+            if op == "add":
+                add_index[product_id] = index
+            else:
+                replaced.add(product_id)
+
+        added, stored, removed = {}, [], []
+        for product_id, quantity in quantities.items():
+            item = items.get(product_id)
+            current = item.quantity if item else 0
+            if product_id not in replaced:
+                if quantity != current:
+                    added[product_id] = quantity - current
+            elif not quantity:
+                removed.append(product_id)
+            elif quantity != current:
+                stored.append(
+                    BasketItem(basket=basket, product_id=product_id, quantity=quantity)
+                )
+        # Остаток при увеличении проверяется в БД: товар могли добавить
+        # параллельно
+        for product_id in added.keys() - add_many_to_basket(basket, added):
+            product = products[product_id]
+            errors.append(
+                {
+                    "index": add_index[product_id],
+                    "product_id": product_id,
+                    "error": stock_error(
+                        product.name, quantities[product_id], product.quantity
+                    ),
+                }
+            )
+        if stored:
+            BasketItem.objects.bulk_create(
+                stored,
+                update_conflicts=True,
+                unique_fields=["basket", "product"],
+                update_fields=["quantity"],
+            )
+        if removed:
+            BasketItem.objects.filter(basket=basket, product_id__in=removed).delete()
+    errors.sort(key=lambda error: error["index"])
+
+    return Response(
+        {"basket": _basket_data(request, basket), "errors": errors},
+        status=status.HTTP_200_OK,
+    )
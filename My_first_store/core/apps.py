@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        # Подключаем обработчики сигналов каталога и проверки настроек
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,362 @@
+# Корзины в кэше с отложенной записью в БД (settings.BASKET_CACHE_ENABLED).
+#
+# Состояние корзины пользователя — id корзины и {товар: [id позиции,
+# количество]} — хранится в отдельном Django-кэше на Redis
+# (settings.BASKET_CACHE_ALIAS, проверка core.E001). Изменения делаются под
+# блокировкой пользователя (cache.add с таймаутом), поэтому параллельные
+# запросы одного пользователя не теряют изменений.
+#
+# Новая позиция сразу вставляется в БД: API обращается к позициям по id.
+# Изменения количества и удаления (количество 0) пишутся в БД позже —
+# фоновым потоком процесса пачками раз в BASKET_FLUSH_INTERVAL секунд.
+#
+# Гарантия сохранности: view под @persisted_basket (оформление и
+# подтверждение заказа, пакетные операции) сначала записывают корзину в БД
+# и держат блокировку до конца запроса, поэтому заказ всегда видит полную и
+# неизменную корзину. Незаписанные изменения живут в общем кэше; потерять
+# их можно, только если кэш вытеснит или потеряет запись корзины раньше
+# записи в БД.
+
+import atexit
+import logging
+import pickle
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, transaction
+
+from .models import Basket, BasketItem
+
+logger = logging.getLogger(__name__)
+
+STATE_PREFIX = "basket:state:"
+LOCK_PREFIX = "basket:lock:"
+
+# Как часто ждущий запрос проверяет блокировку корзины (секунды)
+LOCK_POLL_INTERVAL = 0.01
+
+# Снятие блокировки, только если она ещё наша — одной командой Redis
+_UNLOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Пользователи с незаписанными изменениями, известные этому процессу
+_dirty = set()
+_dirty_lock = threading.Lock()
+_flusher = None
+
+
+def enabled():
+    return settings.BASKET_CACHE_ENABLED
+
+
+def _cache():
+    return caches[settings.BASKET_CACHE_ALIAS]
+
+
+def _try_lock(user_id):
+    token = uuid.uuid4().hex
+    if _cache().add(LOCK_PREFIX + str(user_id), token, settings.BASKET_LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def _unlock(user_id, token):
+    """
+    Снимает блокировку, если она ещё наша: истёкшую и занятую другим не
+    трогаем. Проверка и удаление атомарны — иначе между ними блокировка
+    может истечь и достаться другому запросу, а мы снимем уже её.
+    """
+    _delete_if_equal(_cache(), LOCK_PREFIX + str(user_id), token)
+
+
+def _delete_if_equal(cache, key, value):
+    """
+    Атомарно удаляет ``key``, если в нём ``value``.
+
+    У кэшей Django для этого нет публичного API, поэтому только здесь код
+    опирается на внутренности бэкендов Django 5.2: у RedisCache — клиент
+    redis-py и сериализатор значений (cache._cache), у LocMemCache —
+    блокировка и словарь значений. При обновлении Django проверить здесь.
+    """
+    key = cache.make_and_validate_key(key)
+    if isinstance(cache, RedisCache):
+        client = cache._cache.get_client(key, write=True)
+        client.eval(_UNLOCK_SCRIPT, 1, key, cache._cache._serializer.dumps(value))
+    elif isinstance(cache, LocMemCache):
+        # Кэш в памяти процесса (тесты, см. core.E001): пока держим его
+        # блокировку, записать ключ никто не может
+        with cache._lock:
+            if not cache._has_expired(key) and pickle.loads(cache._cache[key]) == value:
+                cache._delete(key)
+    else:
+        raise ImproperlyConfigured(
+            "Корзины в кэше поддерживают только RedisCache (проверка core.E001)"
+        )
+
+
+@contextmanager
+def _locked(user_id):
+    """
+    Блокировка корзины пользователя. Брошенная блокировка (упавший процесс)
+    снимается сама через BASKET_LOCK_TIMEOUT секунд.
+    """
+    token = _try_lock(user_id)
+    while token is None:
+        time.sleep(LOCK_POLL_INTERVAL)
+        token = _try_lock(user_id)
+    try:
+        yield
+    finally:
+        _unlock(user_id, token)
+
+
+def _load(user):
+    basket, created = Basket.objects.get_or_create(user=user)
+    items = {
+        product_id: [item_id, quantity]
+        for item_id, product_id, quantity in BasketItem.objects.filter(
+            basket=basket
+        ).values_list("id", "product_id", "quantity")
+    }
+    return {
+        "id": basket.id,
+        "created_at": basket.created_at,
+        "updated_at": basket.updated_at,
+        "items": items,
+        # Товары, количество которых изменено, но не записано в БД
+        "changed": set(),
+    }
+
+
+def _state(user):
+    state = _cache().get(STATE_PREFIX + str(user.id))
+    if state is None:
+        return _load(user)
+    if state["changed"]:
+        # Изменения мог оставить другой процесс — запишем их и мы
+        _mark_dirty(user.id)
+    return state
+
+
+def _save(user_id, state):
+    _cache().set(STATE_PREFIX + str(user_id), state, settings.BASKET_CACHE_TIMEOUT)
+    if state["changed"]:
+        _mark_dirty(user_id)
+
+
+def get_state(user):
+    """Состояние корзины пользователя; при промахе кэша читается из БД."""
+    state = _cache().get(STATE_PREFIX + str(user.id))
+    if state is not None:
+        if state["changed"]:
+            _mark_dirty(user.id)
+        return state
+    with _locked(user.id):
+        state = _state(user)
+        _save(user.id, state)
+    return state
+
+
+def item_rows(state):
+    """[(id позиции, id товара, количество)] корзины в порядке добавления."""
+    return sorted(
+        (item_id, product_id, quantity)
+        for product_id, (item_id, quantity) in state["items"].items()
+        if quantity
+    )
+
+
+def find_item(state, item_id):
+    """(id товара, количество) позиции корзины или None."""
+    for product_id, (known_id, quantity) in state["items"].items():
+        if known_id == item_id and quantity:
+            return product_id, quantity
+    return None
+
+
+def add(user, product_id, quantity, stock):
+    """
+    Добавляет товар в корзину; возвращает (id позиции, количество) или None,
+    если в корзине оказалось бы больше ``stock``.
+    """
+    with _locked(user.id):
+        state = _state(user)
+        entry = state["items"].get(product_id)
+        if (entry[1] if entry else 0) + quantity > stock:
+            return None
+        if entry is None:
+            item, created = BasketItem.objects.get_or_create(
+                basket_id=state["id"],
+                product_id=product_id,
+                defaults={"quantity": quantity},
+            )
+            entry = state["items"][product_id] = [item.id, item.quantity]
+            if created:
+                quantity = 0
+        entry[1] += quantity
+        if quantity:
+            state["changed"].add(product_id)
+        _save(user.id, state)
+    return tuple(entry)
+
+
+def set_quantity(user, item_id, quantity):
+    """
+    Меняет количество позиции (0 — удаляет её). Возвращает id товара или
+    None, если позиции в корзине нет.
+    """
+    with _locked(user.id):
+        state = _state(user)
+        found = find_item(state, item_id)
+        if found is None:
+            return None
+        product_id = found[0]
+        state["items"][product_id][1] = quantity
+        state["changed"].add(product_id)
+        _save(user.id, state)
+    return product_id
+
+
+def _write(states):
+    """Записывает незаписанные изменения корзин одной транзакцией."""
+    updated, removed = [], []
+    for state in states:
+        for product_id in state["changed"]:
+            item_id, quantity = state["items"][product_id]
+            if quantity:
+                updated.append(BasketItem(id=item_id, quantity=quantity))
+            else:
+                removed.append(item_id)
+    with transaction.atomic():
+        if updated:
+            BasketItem.objects.bulk_update(updated, ["quantity"])
+        if removed:
+            BasketItem.objects.filter(id__in=removed).delete()
+
+
+def _written(state):
+    state["items"] = {
+        product_id: entry for product_id, entry in state["items"].items() if entry[1]
+    }
+    state["changed"] = set()
+
+
+def _mark_dirty(user_id):
+    global _flusher
+    with _dirty_lock:
+        _dirty.add(user_id)
+        if _flusher is None and settings.BASKET_FLUSH_INTERVAL > 0:
+            _flusher = threading.Thread(target=_flush_loop, daemon=True)
+            _flusher.start()
+            atexit.register(flush_dirty)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(settings.BASKET_FLUSH_INTERVAL)
+        try:
+            while flush_dirty() >= settings.BASKET_FLUSH_BATCH_SIZE:
+                pass
+        except Exception:
+            logger.exception("Не удалось записать корзины в БД")
+        finally:
+            close_old_connections()
+
+
+def flush_dirty():
+    """
+    Записывает в БД до BASKET_FLUSH_BATCH_SIZE корзин с изменениями одной
+    транзакцией. Корзины, занятые другим запросом, откладываются до
+    следующего раза. Возвращает число записанных корзин.
+    """
+    with _dirty_lock:
+        user_ids = list(_dirty)[: settings.BASKET_FLUSH_BATCH_SIZE]
+        _dirty.difference_update(user_ids)
+    locks = {}
+    try:
+        for user_id in user_ids:
+            token = _try_lock(user_id)
+            if token is None:
+                with _dirty_lock:
+                    _dirty.add(user_id)
+            else:
+                locks[user_id] = token
+        keys = {STATE_PREFIX + str(user_id): user_id for user_id in locks}
+        states = {
+            keys[key]: state
+            for key, state in _cache().get_many(keys).items()
+            if state["changed"]
+        }
+        try:
+            _write(states.values())
+        except Exception:
+            with _dirty_lock:
+                _dirty.update(states)
+            raise
+        for state in states.values():
+            _written(state)
+        _cache().set_many(
+            {STATE_PREFIX + str(user_id): state for user_id, state in states.items()},
+            settings.BASKET_CACHE_TIMEOUT,
+        )
+        return len(states)
+    finally:
+        for user_id, token in locks.items():
+            _unlock(user_id, token)
+
+
+def flush(user):
+    """Сразу записывает изменения корзины пользователя в БД."""
+    with _locked(user.id):
+        _flush_locked(user)
+
+
+def _flush_locked(user):
+    key = STATE_PREFIX + str(user.id)
+    state = _cache().get(key)
+    if state is None or not state["changed"]:
+        return
+    _write([state])
+    _written(state)
+    _cache().set(key, state, settings.BASKET_CACHE_TIMEOUT)
+
+
+@contextmanager
+def persisted(user):
+    """
+    Корзина пользователя записана в БД и не меняется до выхода из блока.
+    Внутри блока корзину можно менять через ORM: на выходе её состояние в
+    кэше сбрасывается и будет перечитано из БД.
+    """
+    if not enabled() or not user.is_authenticated:
+        yield
+        return
+    with _locked(user.id):
+        _flush_locked(user)
+        try:
+            yield
+        finally:
+            _cache().delete(STATE_PREFIX + str(user.id))
+
+
+def persisted_basket(view):
+    """Декоратор view: весь запрос выполняется внутри persisted(request.user)."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with persisted(request.user):
+            return view(request, *args, **kwargs)
+
+    return wrapper
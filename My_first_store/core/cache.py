@@ -0,0 +1,171 @@
+# Read-through кэш ответов каталога.
+#
+# Два уровня: ограниченный LRU в памяти процесса и общий Django-кэш
+# (settings.CATALOG_CACHE_ALIAS). Каждая запись привязана к набору тегов
+# ("products", "product:<id>", "supplier:<id>", "categories"); версия тега
+# хранится в общем кэше и входит в ключ записи. Инвалидация — смена версии
+# тега: старые записи становятся недостижимыми в любом процессе и
+# вытесняются сами. Для этого общий кэш должен быть общим для всех
+# процессов (Redis, Memcached — см. core.checks); LRU процесса хранит
+# записи не дольше CATALOG_CACHE_LRU_TIMEOUT секунд.
+
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+TAG_PREFIX = "catalog:tag:"
+ENTRY_PREFIX = "catalog:entry:"
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU с ограничением на число записей и (если задан
+    ``timeout``) на время жизни записи в секундах.
+    """
+
+    def __init__(self, max_entries, timeout=None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            value, expires_at = self._data[key]
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value):
+        expires_at = None
+        if self.timeout is not None:
+            expires_at = time.monotonic() + self.timeout
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CatalogCache:
+    def __init__(self):
+        self._lru = None
+        self._lock = threading.Lock()
+        self._counters = {
+            "lru_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+        }
+
+    @property
+    def shared(self):
+        return caches[getattr(settings, "CATALOG_CACHE_ALIAS", "default")]
+
+    @property
+    def lru(self):
+        if self._lru is None:
+            self._lru = LRUCache(
+                getattr(settings, "CATALOG_CACHE_LRU_SIZE", 1024),
+                getattr(settings, "CATALOG_CACHE_LRU_TIMEOUT", 5),
+            )
+        return self._lru
+
+    @property
+    def timeout(self):
+        return getattr(settings, "CATALOG_CACHE_TIMEOUT", 300)
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def tag_versions(self, tags):
+        keys = [TAG_PREFIX + tag for tag in tags]
+        versions = self.shared.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # Потерянная версия не должна совпасть с прежней — берём новую
+                self.shared.add(key, uuid.uuid4().hex, None)
+                versions[key] = self.shared.get(key)
+        return [versions[key] for key in keys]
+
+    def entry_key(self, key, tags):
+        versions = ":".join(str(v) for v in self.tag_versions(tags))
+        digest = hashlib.md5(f"{key}|{versions}".encode("utf-8")).hexdigest()
+        return ENTRY_PREFIX + digest
+
+    def get_or_set(self, key, tags, compute):
+        """
+        Возвращает значение по ключу или вычисляет его через ``compute()``.
+
+        Если ``compute`` вернул None, значение не кэшируется.
+        """
+        if not getattr(settings, "CATALOG_CACHE_ENABLED", True):
+            return compute()
+
+        entry_key = self.entry_key(key, tags)
+
+        value = self.lru.get(entry_key)
+        if value is not None:
+            self._count("lru_hits")
+            return value
+
+        value = self.shared.get(entry_key)
+        if value is not None:
+            self._count("shared_hits")
+            self.lru.set(entry_key, value)
+            return value
+
+        self._count("misses")
+        value = compute()
+        if value is not None:
+            self.shared.set(entry_key, value, self.timeout)
+            self.lru.set(entry_key, value)
+        return value
+
+    def invalidate(self, tags):
+        """Сбрасывает все записи с указанными тегами."""
+        tags = list(tags)
+        if not tags:
+            return
+        self.shared.set_many({TAG_PREFIX + tag: uuid.uuid4().hex for tag in tags}, None)
+        self._count("invalidations", len(tags))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats["lru_size"] = len(self.lru)
+        stats["lru_max_size"] = self.lru.max_entries
+        stats["lru_evictions"] = self.lru.evictions
+        return stats
+
+
+catalog_cache = CatalogCache()
+
+
+def product_tags(product_ids=(), supplier_id=None):
+    """Теги, которые сбрасываются при изменении товаров."""
+    tags = ["products"]
+    if supplier_id is not None:
+        tags.append(f"supplier:{supplier_id}")
+    tags.extend(f"product:{product_id}" for product_id in product_ids)
+    return tags
@@ -0,0 +1,59 @@
+# Проверки настроек (manage.py check и запуск сервера).
+
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+REDIS_BACKEND = "django.core.cache.backends.redis.RedisCache"
+
+# Бэкенды, данные которых живут в памяти одного процесса
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def is_process_local(alias):
+    backend = settings.CACHES.get(alias, {}).get("BACKEND", "")
+    return backend in PROCESS_LOCAL_BACKENDS
+
+
+@register()
+def check_catalog_cache(app_configs, **kwargs):
+    if not settings.CATALOG_CACHE_ENABLED:
+        return []
+    if is_process_local(settings.CATALOG_CACHE_ALIAS):
+        return [
+            Warning(
+                "Кэш каталога включён на кэше в памяти процесса: сброс "
+                "кэша не дойдёт до других процессов (gunicorn, воркеры "
+                "загрузок), и они будут отдавать устаревший каталог.",
+                hint="Задайте общий бэкенд (CACHE_BACKEND) или "
+                "CATALOG_CACHE_ENABLED=False.",
+                id="core.W001",
+            )
+        ]
+    return []
+
+
+@register()
+def check_basket_cache(app_configs, **kwargs):
+    if not settings.BASKET_CACHE_ENABLED:
+        return []
+    alias = settings.BASKET_CACHE_ALIAS
+    backend = settings.CACHES.get(alias, {}).get("BACKEND", "")
+    shared_with_catalog = (
+        settings.CATALOG_CACHE_ENABLED and alias == settings.CATALOG_CACHE_ALIAS
+    )
+    if backend != REDIS_BACKEND or shared_with_catalog:
+        return [
+            Error(
+                "Корзины в кэше требуют отдельного общего для процессов кэша "
+                "на Redis: незаписанные изменения корзины в кэше в памяти "
+                "процесса не видны другим процессам и теряются при "
+                "вытеснении, в том числе записями кэша каталога.",
+                hint="Задайте BASKET_CACHE_BACKEND и BASKET_CACHE_LOCATION "
+                "(алиас BASKET_CACHE_ALIAS) или BASKET_CACHE_ENABLED=False.",
+                id="core.E001",
+            )
+        ]
+    return []
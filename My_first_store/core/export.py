@@ -0,0 +1,115 @@
+# Потоковая выгрузка каталога (NDJSON / CSV).
+#
+# Товары читаются через серверный курсор (iterator(chunk_size=...)) пачками
+# по CHUNK_SIZE: на пачку — один запрос параметров, записи сразу уходят в
+# ответ. Память не зависит от размера каталога.
+#
+# Выгрузка изменений (?since=) заканчивается удалёнными товарами
+# (core.models.DeletedProduct): в NDJSON — {"id", "external_id",
+# "supplier_id", "category_id", "catalog_version", "updated_at",
+# "deleted": true}, в CSV — строки с deleted=1 без данных товара.
+
+import csv
+import json
+from itertools import islice
+
+from rest_framework import serializers
+
+from .fast_serializers import product_rows, serialize_products
+
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    "ndjson": "application/x-ndjson; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+}
+
+CSV_COLUMNS = [
+    "id",
+    "external_id",
+    "name",
+    "price",
+    "quantity",
+    "category_id",
+    "category",
+    "supplier_id",
+    "supplier",
+    "catalog_version",
+    "updated_at",
+    "parameters",
+    "deleted",
+]
+
+
+def iter_products(products, chunk_size=CHUNK_SIZE):
+    """Товары в виде словарей ProductSerializer, пачками через серверный курсор."""
+    rows = product_rows(products).order_by("id").iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from serialize_products(chunk)
+
+
+def iter_deleted(deleted, chunk_size=CHUNK_SIZE):
+    """Записи удалённых товаров (queryset DeletedProduct или None)."""
+    if deleted is None:
+        return
+    to_datetime = serializers.DateTimeField().to_representation
+    for row in deleted.order_by("product_id").iterator(chunk_size=chunk_size):
+        yield {
+            "id": row.product_id,
+            "external_id": row.external_id,
+            "supplier_id": row.supplier_id,
+            "category_id": row.category_id,
+            "catalog_version": row.catalog_version,
+            "updated_at": to_datetime(row.deleted_at),
+            "deleted": True,
+        }
+
+
+def export_ndjson(products, deleted=None):
+    for product in iter_products(products):
+        yield json.dumps(product, ensure_ascii=False) + "\n"
+    for record in iter_deleted(deleted):
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+class _Echo:
+    # csv.writer пишет в «файл», который просто возвращает строку
+    def write(self, value):
+        return value
+
+
+def export_csv(products, deleted=None):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for product in iter_products(products):
+        parameters = {
+            item["parameter"]["name"]: item["value"] for item in product["parameters"]
+        }
+        yield writer.writerow(
+            [
+                product["id"],
+                product["external_id"],
+                product["name"],
+                product["price"],
+                product["quantity"],
+                product["category"]["id"],
+                product["category"]["name"],
+                product["supplier"]["id"],
+                product["supplier"]["name"],
+                product["catalog_version"],
+                product["updated_at"],
+                json.dumps(parameters, ensure_ascii=False),
+                "",
+            ]
+        )
+    for record in iter_deleted(deleted):
+        row = dict.fromkeys(CSV_COLUMNS, "")
+        row.update(record)
+        row["deleted"] = 1
+        yield writer.writerow([row[column] for column in CSV_COLUMNS])
+
+
+EXPORTERS = {"ndjson": export_ndjson, "csv": export_csv}
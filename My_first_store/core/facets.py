@@ -0,0 +1,130 @@
+# Фасеты каталога: предрассчитанные счётчики товаров по
+# (категория, параметр, значение) в ProductFacetCount.
+#
+# Счётчики обновляются инкрементально: пишущий код оборачивает изменения
+# товаров в track_facets(queryset) — до и после записи снимается
+# распределение значений только по затронутым товарам, а в таблицу
+# счётчиков применяется разница.
+
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Parameter, Product, ProductFacetCount, ProductParameter
+
+
+def facet_snapshot(products):
+    """Счётчики (category_id, parameter_id, value) для набора товаров."""
+    rows = (
+        ProductParameter.objects.filter(product__in=products.values("id"))
+        .values_list("product__category_id", "parameter_id", "value")
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    return Counter(
+        {(cat_id, param_id, value): n for cat_id, param_id, value, n in rows}
+    )
+
+
+def apply_facet_delta(delta):
+    """Применяет изменения счётчиков; нулевые строки удаляются."""
+    delta = {key: n for key, n in delta.items() if n}
+    if not delta:
+        return
+
+    with transaction.atomic():
+        # Недостающие строки создаём с нулём, затем блокируем все затронутые
+        ProductFacetCount.objects.bulk_create(
+            [
+                ProductFacetCount(
+                    category_id=cat_id, parameter_id=param_id, value=value, count=0
+                )
+                for (cat_id, param_id, value), n in delta.items()
+                if n > 0
+            ],
+            ignore_conflicts=True,
+        )
+        rows = ProductFacetCount.objects.select_for_update().filter(
+            category_id__in={key[0] for key in delta},
+            parameter_id__in={key[1] for key in delta},
+            value__in={key[2] for key in delta},
+        )
+
+        changed, empty = [], []
+        for row in rows:
+            n = delta.get((row.category_id, row.parameter_id, row.value))
+            if n is None:
+                continue
+            row.count = max(row.count + n, 0)
+            if row.count:
+                changed.append(row)
+            else:
+                empty.append(row.pk)
+
+        if changed:
+            ProductFacetCount.objects.bulk_update(changed, ["count"], batch_size=1000)
+        if empty:
+            ProductFacetCount.objects.filter(pk__in=empty).delete()
+
+
+@contextmanager
+def track_facets(products):
+    """
+    Поддерживает счётчики фасетов для изменений внутри блока.
+
+    ``products`` — queryset затронутых товаров (например, все товары
+    поставщика). Он вычисляется до и после блока, поэтому должен
+    задаваться фильтром, а не списком уже загруженных объектов.
+    """
+    with transaction.atomic():
+        before = facet_snapshot(products)
+        yield
+        after = facet_snapshot(products)
+        after.subtract(before)
+        apply_facet_delta(after)
+
+
+def add_facets(products):
+    """Добавляет в счётчики только что созданные товары (снимка «до» у них нет)."""
+    apply_facet_delta(facet_snapshot(products))
+
+
+def rebuild_facets():
+    """Полностью пересчитывает счётчики (для первичного заполнения)."""
+    with transaction.atomic():
+        ProductFacetCount.objects.all().delete()
+        apply_facet_delta(facet_snapshot(Product.objects.all()))
+
+
+def facet_counts(category_ids=None, products=None):
+    """
+    Счётчики фасетов в виде списка параметров со значениями.
+
+    Без ``products`` ответ берётся из предрассчитанной таблицы (при
+    необходимости суммируется по категориям). Если передан queryset
+    отфильтрованных товаров, счётчики считаются по нему.
+    """
+    if products is None:
+        rows = ProductFacetCount.objects.all()
+        if category_ids:
+            rows = rows.filter(category_id__in=category_ids)
+        rows = rows.values_list("parameter_id", "value").annotate(n=Sum("count"))
+    else:
+        rows = (
+            ProductParameter.objects.filter(product__in=products.values("id"))
+            .values_list("parameter_id", "value")
+            .annotate(n=Count("product_id", distinct=True))
+        )
+    rows = rows.order_by("parameter_id", "value")
+
+    grouped = {}
+    for param_id, value, n in rows:
+        grouped.setdefault(param_id, []).append({"value": value, "count": n})
+
+    names = dict(Parameter.objects.filter(id__in=grouped).values_list("id", "name"))
+    return [
+        {"parameter": {"id": param_id, "name": names.get(param_id)}, "values": values}
+        for param_id, values in grouped.items()
+    ]
@@ -0,0 +1,250 @@
+# Быстрая сериализация горячих списков.
+#
+# Вместо дерева ModelSerializer ответ собирается из строк .values(): товар
+# с категорией и поставщиком — одной строкой JOIN, параметры — одним
+# запросом на всю страницу. Ключи и форматы значений совпадают с
+# ProductSerializer, OrderItemSerializer, OrderSerializer и
+# BasketItemSerializer; десятичные числа и даты форматируют те же поля DRF.
+#
+# Использование в два шага: *_rows(queryset) даёт queryset строк (его можно
+# пагинировать), serialize_*(rows) превращает страницу строк в ответ.
+
+from functools import lru_cache
+
+from django.conf import settings
+from rest_framework import serializers
+
+from . import baskets
+from .models import BasketItem, OrderItem, Product, ProductParameter
+
+PRODUCT_FIELDS = (
+    "id",
+    "name",
+    "price",
+    "quantity",
+    "external_id",
+    "catalog_version",
+    "updated_at",
+    "category_id",
+    "category__name",
+    "supplier_id",
+    "supplier__name",
+    "supplier__accepts_orders",
+    "supplier__user_id",
+)
+
+ADDRESS_FIELDS = ("id", "city", "street", "house", "apartment", "user_id")
+
+
+@lru_cache(maxsize=None)
+def _formatters():
+    # Те же поля DRF, что и в ModelSerializer: формат чисел и дат не расходится
+    return {
+        "price": serializers.DecimalField(max_digits=10, decimal_places=2),
+        "datetime": serializers.DateTimeField(),
+    }
+
+
+def is_enabled(endpoint):
+    """Включён ли быстрый путь для эндпоинта (settings.FAST_SERIALIZATION_ENDPOINTS)."""
+    return endpoint in getattr(settings, "FAST_SERIALIZATION_ENDPOINTS", ())
+
+
+def _values(queryset, fields):
+    # select_related/prefetch_related для строк не нужны
+    return queryset.select_related(None).prefetch_related(None).values(*fields)
+
+
+def _prefixed(prefix, fields):
+    return tuple(f"{prefix}{name}" for name in fields)
+
+
+def _parameters_by_product(product_ids):
+    parameters = {product_id: [] for product_id in product_ids}
+    rows = (
+        ProductParameter.objects.filter(product_id__in=parameters)
+        .order_by("id")
+        .values_list("product_id", "parameter_id", "parameter__name", "value")
+    )
+    for product_id, parameter_id, parameter_name, value in rows:
+        parameters[product_id].append(
+            {"parameter": {"id": parameter_id, "name": parameter_name}, "value": value}
+        )
+    return parameters
+
+
+def _product(row, key, parameters, formatters):
+    product_id = row[key["id"]]
+    return {
+        "id": product_id,
+        "parameters": parameters[product_id],
+        "category": {
+            "id": row[key["category_id"]],
+            "name": row[key["category__name"]],
+        },
+        "supplier": {
+            "id": row[key["supplier_id"]],
+            "name": row[key["supplier__name"]],
+            "accepts_orders": row[key["supplier__accepts_orders"]],
+            "user": row[key["supplier__user_id"]],
+        },
+        "name": row[key["name"]],
+        "price": formatters["price"].to_representation(row[key["price"]]),
+        "quantity": row[key["quantity"]],
+        "external_id": row[key["external_id"]],
+        "catalog_version": row[key["catalog_version"]],
+        "updated_at": formatters["datetime"].to_representation(row[key["updated_at"]]),
+    }
+
+
+def _products(rows, prefix=""):
+    formatters = _formatters()
+    # Имена колонок с префиксом ("product__price") считаем один раз на страницу
+    key = {name: f"{prefix}{name}" for name in PRODUCT_FIELDS}
+    parameters = _parameters_by_product({row[key["id"]] for row in rows})
+    return [_product(row, key, parameters, formatters) for row in rows]
+
+
+# Товары
+
+
+def product_rows(queryset):
+    return _values(queryset, PRODUCT_FIELDS)
+
+
+def serialize_products(rows):
+    """Аналог ProductSerializer(many=True) для строк product_rows()."""
+    return _products(list(rows))
+
+
+# Позиции заказа
+
+
+def order_item_rows(queryset):
+    return _values(
+        queryset,
+        ("id", "order_id", "quantity") + _prefixed("product__", PRODUCT_FIELDS),
+    )
+
+
+def serialize_order_items(rows):
+    """Аналог OrderItemSerializer(many=True) для строк order_item_rows()."""
+    rows = list(rows)
+    products = _products(rows, "product__")
+    return [
+        {"product": product, "quantity": row["quantity"]}
+        for row, product in zip(rows, products)
+    ]
+
+
+# Заказы
+
+
+def order_rows(queryset):
+    return _values(
+        queryset,
+        ("id", "status", "created_at", "updated_at", "user_id", "address_id")
+        + _prefixed("address__", ADDRESS_FIELDS),
+    )
+
+
+def serialize_orders(rows):
+    """Аналог OrderSerializer(many=True) для строк order_rows()."""
+    rows = list(rows)
+    items = {row["id"]: [] for row in rows}
+    item_rows = list(
+        order_item_rows(OrderItem.objects.filter(order_id__in=items)).order_by("id")
+    )
+    for row, item in zip(item_rows, serialize_order_items(item_rows)):
+        items[row["order_id"]].append(item)
+
+    to_datetime = _formatters()["datetime"].to_representation
+    result = []
+    for row in rows:
+        address = None
+        if row["address_id"] is not None:
+            address = {
+                "id": row["address__id"],
+                "city": row["address__city"],
+                "street": row["address__street"],
+                "house": row["address__house"],
+                "apartment": row["address__apartment"],
+                "user": row["address__user_id"],
+            }
+        result.append(
+            {
+                "id": row["id"],
+                "items": items[row["id"]],
+                "address": address,
+                "status": row["status"],
+                "created_at": to_datetime(row["created_at"]),
+                "updated_at": to_datetime(row["updated_at"]),
+                "user": row["user_id"],
+            }
+        )
+    return result
+
+
+# Позиции корзины
+
+
+def basket_item_rows(queryset):
+    return _values(
+        queryset, ("id", "quantity") + _prefixed("product__", PRODUCT_FIELDS)
+    )
+
+
+def serialize_basket_items(rows):
+    """Аналог BasketItemSerializer(many=True) для строк basket_item_rows()."""
+    rows = list(rows)
+    products = _products(rows, "product__")
+    return [
+        {"id": row["id"], "product": product, "quantity": row["quantity"]}
+        for row, product in zip(rows, products)
+    ]
+
+
+def serialize_basket(basket):
+    """Аналог BasketSerializer: позиции и итоги корзины."""
+    rows = list(
+        basket_item_rows(BasketItem.objects.filter(basket=basket)).order_by("id")
+    )
+    return _basket(basket.id, basket.created_at, basket.updated_at, rows)
+
+
+def serialize_basket_state(state):
+    """serialize_basket() для корзины из кэша (core.baskets): из БД — только товары."""
+    items = baskets.item_rows(state)
+    products = {
+        row["id"]: row
+        for row in _values(
+            Product.objects.filter(id__in=[product_id for _, product_id, _ in items]),
+            PRODUCT_FIELDS,
+        )
+    }
+    rows = [
+        {
+            "id": item_id,
+            "quantity": quantity,
+            **{
+                f"product__{name}": value
+                for name, value in products[product_id].items()
+            },
+        }
+        for item_id, product_id, quantity in items
+        # Позиции удалённого товара удалены вместе с ним
+        if product_id in products
+    ]
+    return _basket(state["id"], state["created_at"], state["updated_at"], rows)
+
+
+def _basket(basket_id, created_at, updated_at, rows):
+    to_datetime = _formatters()["datetime"].to_representation
+    return {
+        "id": basket_id,
+        "items": serialize_basket_items(rows),
+        "total_quantity": sum(row["quantity"] for row in rows),
+        "total_price": sum(row["product__price"] * row["quantity"] for row in rows),
+        "created_at": to_datetime(created_at),
+        "updated_at": to_datetime(updated_at),
+    }
@@ -0,0 +1,90 @@
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import ProductParameter
+
+
+def _int_list(request, name):
+    values = []
+    for raw in request.query_params.getlist(name):
+        for part in raw.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            try:
+                values.append(int(part))
+            except ValueError:
+                raise ValidationError(
+                    {name: "Ожидается целое число или список через запятую"}
+                )
+    return values
+
+
+def _decimal(request, name):
+    raw = request.query_params.get(name)
+    if raw in (None, ""):
+        return None
+    try:
+        return Decimal(raw)
+    except InvalidOperation:
+        raise ValidationError({name: "Ожидается число"})
+
+
+def parse_parameter_filters(request):
+    """
+    Разбирает ``param=<id параметра>:<значение>``.
+
+    Несколько значений одного параметра объединяются по ИЛИ,
+    разные параметры — по И.
+    """
+    selected = defaultdict(set)
+    for raw in request.query_params.getlist("param"):
+        param_id, sep, value = raw.partition(":")
+        try:
+            param_id = int(param_id)
+        except ValueError:
+            param_id = None
+        if not sep or param_id is None:
+            raise ValidationError(
+                {"param": "Ожидается формат <id параметра>:<значение>"}
+            )
+        selected[param_id].add(value)
+    return selected
+
+
+class ProductFilterBackend(BaseFilterBackend):
+    """
+    Фильтрация каталога: ``category``, ``supplier``, ``price_min``,
+    ``price_max`` и ``param=<id параметра>:<значение>``.
+    """
+
+    def get_filters(self, request):
+        return {
+            "category": _int_list(request, "category"),
+            "supplier": _int_list(request, "supplier"),
+            "price_min": _decimal(request, "price_min"),
+            "price_max": _decimal(request, "price_max"),
+            "param": parse_parameter_filters(request),
+        }
+
+    def filter_queryset(self, request, queryset, view):
+        filters = self.get_filters(request)
+        if filters["category"]:
+            queryset = queryset.filter(category_id__in=filters["category"])
+        if filters["supplier"]:
+            queryset = queryset.filter(supplier_id__in=filters["supplier"])
+        if filters["price_min"] is not None:
+            queryset = queryset.filter(price__gte=filters["price_min"])
+        if filters["price_max"] is not None:
+            queryset = queryset.filter(price__lte=filters["price_max"])
+        for param_id, values in filters["param"].items():
+            # Подзапрос по индексу (parameter, value) вместо JOIN на каждый параметр
+            queryset = queryset.filter(
+                id__in=ProductParameter.objects.filter(
+                    parameter_id=param_id, value__in=values
+                ).values("product_id")
+            )
+        return queryset
@@ -0,0 +1,171 @@
+# Идемпотентные запросы по заголовку Idempotency-Key.
+#
+# Первый запрос с ключом записывает IdempotencyKey со статусом
+# in_progress — уникальный индекс (user, endpoint, key) не даёт двум
+# запросам выполнить работу одновременно, — выполняет view и сохраняет
+# ответ. Повтор в пределах IDEMPOTENCY_KEY_TTL получает сохранённый ответ;
+# если первый запрос ещё выполняется, повтор ждёт его завершения.
+#
+# Запись ключа и сохранение ответа — отдельные короткие запросы, view
+# в транзакцию не оборачивается: собственные транзакции view (например,
+# пачки прайс-листа) фиксируются сразу и не держат блокировки до конца
+# запроса. Поэтому view, которому нужна атомарность, обеспечивает её сам.
+# Исключение или ответ 5xx освобождают ключ: повтор выполнит работу заново.
+# Если ключ за это время заняли как брошенный (см.
+# IDEMPOTENCY_STALE_SECONDS), ответ отдаётся клиенту, но не сохраняется.
+
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+from .uploads import is_large, spool_upload
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+# Как часто повтор проверяет, завершился ли первый запрос (секунды)
+POLL_INTERVAL = 0.2
+
+
+def request_fingerprint(request):
+    """sha256 метода, пути с параметрами и тела запроса."""
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.get_full_path()}\n".encode())
+    if is_large(request):
+        # Большое тело (прайс-лист) в память не читаем: сверяем sha256
+        # временного файла, который view потом и импортирует
+        digest.update(f"{request.content_type} {spool_upload(request)[1]}".encode())
+        return digest.hexdigest()
+    try:
+        digest.update(request.body)
+    except RawPostDataException:
+        # multipart уже разобран — тело больше недоступно
+        digest.update(repr(sorted(request.data.items())).encode())
+    return digest.hexdigest()
+
+
+def idempotent(view):
+    """
+    Декоратор view под @api_view: поддержка заголовка Idempotency-Key.
+
+    Ключ действует в пределах пользователя и view. Тот же ключ с другим
+    телом запроса — 422, первый запрос не завершился за
+    IDEMPOTENCY_WAIT_TIMEOUT — 409.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{HEADER} длиннее {MAX_KEY_LENGTH} символов"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        fingerprint = request_fingerprint(request)
+        record, created = _claim(request.user, view.__name__, key, fingerprint)
+        if not created:
+            return _replay(record, fingerprint)
+
+        try:
+            response = view(request, *args, **kwargs)
+        except Exception:
+            _release(record)
+            raise
+        if response.status_code >= 500:
+            _release(record)
+        else:
+            _store(record, response)
+        return response
+
+    return wrapper
+
+
+def _owned(record):
+    # Запись всё ещё наша: её не удалили и не заняли заново
+    return IdempotencyKey.objects.filter(pk=record.pk, status="in_progress")
+
+
+def _store(record, response):
+    """Сохраняет ответ; False — ключ уже не наш."""
+    return bool(
+        _owned(record).update(
+            status="done",
+            response_status=response.status_code,
+            response_body=response.data,
+        )
+    )
+
+
+def _release(record):
+    _owned(record).delete()
+
+
+def _claim(user, endpoint, key, fingerprint):
+    """
+    (запись, True) — ключ наш, запрос нужно выполнить; (запись, False) —
+    ключ уже использован: ответ готов, запрос другой или ждать надоело.
+    """
+    keys = IdempotencyKey.objects.filter(user=user, endpoint=endpoint, key=key)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+    while True:
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user,
+                    endpoint=endpoint,
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+                )
+            IdempotencyKey.objects.filter(expires_at__lt=now).delete()
+            return record, True
+        except IntegrityError:
+            pass
+
+        record = keys.first()
+        if record is None:
+            # Запись только что удалили — пробуем занять ключ снова
+            continue
+        stale = now - timedelta(seconds=settings.IDEMPOTENCY_STALE_SECONDS)
+        if record.expires_at <= now or (
+            record.status == "in_progress" and record.created_at < stale
+        ):
+            # Срок истёк или запрос брошен: ключ свободен
+            keys.filter(pk=record.pk).delete()
+            continue
+        if record.status == "done" or record.fingerprint != fingerprint:
+            return record, False
+        if time.monotonic() >= deadline:
+            return record, False
+        time.sleep(POLL_INTERVAL)
+
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return Response(
+            {"error": f"{HEADER} уже использован с другим запросом"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.status != "done":
+        return Response(
+            {"error": f"Запрос с этим {HEADER} ещё выполняется"},
+            status=status.HTTP_409_CONFLICT,
+        )
+    return Response(
+        record.response_body,
+        status=record.response_status,
+        headers={"Idempotent-Replayed": "true"},
+    )
@@ -0,0 +1,634 @@
+# Загрузка прайс-листа поставщика пачками.
+#
+# Категории и параметры берутся из реестра (core.registry), недостающие
+# создаются одним bulk_create на загрузку; товары и их параметры —
+# upsert'ом (bulk_create(update_conflicts=True)) пачками по BATCH_SIZE
+# строк. Число запросов на пачку постоянно и не зависит от количества
+# товаров и параметров в ней. Изменения ищутся по отпечатку строки
+# (Product.content_hash): неизменённые товары не записываются вовсе.
+# validate_price_list() проверяет прайс целиком без записи в БД.
+
+import hashlib
+import json
+import time
+from collections.abc import Hashable, Iterator
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import registry
+from .facets import track_facets
+from .jsonstream import READ_SIZE, JSONStreamError, iter_array
+from .models import (
+    Category,
+    PriceListUpload,
+    Product,
+    ProductParameter,
+    Supplier,
+)
+from .signals import catalog_changed
+
+BATCH_SIZE = 1000
+
+PRODUCT_UPDATE_FIELDS = [
+    "name",
+    "category",
+    "price",
+    "quantity",
+    "content_hash",
+    "updated_at",
+]
+
+
+class PriceListError(Exception):
+    """Ошибка в данных прайс-листа; загрузка откатывается целиком."""
+
+
+class ImportInterrupted(Exception):
+    """
+    Загрузку остановил обработчик on_chunk / on_progress (например, задание
+    передано другому воркеру): загрузка не помечается упавшей.
+    """
+
+
+GOOD_FIELDS = ("id", "name", "category", "price", "quantity")
+_GOOD_FIELDS_SET = frozenset(GOOD_FIELDS)
+
+CENT = Decimal("0.01")
+
+# Ограничения полей моделей (Product, Category, Parameter)
+NAME_MAX_LENGTH = 255
+MAX_PRICE = Decimal("99999999.99")
+MAX_QUANTITY = 2147483647
+
+# Сколько ошибок возвращает проверка прайса без загрузки
+MAX_ERRORS = 1000
+
+# Раз в сколько прочитанных строк файла вызывается on_progress
+PROGRESS_ROWS = 1000
+
+GOODS_NOT_ARRAY = 'Поле "goods" должно быть списком.'
+
+
+def _is_array(value):
+    # Список из JSON или потоковый итератор (core.jsonstream.iter_array)
+    return isinstance(value, (list, Iterator))
+
+
+def _is_name(value):
+    return isinstance(value, str) and 0 < len(value) <= NAME_MAX_LENGTH
+
+
+def _is_external_id(value):
+    return (
+        isinstance(value, (str, int))
+        and not isinstance(value, bool)
+        and 0 < len(str(value)) <= NAME_MAX_LENGTH
+    )
+
+
+def parse_quantity(value):
+    """
+    (остаток, None) или (None, причина ошибки): целое от 0 до MAX_QUANTITY
+    (ограничение столбца Product.quantity).
+    """
+    try:
+        quantity = int(value)
+    except (ValueError, TypeError, OverflowError):
+        return None, "должно быть целым числом"
+    if quantity < 0:
+        return None, "не может быть отрицательным"
+    if quantity > MAX_QUANTITY:
+        return None, "слишком большое"
+    return quantity, None
+
+
+def parse_price(value):
+    """
+    (цена, None) или (None, причина ошибки): конечное число от 0 до
+    MAX_PRICE, округлённое до копеек. "NaN" и "Infinity" — не цена.
+    """
+    try:
+        price = Decimal(str(value))
+        if not price.is_finite():
+            return None, "должна быть числом"
+        price = price.quantize(CENT)
+    except (InvalidOperation, ValueError, TypeError):
+        return None, "должна быть числом"
+    if price < 0:
+        return None, "не может быть отрицательной"
+    if price > MAX_PRICE:
+        return None, "слишком большая"
+    return price, None
+
+
+def _check_categories(categories_data):
+    """Разбирает категории; возвращает ({id: название}, [(номер, ошибка)])."""
+    categories, errors = {}, []
+    if not _is_array(categories_data):
+        return categories, [(None, 'Поле "categories" должно быть списком.')]
+    for index, cat_data in enumerate(categories_data):
+        if not isinstance(cat_data, dict) or not {"id", "name"} <= cat_data.keys():
+            errors.append((index, f"В категории #{index} нет поля id или name."))
+            continue
+        if not _is_name(cat_data["name"]):
+            errors.append(
+                (
+                    index,
+                    f"Название категории #{index} должно быть непустой строкой "
+                    f"до {NAME_MAX_LENGTH} символов.",
+                )
+            )
+            continue
+        # ID из внешнего источника может быть строкой
+        try:
+            cat_id = int(cat_data["id"])
+        except (ValueError, TypeError):
+            errors.append(
+                (
+                    index,
+                    f'ID категории "{cat_data["name"]}" должно быть целым числом.',
+                )
+            )
+            continue
+        categories[cat_id] = cat_data["name"]
+    return categories, errors
+
+
+def _parse_categories(data):
+    categories, errors = _check_categories(data.get("categories", []))
+    if errors:
+        raise PriceListError(errors[0][1])
+    return categories
+
+
+def _check_good(good, index, categories, parse=True):
+    """
+    Проверяет строку прайса и приводит значения к типам модели.
+
+    Возвращает (строка, []) или (None, все ошибки строки); при
+    ``parse=False`` строка не собирается (только проверка).
+    """
+    if not isinstance(good, dict):
+        return None, [f"Товар #{index} должен быть объектом."]
+    if not good.keys() >= _GOOD_FIELDS_SET:
+        missing = [field for field in GOOD_FIELDS if field not in good]
+        return None, [f"В товаре #{index} нет поля {field!r}." for field in missing]
+    if not _is_name(good["name"]):
+        return None, [
+            f"Название товара #{index} должно быть непустой строкой "
+            f"до {NAME_MAX_LENGTH} символов."
+        ]
+    if not _is_external_id(good["id"]):
+        return None, [
+            f'ID товара "{good["name"]}" должен быть строкой или целым числом '
+            f"до {NAME_MAX_LENGTH} символов."
+        ]
+
+    errors = []
+    quantity, error = parse_quantity(good["quantity"])
+    if error:
+        errors.append(f'Количество товара "{good["name"]}" (ID: {good["id"]}) {error}.')
+    price, error = parse_price(good["price"])
+    if error:
+        errors.append(f'Цена товара "{good["name"]}" (ID: {good["id"]}) {error}.')
+
+    category = good["category"]
+    if not isinstance(category, Hashable) or category not in categories:
+        errors.append(f'Категория с ID {good["category"]} не найдена.')
+
+    parameters = good.get("parameters", {})
+    if not isinstance(parameters, dict):
+        errors.append(
+            f'Параметры товара "{good["name"]}" (ID: {good["id"]}) должны быть объектом.'
+        )
+    elif not all(_is_name(name) for name in parameters):
+        errors.append(
+            f'Названия параметров товара "{good["name"]}" (ID: {good["id"]}) '
+            f"должны быть непустыми строками до {NAME_MAX_LENGTH} символов."
+        )
+    if errors or not parse:
+        return None, errors
+
+    return {
+        "external_id": str(good["id"]),
+        "name": good["name"],
+        "category_id": good["category"],
+        "price": price,
+        "quantity": quantity,
+        "parameters": {name: str(value) for name, value in parameters.items()},
+    }, []
+
+
+def validate_price_list(categories_data, goods, max_errors=MAX_ERRORS):
+    """
+    Проверка прайс-листа без обращения к БД (dry run).
+
+    Проходит все строки и собирает все ошибки, а не только первую;
+    ``goods`` может быть итератором (см. core.jsonstream.iter_array).
+    В ответе — не больше ``max_errors`` ошибок и их общее число.
+    """
+    started = time.perf_counter()
+    categories, category_errors = _check_categories(categories_data)
+    errors = [
+        {"category": index, "error": message} for index, message in category_errors
+    ]
+    if not _is_array(goods):
+        errors.append({"field": "goods", "error": GOODS_NOT_ARRAY})
+        goods = ()
+    total = len(errors)
+    rows = 0
+    external_ids = set()
+    duplicates = 0
+    for index, good in enumerate(goods):
+        rows += 1
+        _, row_errors = _check_good(good, index, categories, parse=False)
+        if row_errors:
+            total += len(row_errors)
+            good_id = good.get("id") if isinstance(good, dict) else None
+            for message in row_errors[: max(max_errors - len(errors), 0)]:
+                errors.append({"row": index, "id": good_id, "error": message})
+            continue
+        external_id = str(good["id"])
+        if external_id in external_ids:
+            # Не ошибка: при загрузке побеждает последняя строка
+            duplicates += 1
+        else:
+            external_ids.add(external_id)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "valid": not total,
+        "rows": rows,
+        "categories": len(categories),
+        "duplicates": duplicates,
+        "errors_total": total,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed) if elapsed else rows,
+    }
+
+
+def content_hash(row):
+    """Отпечаток строки прайса: название, категория, цена, остаток, параметры."""
+    fingerprint = json.dumps(
+        [
+            row["name"],
+            row["category_id"],
+            str(row["price"]),
+            row["quantity"],
+            sorted(row["parameters"].items()),
+        ],
+        ensure_ascii=False,
+    )
+    return hashlib.md5(fingerprint.encode("utf-8")).hexdigest()
+
+
+class PriceListImporter:
+    """
+    Upsert товаров одного поставщика.
+
+    ``run()`` возвращает счётчики created/updated/unchanged, число строк и
+    скорость загрузки. Вызывается внутри транзакции: при PriceListError
+    всё загруженное откатывается.
+    """
+
+    def __init__(self, supplier, batch_size=BATCH_SIZE):
+        self.supplier = supplier
+        self.batch_size = batch_size
+        self.categories_created = False
+        self.product_ids = []
+        self.stats = {"created": 0, "updated": 0, "unchanged": 0}
+
+    def run(self, data, mark_missing=False):
+        """
+        ``mark_missing`` — прайс полный: товары поставщика, которых в нём
+        нет, помечаются как отсутствующие (остаток 0).
+        """
+        started = time.perf_counter()
+
+        categories = _parse_categories(data)
+        if not isinstance(data["goods"], list):
+            raise PriceListError(GOODS_NOT_ARRAY)
+        rows = self.prepare(data["goods"], categories)
+
+        self.save_categories(categories)
+        parameters = self.save_parameters(rows)
+        for start in range(0, len(rows), self.batch_size):
+            self.save_batch(rows[start : start + self.batch_size], parameters)
+        if mark_missing:
+            self.mark_missing([row["external_id"] for row in rows])
+
+        return self.result(len(rows), started)
+
+    def result(self, rows, started):
+        elapsed = time.perf_counter() - started
+        return dict(
+            self.stats,
+            rows=rows,
+            seconds=round(elapsed, 3),
+            rows_per_second=round(rows / elapsed) if elapsed else rows,
+        )
+
+    @staticmethod
+    def prepare(goods, categories, offset=0):
+        """Проверяет строки товаров; ``offset`` — номер первой строки в файле."""
+        rows = {}
+        for index, good in enumerate(goods, start=offset):
+            row, errors = _check_good(good, index, categories)
+            if errors:
+                raise PriceListError(errors[0])
+            row["content_hash"] = content_hash(row)
+            # Повтор одного external_id: как и раньше, побеждает последняя строка
+            rows[row["external_id"]] = row
+        return list(rows.values())
+
+    def save_categories(self, categories):
+        # Существующие категории не переименовываем
+        known = registry.categories.all()
+        missing = {
+            cat_id: name for cat_id, name in categories.items() if cat_id not in known
+        }
+        if not missing:
+            return
+        created = registry.resolve_categories(missing)
+        for cat_id, name in missing.items():
+            if cat_id not in created:
+                raise PriceListError(
+                    f'Категория "{name}" уже есть в каталоге с другим ID (не {cat_id}).'
+                )
+        self.categories_created = True
+
+    def save_parameters(self, rows):
+        names = {name for row in rows for name in row["parameters"]}
+        return registry.resolve_parameters(names)
+
+    def save_batch(self, rows, parameters):
+        supplier_products = Product.objects.filter(supplier=self.supplier)
+
+        # Сравниваем отпечатки, а не поля и параметры по отдельности
+        existing = {
+            external_id: (product_id, content_hash)
+            for external_id, product_id, content_hash in supplier_products.filter(
+                external_id__in=[row["external_id"] for row in rows]
+            ).values_list("external_id", "id", "content_hash")
+        }
+
+        changed = []
+        for row in rows:
+            current = existing.get(row["external_id"])
+            if current is None:
+                self.stats["created"] += 1
+            elif current[1] == row["content_hash"]:
+                self.stats["unchanged"] += 1
+                continue
+            else:
+                self.stats["updated"] += 1
+            changed.append(row)
+        if not changed:
+            return
+
+        Product.objects.bulk_create(
+            [
+                Product(
+                    supplier=self.supplier,
+                    external_id=row["external_id"],
+                    name=row["name"],
+                    category_id=row["category_id"],
+                    price=row["price"],
+                    quantity=row["quantity"],
+                    content_hash=row["content_hash"],
+                )
+                for row in changed
+            ],
+            update_conflicts=True,
+            unique_fields=["supplier", "external_id"],
+            update_fields=PRODUCT_UPDATE_FIELDS,
+        )
+        ids = {external_id: current[0] for external_id, current in existing.items()}
+        created = [
+            row["external_id"] for row in changed if row["external_id"] not in ids
+        ]
+        if created:
+            # id новых товаров: не все СУБД возвращают их из upsert
+            ids.update(
+                supplier_products.filter(external_id__in=created).values_list(
+                    "external_id", "id"
+                )
+            )
+
+        # Параметры, которых в строке больше нет, удаляются одним запросом:
+        # отпечаток строки считается по новому набору параметров
+        kept = Q()
+        for row in changed:
+            kept |= Q(
+                product_id=ids[row["external_id"]],
+                parameter_id__in=[parameters[name] for name in row["parameters"]],
+            )
+        updated = [
+            ids[row["external_id"]] for row in changed if row["external_id"] in existing
+        ]
+        if updated:
+            ProductParameter.objects.filter(product_id__in=updated).exclude(
+                kept
+            ).delete()
+
+        ProductParameter.objects.bulk_create(
+            [
+                ProductParameter(
+                    product_id=ids[row["external_id"]],
+                    parameter_id=parameters[name],
+                    value=value,
+                )
+                for row in changed
+                for name, value in row["parameters"].items()
+            ],
+            update_conflicts=True,
+            unique_fields=["product", "parameter"],
+            update_fields=["value"],
+        )
+        self.product_ids.extend(ids[row["external_id"]] for row in changed)
+
+    def mark_missing(self, external_ids):
+        """Обнуляет остаток товаров поставщика, которых нет в полном прайсе."""
+        missing = Product.objects.filter(
+            supplier=self.supplier, quantity__gt=0
+        ).exclude(external_id__in=external_ids)
+        product_ids = list(missing.values_list("id", flat=True))
+        if product_ids:
+            # Отпечаток сбрасываем: при возврате товара в прайс он запишется
+            missing.update(quantity=0, content_hash="", updated_at=timezone.now())
+            self.product_ids.extend(product_ids)
+        self.stats["out_of_stock"] = len(product_ids)
+
+
+def import_price_list(supplier, data, batch_size=BATCH_SIZE, mark_missing=False):
+    """
+    Загружает прайс-лист поставщика одной транзакцией.
+
+    Поддерживает счётчики фасетов и рассылает catalog_changed по
+    созданным и изменённым товарам.
+    """
+    importer = PriceListImporter(supplier, batch_size=batch_size)
+    with transaction.atomic():
+        _lock_supplier(supplier)
+        with track_facets(Product.objects.filter(supplier=supplier)):
+            result = importer.run(data, mark_missing=mark_missing)
+            if importer.categories_created:
+                catalog_changed.send(sender=Category)
+            if importer.product_ids:
+                catalog_changed.send(
+                    sender=Product,
+                    supplier_id=supplier.id,
+                    product_ids=importer.product_ids,
+                )
+    return result
+
+
+def _lock_supplier(supplier):
+    # Загрузки одного поставщика (например, параллельный import_products)
+    # идут по очереди, разные поставщики — одновременно. Блокировка берётся
+    # до снимка фасетов (track_facets), иначе параллельные загрузки
+    # посчитают одни и те же изменения дважды
+    Supplier.objects.select_for_update().filter(pk=supplier.pk).exists()
+
+
+def get_price_list_upload(supplier, checksum):
+    """Незавершённая загрузка того же файла или новая."""
+    upload, _ = PriceListUpload.objects.filter(
+        status__in=["in_progress", "failed"]
+    ).get_or_create(supplier=supplier, checksum=checksum)
+    return upload
+
+
+def import_price_list_file(
+    upload,
+    fileobj,
+    chunk_size=BATCH_SIZE,
+    on_chunk=None,
+    mark_missing=False,
+    read_size=READ_SIZE,
+    on_progress=None,
+):
+    """
+    Потоковая загрузка прайс-листа из файла (бинарный JSON на диске).
+
+    Товары читаются и записываются пачками по ``chunk_size``, каждая пачка —
+    отдельная транзакция вместе с отметкой прогресса в ``upload``
+    (см. get_price_list_upload). Незавершённая загрузка продолжается с первой
+    незафиксированной строки. ``on_chunk(upload)`` вызывается после каждой
+    пачки, ``on_progress(upload)`` — каждые PROGRESS_ROWS прочитанных строк,
+    в том числе пропускаемых при продолжении. ``mark_missing`` — как в
+    import_price_list, после всех пачек отдельным проходом по файлу;
+    ``read_size`` — блок чтения файла. Возвращает итоги загрузки.
+    """
+    started = time.perf_counter()
+    supplier = upload.supplier
+    upload.status = "in_progress"
+    resumed_from = upload.rows_done
+
+    importer = PriceListImporter(supplier, batch_size=chunk_size)
+    importer.stats = {
+        "created": upload.created_count,
+        "updated": upload.updated_count,
+        "unchanged": upload.unchanged_count,
+    }
+    try:
+        # Первый проход: категории (их немного), второй — товары
+        fileobj.seek(0)
+        categories = _parse_categories(
+            {"categories": list(iter_array(fileobj, "categories", read_size))}
+        )
+        with transaction.atomic():
+            importer.save_categories(categories)
+            if importer.categories_created:
+                catalog_changed.send(sender=Category)
+
+        fileobj.seek(0)
+        goods = _reporting(iter_array(fileobj, "goods", read_size), upload, on_progress)
+        # Уже зафиксированные строки пропускаем
+        for _ in islice(goods, upload.rows_done):
+            pass
+
+        while True:
+            chunk = list(islice(goods, chunk_size))
+            if not chunk:
+                break
+            rows = importer.prepare(chunk, categories, offset=upload.rows_done)
+            products = Product.objects.filter(
+                supplier=supplier,
+                external_id__in=[row["external_id"] for row in rows],
+            )
+            with transaction.atomic():
+                _lock_supplier(supplier)
+                with track_facets(products):
+                    importer.product_ids = []
+                    importer.save_batch(rows, importer.save_parameters(rows))
+                    if importer.product_ids:
+                        catalog_changed.send(
+                            sender=Product,
+                            supplier_id=supplier.id,
+                            product_ids=importer.product_ids,
+                        )
+                    upload.rows_done += len(chunk)
+                    upload.chunks_done += 1
+                    upload.created_count = importer.stats["created"]
+                    upload.updated_count = importer.stats["updated"]
+                    upload.unchanged_count = importer.stats["unchanged"]
+                    upload.save()
+            if on_chunk is not None:
+                on_chunk(upload)
+
+        if mark_missing:
+            fileobj.seek(0)
+            goods = _reporting(
+                iter_array(fileobj, "goods", read_size), upload, on_progress
+            )
+            external_ids = [str(good["id"]) for good in goods]
+            with transaction.atomic():
+                importer.product_ids = []
+                importer.mark_missing(external_ids)
+                if importer.product_ids:
+                    catalog_changed.send(
+                        sender=Product,
+                        supplier_id=supplier.id,
+                        product_ids=importer.product_ids,
+                    )
+    except ImportInterrupted:
+        # Загрузку продолжит другой владелец: её состояние не трогаем
+        raise
+    except JSONStreamError as error:
+        _mark_failed(upload, error)
+        raise PriceListError(str(error)) from error
+    except Exception as error:
+        # Прогресс зафиксированных пачек остаётся, упавшая откатилась
+        _mark_failed(upload, error)
+        raise
+
+    upload.status = "done"
+    upload.error = ""
+    upload.save(update_fields=["status", "error", "updated_at"])
+
+    result = importer.result(upload.rows_done - resumed_from, started)
+    result.update(resumed_from=resumed_from, chunks=upload.chunks_done)
+    return result
+
+
+def _reporting(goods, upload, on_progress):
+    if on_progress is None:
+        yield from goods
+        return
+    for count, good in enumerate(goods, start=1):
+        yield good
+        if not count % PROGRESS_ROWS:
+            on_progress(upload)
+
+
+def _mark_failed(upload, error):
+    upload.refresh_from_db()
+    upload.status = "failed"
+    upload.error = str(error)
+    upload.save(update_fields=["status", "error", "updated_at"])
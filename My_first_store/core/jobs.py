@@ -0,0 +1,255 @@
+# Фоновые загрузки прайс-листов без внешнего брокера.
+#
+# Загрузка сохраняет тело запроса в файл и ставит ImportJob в очередь.
+# Воркеры (manage.py run_import_worker) забирают задания из таблицы:
+# задание берётся, только если у его поставщика нет более раннего
+# незавершённого задания, поэтому разные поставщики обрабатываются
+# параллельно, а задания одного поставщика — по порядку. Захват —
+# условный UPDATE status='queued' → 'running', двух владельцев у задания
+# не бывает. Задание упавшего воркера возвращается в очередь; все записи
+# воркера в задание условны (worker=<он сам>), поэтому воркер, у которого
+# задание забрали, останавливается и ничего не портит. Отметку «жив»
+# отдельный поток ставит по таймеру (IMPORT_JOB_STALE_SECONDS / 4), так что
+# долгий пропуск строк при продолжении или медленная пачка не отдают
+# задание другому воркеру; проверка — после каждой пачки и каждые
+# PROGRESS_ROWS строк.
+
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .importer import (
+    ImportInterrupted,
+    PriceListError,
+    get_price_list_upload,
+    import_price_list_file,
+)
+from .models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+SPOOL_BLOCK_SIZE = 1024 * 1024
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobLost(ImportInterrupted):
+    """Задание вернули в очередь и, возможно, отдали другому воркеру."""
+
+
+def enqueue_price_list(supplier, stream, mark_missing=False):
+    """
+    Сохраняет прайс-лист из потока на диск и ставит задание в очередь;
+    ``mark_missing`` — как в import_price_list_file.
+    """
+    os.makedirs(settings.IMPORT_JOBS_DIR, exist_ok=True)
+    path = os.path.join(settings.IMPORT_JOBS_DIR, f"{uuid.uuid4().hex}.json")
+    checksum = hashlib.sha256()
+    with open(path, "wb") as spool:
+        for block in iter(lambda: stream.read(SPOOL_BLOCK_SIZE), b""):
+            checksum.update(block)
+            spool.write(block)
+    return ImportJob.objects.create(
+        supplier=supplier,
+        path=path,
+        checksum=checksum.hexdigest(),
+        mark_missing=mark_missing,
+    )
+
+
+def requeue_stale_jobs():
+    """Возвращает в очередь задания упавших воркеров (без отметки «жив»)."""
+    deadline = timezone.now() - timedelta(seconds=settings.IMPORT_JOB_STALE_SECONDS)
+    return ImportJob.objects.filter(status="running", heartbeat_at__lt=deadline).update(
+        status="queued", worker=""
+    )
+
+
+def claim_job(worker):
+    """Забирает следующее доступное задание или возвращает None."""
+    earlier = ImportJob.objects.filter(
+        supplier=OuterRef("supplier"),
+        id__lt=OuterRef("id"),
+        status__in=ACTIVE_STATUSES,
+    )
+    candidates = (
+        ImportJob.objects.filter(status="queued")
+        .exclude(Exists(earlier))
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+    while True:
+        job_id = candidates.first()
+        if job_id is None:
+            return None
+        now = timezone.now()
+        claimed = ImportJob.objects.filter(id=job_id, status="queued").update(
+            status="running", worker=worker, started_at=now, heartbeat_at=now
+        )
+        if claimed:
+            return ImportJob.objects.select_related("supplier").get(id=job_id)
+        # Задание перехватил другой воркер — берём следующее
+
+
+def _update_owned(job, **fields):
+    """Записывает поля задания, только пока им владеет job.worker."""
+    return ImportJob.objects.filter(
+        id=job.id, status="running", worker=job.worker
+    ).update(**fields)
+
+
+class _Heartbeat(threading.Thread):
+    """Отметка «жив» по таймеру, пока выполняется задание."""
+
+    def __init__(self, job):
+        super().__init__(daemon=True)
+        self.job = job
+        self.interval = settings.IMPORT_JOB_STALE_SECONDS / 4
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                if not _update_owned(self.job, heartbeat_at=timezone.now()):
+                    self.lost.set()
+                    return
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_job(job):
+    """
+    Выполняет задание, захваченное claim_job; ошибки записываются в
+    задание, а не пробрасываются. Если задание забрали, результат не
+    записывается, а файл остаётся новому владельцу.
+    """
+    upload = get_price_list_upload(job.supplier, job.checksum)
+    job.upload = upload
+    job.result = {"resumed_from": upload.rows_done}
+    if not _update_owned(job, upload=upload, result=job.result):
+        logger.warning("Задание #%s уже выполняет другой воркер", job.id)
+        return job
+
+    beat = _Heartbeat(job)
+
+    def check(upload):
+        if beat.lost.is_set():
+            raise JobLost(f"Задание #{job.id} передано другому воркеру")
+
+    def heartbeat(upload):
+        check(upload)
+        if not _update_owned(job, heartbeat_at=timezone.now()):
+            raise JobLost(f"Задание #{job.id} передано другому воркеру")
+
+    remove = True
+    beat.start()
+    try:
+        with open(job.path, "rb") as fileobj:
+            job.result = import_price_list_file(
+                upload,
+                fileobj,
+                chunk_size=settings.PRICE_LIST_CHUNK_SIZE,
+                on_chunk=heartbeat,
+                on_progress=check,
+                mark_missing=job.mark_missing,
+            )
+    except JobLost as error:
+        logger.warning("%s, загрузка остановлена", error)
+        return job
+    except PriceListError as error:
+        # Ошибка в данных: повтор того же файла не поможет
+        job.status, job.error = "failed", str(error)
+    except Exception as error:
+        # Сбой среды: файл остаётся, задание можно вернуть в очередь
+        job.status, job.error = "failed", f"{type(error).__name__}: {error}"
+        remove = False
+    else:
+        job.status, job.error = "done", ""
+    finally:
+        beat.stop()
+    job.finished_at = timezone.now()
+    finished = _update_owned(
+        job,
+        status=job.status,
+        error=job.error,
+        result=job.result,
+        finished_at=job.finished_at,
+    )
+    if not finished:
+        logger.warning("Задание #%s передано другому воркеру", job.id)
+        return job
+    if remove:
+        _remove(job.path)
+    return job
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def job_progress(job):
+    """Состояние задания для API."""
+    upload = job.upload
+    rows_done = upload.rows_done if upload else 0
+    progress = {
+        "id": job.id,
+        "status": job.status,
+        "rows_done": rows_done,
+        "created": upload.created_count if upload else 0,
+        "updated": upload.updated_count if upload else 0,
+        "unchanged": upload.unchanged_count if upload else 0,
+        "rows_per_second": job.result.get("rows_per_second"),
+        "error": job.error or None,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+    if job.status == "running" and job.started_at:
+        # Скорость по ходу загрузки — по строкам, записанным этим запуском
+        elapsed = (timezone.now() - job.started_at).total_seconds()
+        resumed_from = job.result.get("resumed_from", 0)
+        if elapsed > 0:
+            progress["rows_per_second"] = round((rows_done - resumed_from) / elapsed)
+    return progress
+
+
+def process_jobs(worker, stop=None, poll_interval=None, once=False):
+    """
+    Цикл воркера: забирает и выполняет задания.
+
+    ``once`` — выйти, когда очередь опустеет; ``stop`` — threading.Event
+    для остановки (проверяется между заданиями).
+    """
+    if stop is None:
+        stop = threading.Event()
+    if poll_interval is None:
+        poll_interval = settings.IMPORT_POLL_INTERVAL
+    processed = 0
+    while not stop.is_set():
+        requeue_stale_jobs()
+        job = claim_job(worker)
+        if job is None:
+            # Очередь может быть непуста, но занята заданиями других потоков
+            if once and not ImportJob.objects.filter(status="queued").exists():
+                break
+            stop.wait(poll_interval)
+            continue
+        run_job(job)
+        processed += 1
+    return processed
@@ -0,0 +1,167 @@
+# Потоковое чтение больших JSON-документов.
+#
+# Прайс-лист — объект {"categories": [...], "goods": [...]} размером в сотни
+# мегабайт. iter_array() проходит файл один раз, пропускает ненужные ключи
+# без разбора и отдаёт элементы нужного массива по одному. В памяти —
+# только буфер чтения и текущий элемент.
+
+import codecs
+import json
+import re
+
+READ_SIZE = 64 * 1024
+
+# Наибольшее значение (элемент массива, строка), которое держится в буфере
+# целиком. Незаконченное значение длиннее — ошибка: иначе одно битое
+# значение заставило бы дочитать в память весь остаток файла
+MAX_VALUE_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_STRUCTURE = re.compile(r'["\[\]{}]')
+# Остаток строки после открывающей кавычки
+_STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+
+# Символы, которыми может продолжаться число: после числа в корректном
+# JSON идут только пробелы, ",", "]" или "}"
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+_decoder = json.JSONDecoder()
+
+
+class JSONStreamError(ValueError):
+    """Документ не является корректным JSON ожидаемой структуры."""
+
+
+class _Reader:
+    def __init__(self, fileobj, read_size, max_value_size=MAX_VALUE_SIZE):
+        self.file = fileobj
+        self.read_size = read_size
+        self.max_value_size = max_value_size
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Дочитывает следующий блок; False — файл закончился."""
+        if self.eof:
+            return False
+        data = self.file.read(self.read_size)
+        # Прочитанное уже не нужно — буфер не растёт
+        self.buffer = self.buffer[self.pos :]
+        self.pos = 0
+        if not data:
+            self.eof = True
+            self.buffer += self.decoder.decode(b"", final=True)
+            return False
+        self.buffer += self.decoder.decode(data)
+        return True
+
+    def fill_value(self):
+        """fill() для значения, которое начинается с self.pos."""
+        if len(self.buffer) - self.pos > self.max_value_size:
+            raise JSONStreamError(
+                f"Некорректный JSON или значение длиннее "
+                f"{self.max_value_size} символов"
+            )
+        return self.fill()
+
+    def peek(self):
+        """Следующий значимый символ ("" в конце файла)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise JSONStreamError(
+                f"Ожидался символ {char!r}, получено {found or 'конец файла'!r}"
+            )
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as error:
+                if self.fill_value():
+                    continue
+                raise JSONStreamError(f"Некорректный JSON: {error.msg}")
+            # Число на границе буфера могло оборваться ("12." из "12.75")
+            if (
+                isinstance(value, (int, float))
+                and (end == len(self.buffer) or self.buffer[end] in _NUMBER_CHARS)
+                and self.fill_value()
+            ):
+                continue
+            self.pos = end
+            return value
+
+    def skip(self):
+        """Пропускает значение, не разбирая его."""
+        if self.peek() not in ("[", "{"):
+            self.value()
+            return
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                if not self.fill():
+                    raise JSONStreamError("Неожиданный конец файла")
+                continue
+            self.pos = match.end()
+            char = match.group()
+            if char == '"':
+                self.skip_string()
+            elif char in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if not depth:
+                    return
+
+    def skip_string(self):
+        while True:
+            match = _STRING_TAIL.match(self.buffer, self.pos)
+            if match is not None:
+                self.pos = match.end()
+                return
+            if not self.fill_value():
+                raise JSONStreamError("Неожиданный конец файла в строке")
+
+
+def iter_array(fileobj, key, read_size=READ_SIZE, max_value_size=MAX_VALUE_SIZE):
+    """
+    Элементы массива ``key`` из JSON-объекта верхнего уровня.
+
+    ``fileobj`` — бинарный файл в UTF-8. Если ключа нет, ничего не отдаёт.
+    Значения длиннее ``max_value_size`` символов не принимаются.
+    """
+    reader = _Reader(fileobj, read_size, max_value_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        name = reader.value()
+        reader.expect(":")
+        if name == key:
+            reader.expect("[")
+            if reader.peek() == "]":
+                return
+            while True:
+                yield reader.value()
+                if reader.peek() != ",":
+                    reader.expect("]")
+                    return
+                reader.pos += 1
+        reader.skip()
+        if reader.peek() != ",":
+            reader.expect("}")
+            return
+        reader.pos += 1
@@ -0,0 +1,110 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.models import (
+    Basket,
+    BasketItem,
+    Category,
+    DeliveryAddress,
+    Product,
+    Supplier,
+    User,
+)
+from orders.views import order_create_view
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет оформление заказа (orders.views.order_create_view) из "
+        "корзин разного размера; данные удаляются после замера"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lines",
+            default="10,100,1000",
+            help="Размеры корзины через запятую",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=3, help="Повторов замера (берётся лучший)"
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["lines"].split(",")]
+        # Письма с кодом подтверждения никуда не отправляются
+        with override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"
+        ), transaction.atomic():
+            user, address = self.create_data(max(sizes))
+            for size in sizes:
+                self.fill_basket(user, size)
+                elapsed, queries = self.measure(user, address, options["repeat"])
+                self.stdout.write(
+                    f"Позиций {size}: {elapsed * 1000:.1f} мс, запросов {queries}"
+                )
+            # Синтетические данные не сохраняем
+            transaction.set_rollback(True)
+
+    def measure(self, user, address, repeat):
+        factory = APIRequestFactory()
+        best, queries = None, None
+        for _ in range(repeat):
+            request = factory.post(
+                "/api/orders/create/",
+                {"delivery_address_id": address.id},
+                format="json",
+            )
+            force_authenticate(request, user=user)
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = order_create_view(request)
+                elapsed = time.perf_counter() - started
+            if response.status_code != 201:
+                raise RuntimeError(f"Заказ не создан: {response.data}")
+            best = elapsed if best is None else min(best, elapsed)
+            queries = len(captured)
+        return best, queries
+
+    def create_data(self, rows):
+        user = User.objects.create_user(
+            username="benchmark_orders",
+            email="benchmark_orders@example.com",
+            user_type="supplier",
+        )
+        supplier = Supplier.objects.create(user=user, name="Бенчмарк")
+        category = Category.objects.create(name="Бенчмарк заказов")
+        Product.objects.bulk_create(
+            [
+                Product(
+                    supplier=supplier,
+                    category=category,
+                    name=f"Товар {n}",
+                    price=n % 1000 + 0.99,
+                    quantity=100,
+                    external_id=f"bench-order-{n}",
+                )
+                for n in range(rows)
+            ],
+            batch_size=1000,
+        )
+        Basket.objects.create(user=user)
+        address = DeliveryAddress.objects.create(
+            user=user, city="Москва", street="Тверская", house="1"
+        )
+        return user, address
+
+    def fill_basket(self, user, size):
+        basket = user.basket
+        basket.items.all().delete()
+        products = Product.objects.filter(supplier__user=user).order_by("id")[:size]
+        BasketItem.objects.bulk_create(
+            [
+                BasketItem(basket=basket, product=product, quantity=1)
+                for product in products
+            ],
+            batch_size=1000,
+        )
@@ -0,0 +1,136 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from core import fast_serializers
+from core.models import (
+    Category,
+    DeliveryAddress,
+    Order,
+    OrderItem,
+    Parameter,
+    Product,
+    ProductParameter,
+    Supplier,
+    User,
+)
+from core.querysets import orders_for_serializer, products_for_serializer
+from core.serializers import OrderSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает ModelSerializer и быстрый путь (core.fast_serializers) "
+        "на синтетических данных; данные удаляются после замера"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", type=int, default=10000, help="Число товаров и позиций заказов"
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=3, help="Повторов замера (берётся лучший)"
+        )
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        with transaction.atomic():
+            self.create_data(rows)
+            cases = [
+                (
+                    "Товары",
+                    lambda: ProductSerializer(
+                        products_for_serializer(), many=True
+                    ).data,
+                    lambda: fast_serializers.serialize_products(
+                        fast_serializers.product_rows(products_for_serializer())
+                    ),
+                ),
+                (
+                    "Заказы",
+                    lambda: OrderSerializer(
+                        orders_for_serializer(Order.objects.all()), many=True
+                    ).data,
+                    lambda: fast_serializers.serialize_orders(
+                        fast_serializers.order_rows(Order.objects.all())
+                    ),
+                ),
+            ]
+            for name, slow, fast in cases:
+                slow_time, slow_data = self.measure(slow, repeat)
+                fast_time, fast_data = self.measure(fast, repeat)
+                same = JSONRenderer().render(slow_data) == JSONRenderer().render(
+                    fast_data
+                )
+                self.stdout.write(
+                    f"{name} ({len(slow_data)}): ModelSerializer {slow_time:.3f} с, "
+                    f"быстрый путь {fast_time:.3f} с, "
+                    f"ускорение x{slow_time / fast_time:.1f}, "
+                    f"ответ совпадает: {'да' if same else 'НЕТ'}"
+                )
+            # Синтетические данные не сохраняем
+            transaction.set_rollback(True)
+
+    def measure(self, serialize, repeat):
+        best, data = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = serialize()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, data
+
+    def create_data(self, rows):
+        user = User.objects.create_user(
+            username="benchmark_serializers",
+            email="benchmark_serializers@example.com",
+            user_type="supplier",
+        )
+        supplier = Supplier.objects.create(user=user, name="Бенчмарк")
+        category = Category.objects.create(name="Бенчмарк сериализации")
+        parameters = [
+            Parameter.objects.get_or_create(name=name)[0] for name in ("Цвет", "Вес")
+        ]
+
+        Product.objects.bulk_create(
+            [
+                Product(
+                    supplier=supplier,
+                    category=category,
+                    name=f"Товар {n}",
+                    price=n % 1000 + 0.99,
+                    quantity=n % 50,
+                    external_id=f"bench-{n}",
+                )
+                for n in range(rows)
+            ],
+            batch_size=1000,
+        )
+        products = list(Product.objects.filter(supplier=supplier).only("id"))
+        ProductParameter.objects.bulk_create(
+            [
+                ProductParameter(
+                    product=product, parameter=parameter, value=str(product.id % 7)
+                )
+                for product in products
+                for parameter in parameters
+            ],
+            batch_size=1000,
+        )
+
+        # Заказы по 10 позиций: всего rows позиций
+        address = DeliveryAddress.objects.create(
+            user=user, city="Москва", street="Тверская", house="1"
+        )
+        orders = Order.objects.bulk_create(
+            [Order(user=user, address=address) for _ in range(max(rows // 10, 1))]
+        )
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(order=orders[n // 10], product=product, quantity=1)
+                for n, product in enumerate(products[: len(orders) * 10])
+            ],
+            batch_size=1000,
+        )
@@ -1,99 +1,203 @@
 # myapp/management/commands/import_products.py
 
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from core.models import Category, Supplier, Product, Parameter, ProductParameter
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from core.models import Supplier
+from core.importer import BATCH_SIZE, PriceListError, import_price_list
 
 # from models import User
 from django.contrib.auth import get_user_model
 
-from data_json import data
+try:
+    import yaml
+except ImportError:  # YAML-прайсы — только при установленном PyYAML
+    yaml = None
+
+_YAML_ERRORS = (yaml.YAMLError,) if yaml is not None else ()
 
 User = get_user_model()
 
 
+def load_price_list(path):
+    """
+    Читает прайс-лист: .json, .yaml/.yml или .ndjson/.jsonl.
+
+    В NDJSON первая строка — заголовок {"shop": ..., "categories": [...]},
+    остальные — по товару на строку.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8") as file:
+        if extension in (".yaml", ".yml"):
+            if yaml is None:
+                raise CommandError("Для YAML-прайсов установите PyYAML")
+            return yaml.safe_load(file)
+        if extension in (".ndjson", ".jsonl"):
+            lines = (line for line in file if line.strip())
+            data = json.loads(next(lines, "{}"))
+            data["goods"] = [json.loads(line) for line in lines]
+            return data
+        return json.load(file)
+
+
+def get_or_create_supplier(shop_name):
+    # Найдём или создадим **пользователя** с типом 'supplier'
+    supplier_user, created = User.objects.get_or_create(
+        username=shop_name,
+        defaults={
+            "email": f"{shop_name.lower()}@example.com",  # или другой email
+            "user_type": "supplier",
+            "is_active": True,
+        },
+    )
+    if created:
+        # Устанавливаем пароль по умолчанию или генерируем
+        supplier_user.set_password(
+            "default_password"
+        )  # или используйте что-то более безопасное
+        supplier_user.save()
+
+    # Найдём или создадим поставщика, привязанного к этому пользователю
+    supplier, created = Supplier.objects.get_or_create(
+        name=shop_name,
+        defaults={
+            "user": supplier_user,  # <-- ВАЖНО: передаём user
+            "accepts_orders": True,
+        },
+    )
+    return supplier, created
+
+
+def import_data(data, source, batch_size, full):
+    """Импорт одного прайс-листа с подсчётом запросов к БД."""
+    queries = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    if not isinstance(data, dict) or not isinstance(data.get("shop"), str):
+        raise CommandError(f'{source}: нет поля "shop" с названием магазина')
+    with connection.execute_wrapper(count_queries):
+        supplier, supplier_created = get_or_create_supplier(data["shop"])
+        # Пакетный upsert core.importer: неизменённые товары не перезаписываются
+        try:
+            result = import_price_list(
+                supplier, data, batch_size=batch_size, mark_missing=full
+            )
+        except PriceListError as error:
+            raise CommandError(f"{source}: {error}")
+    return dict(
+        result,
+        source=source,
+        shop=supplier.name,
+        supplier_created=supplier_created,
+        queries=queries,
+    )
+
+
+def import_file(path, batch_size, full):
+    """Импорт одного файла (выполняется в отдельном процессе пула)."""
+    try:
+        data = load_price_list(path)
+    except (OSError, ValueError, TypeError, *_YAML_ERRORS) as error:
+        # Нет файла, битый JSON/YAML — ошибка этого файла, а не всей команды
+        raise CommandError(f"{path}: не удалось прочитать прайс-лист: {error}")
+    return import_data(data, path, batch_size, full)
+
+
 class Command(BaseCommand):
-    help = "Импортирует товары из data_json.py в базу данных"
+    help = (
+        "Импортирует прайс-листы (JSON, YAML, NDJSON) в базу данных; "
+        "файлы разных поставщиков обрабатываются параллельно"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "files",
+            nargs="*",
+            help="Файлы прайс-листов; без аргументов — data_json.py",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=BATCH_SIZE,
+            help="Товаров в одном пакетном upsert",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Число процессов (по умолчанию — по файлу на ядро)",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Прайс полный: товары поставщика, которых в нём нет, — нет в наличии",
+        )
 
     def handle(self, *args, **options):
-        shop_name = data["shop"]
-
-        # Найдём или создадим **пользователя** с типом 'supplier'
-        supplier_user, created = User.objects.get_or_create(
-            username=shop_name,
-            defaults={
-                "email": f"{shop_name.lower()}@example.com",  # или другой email
-                "user_type": "supplier",
-                "is_active": True,
-            },
-        )
-        if created:
-            # Устанавливаем пароль по умолчанию или генерируем
-            supplier_user.set_password(
-                "default_password"
-            )  # или используйте что-то более безопасное
-            supplier_user.save()
+        files = options["files"]
+        batch_size, full = options["batch_size"], options["full"]
+        workers = options["workers"] or min(len(files), os.cpu_count() or 1) or 1
+
+        started = time.perf_counter()
+        results, errors = [], []
+
+        def collect(run):
+            # Ошибка в одном файле не отменяет итоги по остальным
+            try:
+                results.append(run())
+            except CommandError as error:
+                errors.append(str(error))
+
+        if not files:
+            # Прежний источник по умолчанию — модуль data_json.py
+            from data_json import data
+
+            collect(lambda: import_data(data, "data_json.py", batch_size, full))
+        elif workers == 1 or len(files) == 1:
+            for path in files:
+                collect(lambda: import_file(path, batch_size, full))
+        else:
+            # Дочерние процессы открывают свои соединения с БД
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(import_file, path, batch_size, full) for path in files
+                ]
+                for future in as_completed(futures):
+                    collect(future.result)
+        elapsed = time.perf_counter() - started
+
+        for result in results:
             self.stdout.write(
-                f"Создан пользователь поставщика: {supplier_user.username}"
+                f"{result['source']} ({result['shop']}"
+                f"{', новый поставщик' if result['supplier_created'] else ''}): "
+                f"строк {result['rows']}, создано {result['created']}, "
+                f"обновлено {result['updated']}, без изменений {result['unchanged']}"
+                + (f", нет в наличии {result['out_of_stock']}" if full else "")
+                + f", {result['rows_per_second']} строк/с, "
+                f"запросов {result['queries']}"
             )
-
-        # Найдём или создадим поставщика, привязанного к этому пользователю
-        supplier, created = Supplier.objects.get_or_create(
-            name=shop_name,
-            defaults={
-                "user": supplier_user,  # <-- ВАЖНО: передаём user
-                "accepts_orders": True,
-            },
+        for error in errors:
+            self.stderr.write(error)
+
+        rows = sum(result["rows"] for result in results)
+        summary = (
+            f"Файлов: {len(results)}, строк: {rows}, "
+            f"{round(rows / elapsed) if elapsed else rows} строк/с, "
+            f"запросов: {sum(result['queries'] for result in results)}, "
+            f"время: {elapsed:.2f} с"
         )
-        if created:
-            self.stdout.write(f"Создан поставщик: {supplier.name}")
-
-        # Создаём категории
-        category_map = {}
-        for cat_data in data["categories"]:
-            cat, _ = Category.objects.get_or_create(
-                id=cat_data["id"], defaults={"name": cat_data["name"]}
-            )
-            category_map[cat_data["id"]] = cat
-
-        # Создаём параметры
-        parameter_map = {}
-        for good in data["goods"]:
-            for param_name in good["parameters"]:
-                param, _ = Parameter.objects.get_or_create(name=param_name)
-                parameter_map[param_name] = param
-
-        # Создаём товары и их параметры
-        for good in data["goods"]:
-            category = category_map[good["category"]]
-
-            product, created = Product.objects.get_or_create(
-                external_id=good["id"],
-                supplier=supplier,
-                defaults={
-                    "name": good["name"],
-                    "category": category,
-                    "price": good["price"],
-                    "quantity": good["quantity"],
-                },
+        if errors:
+            raise CommandError(
+                f"Импорт завершён с ошибками (файлов с ошибками: {len(errors)}). "
+                f"Загружено — {summary}"
             )
-
-            if created:
-                self.stdout.write(f"Создан товар: {product.name}")
-            else:
-                # Если товар уже был, можно обновить поля, например, цену и количество
-                product.price = good["price"]
-                product.quantity = good["quantity"]
-                product.save()
-                self.stdout.write(f"Обновлён товар: {product.name}")
-
-            # Создаём ProductParameter
-            for param_name, param_value in good["parameters"].items():
-                param = parameter_map[param_name]
-                ProductParameter.objects.get_or_create(
-                    product=product,
-                    parameter=param,
-                    defaults={"value": str(param_value)},
-                )
-
-        self.stdout.write(self.style.SUCCESS("Импорт успешно завершён!"))
+        self.stdout.write(self.style.SUCCESS(f"Импорт успешно завершён! {summary}"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from core.facets import rebuild_facets
+from core.models import ProductFacetCount
+
+
+class Command(BaseCommand):
+    help = "Полностью пересчитывает счётчики фасетов каталога"
+
+    def handle(self, *args, **options):
+        rebuild_facets()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Счётчики фасетов пересчитаны: {ProductFacetCount.objects.count()}"
+            )
+        )
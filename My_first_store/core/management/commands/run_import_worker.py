@@ -0,0 +1,62 @@
+import os
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.jobs import process_jobs
+
+
+class Command(BaseCommand):
+    help = "Выполняет фоновые загрузки прайс-листов из очереди ImportJob"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.IMPORT_WORKERS,
+            help="Число параллельных потоков",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Завершиться, когда очередь опустеет",
+        )
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        processed = []
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+        def work(n):
+            try:
+                processed.append(
+                    process_jobs(f"{prefix}:{n}", stop=stop, once=options["once"])
+                )
+            finally:
+                # У каждого потока своё соединение с БД
+                connection.close()
+
+        threads = [
+            threading.Thread(target=work, args=(n,), daemon=True)
+            for n in range(options["workers"])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Воркер загрузок запущен, потоков: {len(threads)}")
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            # Начатые задания дорабатываются, новые не берутся
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Воркер остановлен, выполнено заданий: {sum(processed)}"
+            )
+        )
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_facet_counts(apps, schema_editor):
+    ProductParameter = apps.get_model("core", "ProductParameter")
+    ProductFacetCount = apps.get_model("core", "ProductFacetCount")
+    rows = (
+        ProductParameter.objects.values_list(
+            "product__category_id", "parameter_id", "value"
+        )
+        .annotate(n=Count("id"))
+        .order_by()
+    )
+    ProductFacetCount.objects.bulk_create(
+        (
+            ProductFacetCount(
+                category_id=cat_id, parameter_id=param_id, value=value, count=n
+            )
+            for cat_id, param_id, value, n in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_product_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductFacetCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("value", models.TextField()),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Счётчик фасета",
+                "verbose_name_plural": "Счётчики фасетов",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "price"], name="product_category_price_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="productparameter",
+            index=models.Index(
+                fields=["parameter", "value"], name="productparam_param_value_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="productfacetcount",
+            name="category",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="facet_counts",
+                to="core.category",
+            ),
+        ),
+        migrations.AddField(
+            model_name="productfacetcount",
+            name="parameter",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="facet_counts",
+                to="core.parameter",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="productfacetcount",
+            unique_together={("category", "parameter", "value")},
+        ),
+        migrations.RunPython(fill_facet_counts, migrations.RunPython.noop),
+    ]
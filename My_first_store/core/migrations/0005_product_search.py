@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:51
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# GIN-индекс и FTS5-таблица зависят от СУБД, поэтому создаются вручную
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX product_search_vector_gin "
+            "ON core_product USING gin (search_vector)"
+        )
+        schema_editor.execute("""
+            UPDATE core_product AS p SET search_vector =
+                setweight(to_tsvector('russian', coalesce(p.name, '')), 'A')
+                || setweight(to_tsvector('russian', coalesce(c.name, '')), 'B')
+                || setweight(to_tsvector('russian', coalesce((
+                    SELECT string_agg(pp.value, ' ') FROM core_productparameter AS pp
+                    WHERE pp.product_id = p.id
+                ), '')), 'C')
+            FROM core_category AS c
+            WHERE c.id = p.category_id
+            """)
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE core_product_fts USING fts5("
+            "name, category, parameters, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute("""
+            INSERT INTO core_product_fts (rowid, name, category, parameters)
+            SELECT p.id, p.name, c.name, coalesce((
+                SELECT group_concat(pp.value, ' ') FROM core_productparameter AS pp
+                WHERE pp.product_id = p.id
+            ), '')
+            FROM core_product AS p JOIN core_category AS c ON c.id = p.category_id
+            """)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS product_search_vector_gin")
+    elif vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS core_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_product_facets"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_catalog_versions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceListUpload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("checksum", models.CharField(max_length=64)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("in_progress", "Загружается"),
+                            ("done", "Завершена"),
+                            ("failed", "Ошибка"),
+                        ],
+                        default="in_progress",
+                        max_length=20,
+                    ),
+                ),
+                ("rows_done", models.PositiveIntegerField(default=0)),
+                ("chunks_done", models.PositiveIntegerField(default=0)),
+                ("created_count", models.PositiveIntegerField(default=0)),
+                ("updated_count", models.PositiveIntegerField(default=0)),
+                ("unchanged_count", models.PositiveIntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "supplier",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="price_uploads",
+                        to="core.supplier",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Загрузка прайс-листа",
+                "verbose_name_plural": "Загрузки прайс-листов",
+                "indexes": [
+                    models.Index(
+                        fields=["supplier", "checksum"],
+                        name="pricelistupload_checksum_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:46
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_idempotency_keys"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeletedProduct",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("product_id", models.BigIntegerField(unique=True)),
+                (
+                    "external_id",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("supplier_id", models.BigIntegerField(db_index=True)),
+                ("category_id", models.BigIntegerField()),
+                (
+                    "catalog_version",
+                    models.PositiveBigIntegerField(db_index=True, default=0),
+                ),
+                ("deleted_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "verbose_name": "Удалённый товар",
+                "verbose_name_plural": "Удалённые товары",
+            },
+        ),
+    ]
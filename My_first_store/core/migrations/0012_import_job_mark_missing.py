@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_deleted_products"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="importjob",
+            name="mark_missing",
+            field=models.BooleanField(default=False),
+        ),
+    ]
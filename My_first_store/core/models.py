@@ -4,6 +4,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.postgres.search import SearchVectorField
 
 # Типы пользователей
 USER_TYPE_CHOICES = (
@@ -20,6 +22,24 @@ ORDER_STATUS_CHOICES = (
     ("canceled", "Отменён"),
 )
 
+UPLOAD_STATUS_CHOICES = (
+    ("in_progress", "Загружается"),
+    ("done", "Завершена"),
+    ("failed", "Ошибка"),
+)
+
+IDEMPOTENCY_STATUS_CHOICES = (
+    ("in_progress", "Выполняется"),
+    ("done", "Выполнен"),
+)
+
+JOB_STATUS_CHOICES = (
+    ("queued", "В очереди"),
+    ("running", "Выполняется"),
+    ("done", "Завершена"),
+    ("failed", "Ошибка"),
+)
+
 
 class User(AbstractUser):
     user_type = models.CharField(
@@ -68,14 +88,75 @@ class Product(models.Model):
     external_id = models.CharField(
         max_length=255, blank=True, null=True, help_text="ID из прайса поставщика"
     )
+    # Поисковый документ (PostgreSQL); обновляется core.search
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Версия каталога, в которой товар менялся последний раз (core.versions)
+    catalog_version = models.PositiveBigIntegerField(default=0, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Отпечаток строки прайса (core.importer.content_hash); пусто — неизвестен,
+    # товар менялся не через загрузку прайса
+    content_hash = models.CharField(max_length=32, blank=True, editable=False)
 
     class Meta:
         unique_together = ("supplier", "external_id")  # чтобы не дублировать импорт
+        indexes = [
+            # для курсорной пагинации по цене и названию
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            models.Index(fields=["name", "id"], name="product_name_id_idx"),
+            # для фильтрации каталога по категории и диапазону цен
+            models.Index(
+                fields=["category", "price"], name="product_category_price_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.supplier.name})"
 
 
+class CatalogVersion(models.Model):
+    """
+    Счётчик изменений каталога.
+
+    scope: "global" — любое изменение, "supplier:<id>" — товары поставщика,
+    "categories" и "parameters" — справочники категорий и параметров.
+    """
+
+    scope = models.CharField(max_length=64, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Версия каталога"
+        verbose_name_plural = "Версии каталога"
+
+    def __str__(self):
+        return f"{self.scope}: {self.version}"
+
+
+class DeletedProduct(models.Model):
+    """
+    Удалённый товар — для выгрузки изменений (?since=).
+
+    Ссылки хранятся числами: поставщик или категория могут быть удалены
+    вместе с товаром.
+    """
+
+    product_id = models.BigIntegerField(unique=True)
+    external_id = models.CharField(max_length=255, blank=True, null=True)
+    supplier_id = models.BigIntegerField(db_index=True)
+    category_id = models.BigIntegerField()
+    # Версия каталога, в которой товар удалён (core.versions)
+    catalog_version = models.PositiveBigIntegerField(default=0, db_index=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Удалённый товар"
+        verbose_name_plural = "Удалённые товары"
+
+    def __str__(self):
+        return str(self.product_id)
+
+
 class Parameter(models.Model):
     name = models.CharField(max_length=255, unique=True)
 
@@ -92,11 +173,123 @@ class ProductParameter(models.Model):
 
     class Meta:
         unique_together = ("product", "parameter")
+        indexes = [
+            # для фильтрации товаров по значению параметра
+            models.Index(
+                fields=["parameter", "value"], name="productparam_param_value_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.parameter.name}: {self.value}"
 
 
+class ProductFacetCount(models.Model):
+    """Число товаров категории с данным значением параметра (для фасетов)."""
+
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name="facet_counts"
+    )
+    parameter = models.ForeignKey(
+        Parameter, on_delete=models.CASCADE, related_name="facet_counts"
+    )
+    value = models.TextField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("category", "parameter", "value")
+        verbose_name = "Счётчик фасета"
+        verbose_name_plural = "Счётчики фасетов"
+
+    def __str__(self):
+        return (
+            f"{self.category.name} / {self.parameter.name}: {self.value} ({self.count})"
+        )
+
+
+class PriceListUpload(models.Model):
+    """
+    Ход потоковой загрузки прайс-листа.
+
+    Каждая пачка товаров фиксируется вместе с rows_done в одной транзакции,
+    поэтому повторная загрузка того же файла (по checksum) продолжается
+    с первой незафиксированной строки.
+    """
+
+    supplier = models.ForeignKey(
+        Supplier, on_delete=models.CASCADE, related_name="price_uploads"
+    )
+    checksum = models.CharField(max_length=64)  # sha256 файла
+    status = models.CharField(
+        max_length=20, choices=UPLOAD_STATUS_CHOICES, default="in_progress"
+    )
+    rows_done = models.PositiveIntegerField(default=0)
+    chunks_done = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    unchanged_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Загрузка прайс-листа"
+        verbose_name_plural = "Загрузки прайс-листов"
+        indexes = [
+            models.Index(
+                fields=["supplier", "checksum"], name="pricelistupload_checksum_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.supplier.name}: {self.rows_done} строк ({self.status})"
+
+
+class ImportJob(models.Model):
+    """
+    Фоновая загрузка прайс-листа (core.jobs).
+
+    Очередь — сама таблица: воркеры забирают задания по порядку id,
+    задания одного поставщика выполняются строго друг за другом.
+    """
+
+    supplier = models.ForeignKey(
+        Supplier, on_delete=models.CASCADE, related_name="import_jobs"
+    )
+    status = models.CharField(
+        max_length=20, choices=JOB_STATUS_CHOICES, default="queued"
+    )
+    path = models.CharField(max_length=500)  # файл прайс-листа на диске
+    checksum = models.CharField(max_length=64)
+    # Прайс полный (?full=1): отсутствующие в нём товары снимаются с остатка
+    mark_missing = models.BooleanField(default=False)
+    upload = models.ForeignKey(
+        PriceListUpload,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="jobs",
+    )
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Задание загрузки прайс-листа"
+        verbose_name_plural = "Задания загрузки прайс-листов"
+        indexes = [
+            models.Index(fields=["status", "id"], name="importjob_status_id_idx"),
+            models.Index(fields=["supplier", "status"], name="importjob_supplier_idx"),
+        ]
+
+    def __str__(self):
+        return f"Загрузка #{self.id} {self.supplier.name} ({self.status})"
+
+
 class DeliveryAddress(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="addresses")
     city = models.CharField(max_length=100)
@@ -171,3 +364,39 @@ class OrderConfirmationCode(models.Model):
     class Meta:
         verbose_name = "Код подтверждения заказа"
         verbose_name_plural = "Коды подтверждения заказов"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Результат запроса с заголовком Idempotency-Key (core.idempotency).
+
+    Повтор того же запроса в пределах срока хранения получает сохранённый
+    ответ, а не выполняется заново.
+    """
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="idempotency_keys"
+    )
+    endpoint = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    # sha256 метода, пути и тела запроса: тот же ключ с другим запросом — ошибка
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(
+        max_length=20, choices=IDEMPOTENCY_STATUS_CHOICES, default="in_progress"
+    )
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "endpoint", "key"], name="idempotencykey_unique"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.key} ({self.status})"
@@ -0,0 +1,228 @@
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Курсорная (keyset) пагинация по стабильной сортировке.
+
+    Позиция курсора — пара (значение поля сортировки, id), поэтому
+    следующая страница выбирается условием
+    ``field > value OR (field = value AND id > last_id)`` по индексу,
+    а не через OFFSET. Глубина страницы на стоимость запроса не влияет.
+
+    Допустимые поля сортировки задаются у view атрибутом
+    ``keyset_ordering_fields``, сортировка по умолчанию — ``keyset_ordering``.
+    Курсор помнит сортировку, для которой выдан: с другой он не принимается.
+    """
+
+    cursor_query_param = "cursor"
+    ordering_query_param = "ordering"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Некорректный курсор"
+
+    default_ordering_fields = ("id",)
+    default_ordering = "id"
+
+    # Границы id в курсоре (bigint)
+    max_id = 2**63 - 1
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+        self.field = self.ordering.lstrip("-")
+        self.descending = self.ordering.startswith("-")
+        self.model = queryset.model
+
+        cursor = self.decode_cursor(request)
+        # Курсор «назад» идёт в обратном направлении, затем разворачиваем страницу
+        backwards = bool(cursor and cursor["r"])
+        descending = self.descending != backwards
+
+        queryset = queryset.order_by(*self._order_by(descending))
+        if cursor is not None:
+            queryset = queryset.filter(
+                self._position_filter(cursor["v"], cursor["id"], descending)
+            )
+
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        if backwards:
+            self.page.reverse()
+
+        if backwards:
+            self.has_previous = has_more
+            self.has_next = True
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, "CATALOG_PAGE_SIZE", 50)
+        max_page_size = getattr(settings, "CATALOG_MAX_PAGE_SIZE", 500)
+        raw = request.query_params.get(self.page_size_query_param)
+        if raw is not None:
+            try:
+                page_size = int(raw)
+            except ValueError:
+                raise ValidationError(
+                    {
+                        self.page_size_query_param: "Размер страницы должен быть целым числом"
+                    }
+                )
+            if page_size <= 0:
+                raise ValidationError(
+                    {
+                        self.page_size_query_param: "Размер страницы должен быть положительным"
+                    }
+                )
+        return min(page_size, max_page_size)
+
+    def get_ordering(self, request, view):
+        allowed = getattr(view, "keyset_ordering_fields", self.default_ordering_fields)
+        ordering = request.query_params.get(self.ordering_query_param)
+        if ordering is None:
+            return getattr(view, "keyset_ordering", self.default_ordering)
+        if ordering.lstrip("-") not in allowed:
+            raise ValidationError(
+                {
+                    self.ordering_query_param: f"Недопустимая сортировка. Допустимые поля: {list(allowed)}"
+                }
+            )
+        return ordering
+
+    def _order_by(self, descending):
+        prefix = "-" if descending else ""
+        if self.field == "id":
+            return [f"{prefix}id"]
+        # id — разрешение равенства, чтобы порядок был строгим
+        return [f"{prefix}{self.field}", f"{prefix}id"]
+
+    def _position_filter(self, value, last_id, descending):
+        op = "lt" if descending else "gt"
+        if self.field == "id":
+            return Q(**{f"id__{op}": last_id})
+        return Q(**{f"{self.field}__{op}": value}) | Q(
+            **{self.field: value, f"id__{op}": last_id}
+        )
+
+    def _position(self, obj):
+        # Страница — объекты модели или строки .values() (core.fast_serializers)
+        if isinstance(obj, dict):
+            value, pk = obj[self.field], obj["id"]
+        else:
+            value, pk = getattr(obj, self.field), obj.pk
+        if self.field != "id":
+            value = str(value)
+        return value, pk
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        value, last_id = self._position(self.page[-1])
+        return self.encode_cursor(
+            {"o": self.ordering, "v": value, "id": last_id, "r": False}
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        value, first_id = self._position(self.page[0])
+        return self.encode_cursor(
+            {"o": self.ordering, "v": value, "id": first_id, "r": True}
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8")
+            cursor = json.loads(raw)
+            if cursor["o"] != self.ordering:
+                # Курсор от другой сортировки указывает на чужую позицию
+                raise ValueError(cursor["o"])
+            position = {
+                "v": self._field_value(cursor["v"]),
+                "id": int(cursor["id"]),
+                "r": bool(cursor.get("r", False)),
+            }
+            if abs(position["id"]) > self.max_id:
+                raise OverflowError(position["id"])
+        except (
+            TypeError,
+            ValueError,
+            KeyError,
+            UnicodeError,
+            OverflowError,
+            DjangoValidationError,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def _field_value(self, value):
+        # Значение из курсора — в тип поля модели (строка → Decimal, дата...)
+        if self.field == "id":
+            return value
+        if value is None:
+            raise ValueError("Пустое значение в курсоре")
+        return self.model._meta.get_field(self.field).to_python(value)
+
+    def encode_cursor(self, position):
+        raw = json.dumps(position, ensure_ascii=False, separators=(",", ":"))
+        encoded = base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.ordering_query_param,
+                "required": False,
+                "in": "query",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "schema": {"type": "integer"},
+            },
+        ]
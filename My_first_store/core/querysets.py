@@ -0,0 +1,107 @@
+# Наборы select_related/prefetch_related под деревья сериализаторов.
+# Каждая функция возвращает queryset, который сериализуется за постоянное
+# число запросов независимо от количества объектов в ответе.
+
+from django.db.models import (
+    DecimalField,
+    F,
+    Prefetch,
+    Sum,
+    prefetch_related_objects,
+)
+
+from .models import BasketItem, OrderItem, Product, ProductParameter
+
+
+def product_parameters_prefetch(prefix=""):
+    """Prefetch параметров товара вместе с названиями параметров."""
+    return Prefetch(
+        f"{prefix}parameters",
+        queryset=ProductParameter.objects.select_related("parameter"),
+    )
+
+
+def products_for_serializer(queryset=None):
+    """Товары для ProductSerializer: категория, поставщик и параметры."""
+    if queryset is None:
+        queryset = Product.objects.all()
+    return (
+        queryset.defer("search_vector")
+        .select_related("category", "supplier")
+        .prefetch_related(product_parameters_prefetch())
+    )
+
+
+def order_items_for_serializer(queryset=None):
+    """Позиции заказа для OrderItemSerializer (товар со всеми вложениями)."""
+    if queryset is None:
+        queryset = OrderItem.objects.all()
+    return (
+        queryset.defer("product__search_vector")
+        .select_related("product__category", "product__supplier")
+        .prefetch_related(product_parameters_prefetch("product__"))
+    )
+
+
+def orders_for_serializer(queryset):
+    """Заказы для OrderSerializer: адрес и позиции с товарами."""
+    return queryset.select_related("address").prefetch_related(
+        Prefetch("items", queryset=order_items_for_serializer())
+    )
+
+
+def basket_items_for_serializer(queryset=None):
+    """Позиции корзины для BasketItemSerializer."""
+    if queryset is None:
+        queryset = BasketItem.objects.all()
+    return (
+        queryset.defer("product__search_vector")
+        .select_related("product__category", "product__supplier")
+        .prefetch_related(product_parameters_prefetch("product__"))
+    )
+
+
+def prefetch_order(order):
+    """Догружает связи уже полученного заказа перед сериализацией."""
+    prefetch_related_objects(
+        [order], "address", Prefetch("items", queryset=order_items_for_serializer())
+    )
+    return order
+
+
+def prefetch_basket(basket):
+    """Догружает позиции уже полученной корзины перед сериализацией."""
+    prefetch_related_objects(
+        [basket], Prefetch("items", queryset=basket_items_for_serializer())
+    )
+    return basket
+
+
+def basket_totals(basket):
+    """
+    (количество, сумма) корзины.
+
+    Если позиции уже загружены (prefetch_basket), итоги считаются по тому же
+    списку без запросов, иначе — одним агрегатным запросом. Результат
+    запоминается в объекте корзины.
+    """
+    totals = getattr(basket, "_basket_totals", None)
+    if totals is not None:
+        return totals
+    items = getattr(basket, "_prefetched_objects_cache", {}).get("items")
+    if items is not None:
+        totals = (
+            sum(item.quantity for item in items),
+            sum(item.product.price * item.quantity for item in items),
+        )
+    else:
+        row = basket.items.aggregate(
+            total_quantity=Sum("quantity"),
+            total_price=Sum(
+                F("product__price") * F("quantity"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        totals = (row["total_quantity"] or 0, row["total_price"] or 0)
+    basket._basket_totals = totals
+    return totals
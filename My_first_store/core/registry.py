@@ -0,0 +1,114 @@
+# Справочники, на которые ссылаются прайс-листы: параметры (название → id)
+# и категории (id → название).
+#
+# Различных параметров и категорий — несколько сотен, а загрузка прайса
+# каждый раз искала их в БД. Реестр держит справочник в памяти процесса
+# целиком (загружается одним запросом) и при каждом обращении сверяет его
+# с версией справочника в БД (CatalogVersion, core.versions): любое
+# изменение справочника меняет версию, и процессы перечитывают его.
+# Кэш (core.cache) для этого не годится: он бывает своим у каждого
+# процесса, и удалённый в другом процессе id выдавался бы дальше. Реестр —
+# только ускорение: чего в нём нет, ищется в БД.
+
+import threading
+
+from django.db import transaction
+
+from .models import Category, Parameter
+from .versions import (
+    CATEGORIES_SCOPE,
+    PARAMETERS_SCOPE,
+    bump_scope_version,
+    get_catalog_version,
+)
+
+
+class Registry:
+    """Справочник ``key`` → ``value`` модели, кэшированный в процессе."""
+
+    def __init__(self, model, key, value, scope):
+        self.model = model
+        self.key = key
+        self.value = value
+        self.scope = scope
+        self._data = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _current_version(self):
+        return get_catalog_version(self.scope)[0]
+
+    def all(self):
+        """Весь справочник; перечитывается, если его изменили."""
+        version = self._current_version()
+        with self._lock:
+            if self._data is not None and self._version == version:
+                return self._data
+        data = dict(self.model.objects.values_list(self.key, self.value))
+        with self._lock:
+            self._data, self._version = data, version
+        return data
+
+    def resolve(self, keys, build):
+        """
+        {key: value} для ``keys``; недостающие создаются через ``build(key)``.
+
+        Если всё есть в реестре — один запрос (версия справочника), иначе
+        ещё два: вставка недостающих и их чтение, и после фиксации транзакции
+        два на увеличение версии справочника (обновление и чтение). Ключ,
+        который не удалось создать (конфликт по другому уникальному полю),
+        в ответ не попадает.
+        """
+        known = self.all()
+        resolved = {key: known[key] for key in keys if key in known}
+        missing = [key for key in keys if key not in known]
+        if not missing:
+            return resolved
+
+        self.model.objects.bulk_create(
+            [build(key) for key in missing], ignore_conflicts=True
+        )
+        created = dict(
+            self.model.objects.filter(**{f"{self.key}__in": missing}).values_list(
+                self.key, self.value
+            )
+        )
+        resolved.update(created)
+        # Откат транзакции не должен оставить в реестре несуществующие id
+        transaction.on_commit(lambda: self._remember(created))
+        return resolved
+
+    def _remember(self, values):
+        # Остальные процессы перечитают справочник
+        bumped = bump_scope_version(self.scope)
+        with self._lock:
+            # Версию увеличили только мы — справочник в памяти актуален
+            if self._data is not None and self._version == bumped - 1:
+                self._data.update(values)
+                self._version = bumped
+            else:
+                self._data = None
+
+    def clear(self):
+        with self._lock:
+            self._data = self._version = None
+
+
+parameters = Registry(Parameter, "name", "id", PARAMETERS_SCOPE)
+categories = Registry(Category, "id", "name", CATEGORIES_SCOPE)
+
+
+def resolve_parameters(names):
+    """{название: id} параметров, недостающие создаются."""
+    return parameters.resolve(names, lambda name: Parameter(name=name))
+
+
+def resolve_categories(names_by_id):
+    """
+    {id: название} категорий прайса, недостающие создаются с id из прайса.
+
+    Существующие категории не переименовываются.
+    """
+    return categories.resolve(
+        names_by_id, lambda cat_id: Category(id=cat_id, name=names_by_id[cat_id])
+    )
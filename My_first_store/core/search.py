@@ -0,0 +1,130 @@
+# Полнотекстовый поиск по каталогу.
+#
+# Документ товара — название (вес A), название категории (вес B) и значения
+# параметров (вес C). На PostgreSQL он хранится в Product.search_vector под
+# GIN-индексом, на SQLite — в FTS5-таблице core_product_fts (rowid = id
+# товара). Индекс обновляется точечно по списку изменённых товаров.
+
+import re
+
+from django.db import connection
+
+from .models import Category, Product, ProductParameter
+
+SEARCH_CONFIG = "russian"
+FTS_TABLE = "core_product_fts"
+
+# Пакет id на один запрос (лимит переменных SQLite)
+CHUNK_SIZE = 500
+
+_PG_UPDATE_SQL = """
+    UPDATE {product} AS p SET search_vector =
+        setweight(to_tsvector(%(config)s::regconfig, coalesce(p.name, '')), 'A')
+        || setweight(to_tsvector(%(config)s::regconfig, coalesce(c.name, '')), 'B')
+        || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+            SELECT string_agg(pp.value, ' ') FROM {parameter} AS pp
+            WHERE pp.product_id = p.id
+        ), '')), 'C')
+    FROM {category} AS c
+    WHERE c.id = p.category_id AND p.id = ANY(%(ids)s)
+"""
+
+_SQLITE_DELETE_SQL = "DELETE FROM {fts} WHERE rowid IN ({placeholders})"
+
+_SQLITE_INSERT_SQL = """
+    INSERT INTO {fts} (rowid, name, category, parameters)
+    SELECT p.id, p.name, c.name, coalesce((
+        SELECT group_concat(pp.value, ' ') FROM {parameter} AS pp
+        WHERE pp.product_id = p.id
+    ), '')
+    FROM {product} AS p JOIN {category} AS c ON c.id = p.category_id
+    WHERE p.id IN ({placeholders})
+"""
+
+_SQLITE_SEARCH_SQL = """
+    SELECT rowid, bm25({fts}, 10.0, 4.0, 1.0) AS rank FROM {fts}
+    WHERE {fts} MATCH %s AND rowid IN ({products})
+    ORDER BY rank LIMIT %s
+"""
+
+
+def _tables():
+    return {
+        "product": Product._meta.db_table,
+        "category": Category._meta.db_table,
+        "parameter": ProductParameter._meta.db_table,
+        "fts": FTS_TABLE,
+    }
+
+
+def update_search_index(product_ids):
+    """Пересобирает поисковые документы указанных товаров."""
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return
+    vendor = connection.vendor
+    with connection.cursor() as cursor:
+        for start in range(0, len(product_ids), CHUNK_SIZE):
+            chunk = product_ids[start : start + CHUNK_SIZE]
+            if vendor == "postgresql":
+                cursor.execute(
+                    _PG_UPDATE_SQL.format(**_tables()),
+                    {"config": SEARCH_CONFIG, "ids": chunk},
+                )
+            elif vendor == "sqlite":
+                placeholders = ", ".join(["%s"] * len(chunk))
+                tables = dict(_tables(), placeholders=placeholders)
+                cursor.execute(_SQLITE_DELETE_SQL.format(**tables), chunk)
+                cursor.execute(_SQLITE_INSERT_SQL.format(**tables), chunk)
+
+
+def rebuild_search_index():
+    """Полностью пересобирает индекс по всем товарам."""
+    update_search_index(Product.objects.values_list("id", flat=True))
+
+
+def _fts_query(text):
+    # Каждое слово — префиксный терм FTS5, слова объединяются по И
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_products(text, products, limit):
+    """
+    Ищет товары по строке ``text`` среди ``products``.
+
+    Возвращает список пар (id товара, релевантность) по убыванию
+    релевантности.
+    """
+    vendor = connection.vendor
+    if vendor == "postgresql":
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        from django.db.models import F
+
+        query = SearchQuery(text, config=SEARCH_CONFIG, search_type="websearch")
+        rows = (
+            products.filter(search_vector=query)
+            .annotate(rank=SearchRank(F("search_vector"), query))
+            .order_by("-rank", "id")
+            .values_list("id", "rank")[:limit]
+        )
+        return list(rows)
+
+    if vendor == "sqlite":
+        match = _fts_query(text)
+        if not match:
+            return []
+        products_sql, products_params = (
+            products.order_by().values("id").query.sql_with_params()
+        )
+        sql = _SQLITE_SEARCH_SQL.format(fts=FTS_TABLE, products=products_sql)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [match, *products_params, limit])
+            # bm25 в SQLite отрицательный: чем меньше, тем релевантнее
+            return [(product_id, -rank) for product_id, rank in cursor.fetchall()]
+
+    # Прочие СУБД: без ранжирования, по вхождению в название
+    rows = products.filter(name__icontains=text).order_by("id")
+    return [
+        (product_id, 0.0) for product_id in rows.values_list("id", flat=True)[:limit]
+    ]
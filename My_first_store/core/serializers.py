@@ -13,11 +13,125 @@ from .models import (
     OrderItem,
 )
 from .models import Basket, BasketItem
+from .querysets import basket_totals
+
+# Выборочные поля (?fields=) и вынос связанных объектов (?include=)
+
+# Ключ контекста, в котором копятся вынесенные объекты: {коллекция: {pk: obj}}
+SIDELOAD_KEY = "sideload"
+
+# Поле-связь → коллекция в "included"
+SIDELOAD_FIELDS = {
+    "product": "products",
+    "category": "categories",
+    "supplier": "suppliers",
+    "address": "addresses",
+}
+
+
+def parse_fields(raw):
+    """
+    "id,name,category.name" → {"id": {}, "name": {}, "category": {"name": {}}}.
+
+    Пустой словарь означает «все поля этого узла».
+    """
+    tree = {}
+    for path in raw.split(","):
+        node = tree
+        for part in path.strip().split("."):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class SideloadedField(serializers.Field):
+    """Отдаёт pk связанного объекта и откладывает объект в "included"."""
+
+    def __init__(self, collection, **kwargs):
+        self.collection = collection
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        registry = self.context.get(SIDELOAD_KEY)
+        if registry is not None:
+            registry.setdefault(self.collection, {})[value.pk] = value
+        return value.pk
+
+
+class SparseFieldsMixin:
+    """
+    Оставляет только запрошенные поля и заменяет вынесенные связи на pk.
+
+    Корневой сериализатор берёт дерево полей из context["fields"],
+    вложенные получают своё поддерево от родителя.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if hasattr(self, "_sparse_tree"):
+            tree = self._sparse_tree
+        else:
+            tree = self.context.get("fields")
+        include = self.context.get("include", ())
+
+        if tree:
+            fields = {name: field for name, field in fields.items() if name in tree}
+
+        for name, field in list(fields.items()):
+            collection = SIDELOAD_FIELDS.get(name)
+            if collection in include and isinstance(field, serializers.Serializer):
+                fields[name] = SideloadedField(collection, source=field.source)
+                continue
+            target = getattr(field, "child", field)
+            if isinstance(target, SparseFieldsMixin):
+                target._sparse_tree = tree.get(name) if tree else None
+        return fields
+
+
+def sparse_context(request, **extra):
+    """Контекст сериализатора с разобранными ?fields= и ?include=."""
+    context = {"request": request, SIDELOAD_KEY: {}, **extra}
+    fields = request.query_params.get("fields")
+    if fields:
+        context["fields"] = parse_fields(fields)
+    include = request.query_params.get("include")
+    if include:
+        context["include"] = {
+            name.strip()
+            for name in include.split(",")
+            if name.strip() in SIDELOAD_FIELDS.values()
+        }
+    return context
+
+
+def build_included(context):
+    """Сериализует вынесенные объекты, каждый — один раз."""
+    registry = context.get(SIDELOAD_KEY)
+    if not registry:
+        return None
+    # Вынесенные объекты выводятся со всеми полями
+    nested_context = {key: value for key, value in context.items() if key != "fields"}
+    included = {}
+    # Товары первыми: они сами могут вынести категории и поставщиков
+    for collection, serializer_class in (
+        ("products", ProductSerializer),
+        ("categories", CategorySerializer),
+        ("suppliers", SupplierSerializer),
+        ("addresses", DeliveryAddressSerializer),
+    ):
+        objects = registry.get(collection)
+        if objects:
+            included[collection] = serializer_class(
+                list(objects.values()), many=True, context=nested_context
+            ).data
+    return included
+
 
 # Сериализаторы для вспомогательных моделей
 
 
-class ParameterSerializer(serializers.ModelSerializer):
+class ParameterSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Просто конвертирует модель Parameter (например, "Цвет", "Диагональ")"""
 
     class Meta:
@@ -25,7 +139,7 @@ class ParameterSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class ProductParameterSerializer(serializers.ModelSerializer):
+class ProductParameterSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Конвертирует ProductParameter (например, "Цвет: черный")."""
 
     parameter = ParameterSerializer(read_only=True)
@@ -35,7 +149,7 @@ class ProductParameterSerializer(serializers.ModelSerializer):
         fields = ["parameter", "value"]
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Просто сериализуют Category"""
 
     class Meta:
@@ -43,7 +157,7 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class SupplierSerializer(serializers.ModelSerializer):
+class SupplierSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Просто сериализуют Category и Supplier"""
 
     class Meta:
@@ -54,19 +168,17 @@ class SupplierSerializer(serializers.ModelSerializer):
 # Основные сериализаторы
 
 
-class ProductSerializer(serializers.ModelSerializer):
-    parameters = ProductParameterSerializer(
-        source="productparameter_set", many=True, read_only=True
-    )
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    parameters = ProductParameterSerializer(many=True, read_only=True)
     category = CategorySerializer(read_only=True)
     supplier = SupplierSerializer(read_only=True)
 
     class Meta:
         model = Product
-        fields = "__all__"
+        exclude = ["search_vector", "content_hash"]
 
 
-class DeliveryAddressSerializer(serializers.ModelSerializer):
+class DeliveryAddressSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = DeliveryAddress
         fields = "__all__"
@@ -96,7 +208,7 @@ class DeliveryAddressSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализует один товар в заказе."""
 
     product = ProductSerializer(read_only=True)
@@ -106,8 +218,8 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ["product", "quantity"]
 
 
-class OrderSerializer(serializers.ModelSerializer):
-    items = OrderItemSerializer(source="orderitem_set", many=True, read_only=True)
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
     #   список товаров в заказе
     address = DeliveryAddressSerializer(read_only=True)
 
@@ -146,7 +258,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 # модкль корзины
-class BasketItemSerializer(serializers.ModelSerializer):
+class BasketItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)  # Выводим полную информацию о товаре
 
     class Meta:
@@ -154,7 +266,7 @@ class BasketItemSerializer(serializers.ModelSerializer):
         fields = ["id", "product", "quantity"]
 
 
-class BasketSerializer(serializers.ModelSerializer):
+class BasketSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = BasketItemSerializer(
         source="items.all", many=True, read_only=True
     )  # Все товары в корзине
@@ -173,7 +285,7 @@ class BasketSerializer(serializers.ModelSerializer):
         ]
 
     def get_total_quantity(self, obj):
-        return sum(item.quantity for item in obj.items.all())
+        return basket_totals(obj)[0]
 
     def get_total_price(self, obj):
-        return sum(item.product.price * item.quantity for item in obj.items.all())
+        return basket_totals(obj)[1]
@@ -0,0 +1,108 @@
+from django.db import transaction
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .cache import catalog_cache, product_tags
+from .models import Category, DeletedProduct, Parameter, Product, Supplier
+from .search import update_search_index
+from .versions import (
+    CATEGORIES_SCOPE,
+    PARAMETERS_SCOPE,
+    bump_catalog_version,
+    supplier_scope,
+)
+
+# Отправляется после изменения каталога внутри пишущей транзакции.
+# sender — модель (Product, Category, ...);
+# supplier_id — поставщик, чьи товары изменились (или None);
+# product_ids — id изменённых или удалённых товаров;
+# None означает «все товары поставщика»;
+# supplier_ids — поставщики затронутых товаров при изменении справочников
+# (Category, Parameter): их списки и версии тоже устаревают;
+# stock_only — изменились только остатки и цены (core.stock): поисковые
+# документы не затронуты, версия каталога уже проставлена отправителем.
+catalog_changed = Signal()
+
+# Товаров в одном UPDATE при простановке версии
+STAMP_BATCH_SIZE = 500
+
+
+def product_suppliers(products):
+    """(id товаров, id их поставщиков) для catalog_changed одним запросом."""
+    rows = list(products.values_list("id", "supplier_id"))
+    return [row[0] for row in rows], sorted({row[1] for row in rows})
+
+
+@receiver(catalog_changed)
+def update_search_on_catalog_change(
+    sender, supplier_id=None, product_ids=None, stock_only=False, **kwargs
+):
+    """Точечно обновляет поисковый индекс изменённых товаров."""
+    if sender is Supplier or stock_only:
+        # Данные поставщика, остатки и цены в поисковый документ не входят
+        return
+    if product_ids is None:
+        if supplier_id is None:
+            return
+        product_ids = Product.objects.filter(supplier_id=supplier_id).values_list(
+            "id", flat=True
+        )
+    update_search_index(product_ids)
+
+
+@receiver(catalog_changed)
+def invalidate_catalog_cache(
+    sender, supplier_id=None, product_ids=None, supplier_ids=(), **kwargs
+):
+    """Сбрасывает кэш каталога после фиксации транзакции."""
+    if product_ids is None and supplier_id is not None:
+        product_ids = Product.objects.filter(supplier_id=supplier_id).values_list(
+            "id", flat=True
+        )
+    tags = product_tags(product_ids or (), supplier_id)
+    tags.extend(f"supplier:{supplier}" for supplier in supplier_ids)
+    if sender is Category:
+        tags.append("categories")
+    # Иначе параллельный запрос успеет закэшировать ещё старые данные
+    transaction.on_commit(lambda: catalog_cache.invalidate(tags))
+
+
+@receiver(catalog_changed)
+def bump_catalog_versions(
+    sender,
+    supplier_id=None,
+    product_ids=None,
+    stock_only=False,
+    supplier_ids=(),
+    **kwargs,
+):
+    """Увеличивает версии каталога и помечает ими изменённые товары."""
+    if stock_only:
+        return
+    scopes = [supplier_scope(supplier) for supplier in supplier_ids]
+    if supplier_id is not None:
+        scopes.append(supplier_scope(supplier_id))
+    if sender is Category:
+        scopes.append(CATEGORIES_SCOPE)
+    elif sender is Parameter:
+        scopes.append(PARAMETERS_SCOPE)
+    version = bump_catalog_version(*scopes)
+
+    now = timezone.now()
+    if product_ids is None:
+        if supplier_id is not None:
+            Product.objects.filter(supplier_id=supplier_id).update(
+                catalog_version=version, updated_at=now
+            )
+        return
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), STAMP_BATCH_SIZE):
+        batch = product_ids[start : start + STAMP_BATCH_SIZE]
+        updated = Product.objects.filter(id__in=batch).update(
+            catalog_version=version, updated_at=now
+        )
+        if updated < len(batch):
+            # Часть товаров удалена (core.versions.record_deleted_products)
+            DeletedProduct.objects.filter(product_id__in=batch).update(
+                catalog_version=version, deleted_at=now
+            )
@@ -0,0 +1,223 @@
+# Частое обновление остатков и цен поставщика.
+#
+# Поставщик присылает только пары (external_id → остаток, цена), без
+# названий, категорий и параметров. На PostgreSQL всё изменение — один
+# запрос: массивы разворачиваются unnest() в CTE, UPDATE ... FROM по
+# (supplier, external_id) записывает только строки, где что-то поменялось,
+# и тот же запрос возвращает id изменённых товаров и ненайденные
+# external_id. На прочих СУБД — пачками через ORM.
+#
+# Здесь же — списание остатков по подтверждённому заказу.
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .importer import PriceListError, parse_price, parse_quantity
+from .models import Product
+from .signals import catalog_changed
+from .versions import bump_catalog_version, supplier_scope
+
+MAX_ROWS = 100_000
+
+
+# Строк на пачку в запасном варианте (лимит переменных SQLite)
+CHUNK_SIZE = 500
+
+_PG_UPDATE_SQL = """
+    WITH delta AS (
+        SELECT * FROM unnest(
+            %(external_ids)s::varchar[], %(quantities)s::integer[],
+            %(prices)s::numeric[]
+        ) AS d (external_id, quantity, price)
+    ),
+    updated AS (
+        UPDATE {product} AS p
+        SET quantity = d.quantity, price = d.price, content_hash = '',
+            catalog_version = %(version)s, updated_at = %(now)s
+        FROM delta AS d
+        WHERE p.supplier_id = %(supplier_id)s AND p.external_id = d.external_id
+            AND (p.quantity <> d.quantity OR p.price <> d.price)
+        RETURNING p.id
+    )
+    SELECT
+        ARRAY(SELECT id FROM updated),
+        ARRAY(
+            SELECT d.external_id FROM delta AS d
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {product} AS p
+                WHERE p.supplier_id = %(supplier_id)s
+                    AND p.external_id = d.external_id
+            )
+        )
+"""
+
+
+class InsufficientStock(Exception):
+    """На складе меньше, чем в позиции заказа; списание откатывается целиком."""
+
+    def __init__(self, name, requested, available):
+        super().__init__(name, requested, available)
+        self.name, self.requested, self.available = name, requested, available
+
+
+def parse_stock_rows(goods):
+    """
+    Проверяет строки {"id", "quantity", "price"}; возвращает
+    {external_id: (остаток, цена)}. Повтор id — побеждает последняя строка.
+    """
+    if not isinstance(goods, list):
+        raise PriceListError('Поле "goods" должно быть списком.')
+    if len(goods) > MAX_ROWS:
+        raise PriceListError(f"Не больше {MAX_ROWS} строк за один запрос.")
+
+    rows = {}
+    for index, good in enumerate(goods):
+        try:
+            external_id = str(good["id"])
+            quantity, quantity_error = parse_quantity(good["quantity"])
+            price, price_error = parse_price(good["price"])
+        except (KeyError, TypeError) as error:
+            raise PriceListError(f"Строка #{index}: нет поля {error}.")
+        # Те же ограничения, что и у прайс-листа (core.importer)
+        if quantity_error:
+            raise PriceListError(
+                f"Строка #{index} (ID: {external_id}): количество {quantity_error}."
+            )
+        if price_error:
+            raise PriceListError(
+                f"Строка #{index} (ID: {external_id}): цена {price_error}."
+            )
+        rows[external_id] = (quantity, price)
+    return rows
+
+
+def apply_stock_delta(supplier, rows):
+    """
+    Обновляет остатки и цены товаров поставщика одной транзакцией.
+
+    ``rows`` — результат parse_stock_rows(). Отпечаток строки прайса
+    (content_hash) у изменённых товаров сбрасывается. Возвращает
+    (id изменённых товаров, ненайденные external_id).
+    """
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            changed, unmatched = _apply_postgresql(supplier, rows)
+        else:
+            changed, unmatched = _apply_chunked(supplier, rows)
+        if changed:
+            catalog_changed.send(
+                sender=Product,
+                supplier_id=supplier.id,
+                product_ids=changed,
+                stock_only=True,
+            )
+    return changed, unmatched
+
+
+def _apply_postgresql(supplier, rows):
+    # Новая версия каталога проставляется тем же UPDATE, поэтому берётся
+    # заранее; если ничего не изменилось, она откатывается
+    with transaction.atomic():
+        version = bump_catalog_version(supplier_scope(supplier.id))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _PG_UPDATE_SQL.format(product=Product._meta.db_table),
+                {
+                    "external_ids": list(rows),
+                    "quantities": [quantity for quantity, _ in rows.values()],
+                    "prices": [price for _, price in rows.values()],
+                    "supplier_id": supplier.id,
+                    "version": version,
+                    "now": timezone.now(),
+                },
+            )
+            changed, unmatched = cursor.fetchone()
+        if not changed:
+            transaction.set_rollback(True)
+    return changed, unmatched
+
+
+def _apply_chunked(supplier, rows):
+    now = timezone.now()
+    # Версия увеличивается при первом изменённом товаре
+    version = None
+    external_ids = list(rows)
+    changed, unmatched = [], []
+    for start in range(0, len(external_ids), CHUNK_SIZE):
+        chunk = external_ids[start : start + CHUNK_SIZE]
+        products = Product.objects.filter(
+            supplier=supplier, external_id__in=chunk
+        ).only("id", "external_id", "quantity", "price")
+        found = set()
+        updated = []
+        for product in products:
+            found.add(product.external_id)
+            quantity, price = rows[product.external_id]
+            if product.quantity == quantity and product.price == price:
+                continue
+            product.quantity, product.price = quantity, price
+            product.content_hash = ""
+            updated.append(product)
+        if updated:
+            if version is None:
+                version = bump_catalog_version(supplier_scope(supplier.id))
+            for product in updated:
+                product.catalog_version, product.updated_at = version, now
+            Product.objects.bulk_update(
+                updated,
+                [
+                    "quantity",
+                    "price",
+                    "content_hash",
+                    "catalog_version",
+                    "updated_at",
+                ],
+            )
+            changed.extend(product.id for product in updated)
+        unmatched.extend(
+            external_id for external_id in chunk if external_id not in found
+        )
+    return changed, unmatched
+
+
+def deduct_order_stock(order):
+    """
+    Списывает со склада количества позиций заказа. Изменённые товары
+    помечаются новой версией каталога их поставщиков, кэш сбрасывается;
+    отпечаток строки прайса сбрасывается, чтобы повторная загрузка того же
+    прайса вернула остаток. Если какого-то товара на складе уже меньше,
+    чем в заказе, ничего не списывается — InsufficientStock.
+    """
+    lines = {}
+    for product_id, supplier_id, quantity in order.items.values_list(
+        "product_id", "product__supplier_id", "quantity"
+    ):
+        lines.setdefault(supplier_id, []).append((product_id, quantity))
+    if not lines:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        version = bump_catalog_version(*(supplier_scope(sid) for sid in lines))
+        for supplier_id, products in lines.items():
+            for product_id, quantity in products:
+                # Остаток проверяется тем же UPDATE
+                updated = Product.objects.filter(
+                    pk=product_id, quantity__gte=quantity
+                ).update(
+                    quantity=F("quantity") - quantity,
+                    content_hash="",
+                    catalog_version=version,
+                    updated_at=now,
+                )
+                if not updated:
+                    name, available = Product.objects.values_list(
+                        "name", "quantity"
+                    ).get(pk=product_id)
+                    raise InsufficientStock(name, quantity, available)
+            catalog_changed.send(
+                sender=Product,
+                supplier_id=supplier_id,
+                product_ids=[product_id for product_id, _ in products],
+                stock_only=True,
+            )
@@ -1,3 +1,1317 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from itertools import count
+from unittest import mock
+from unittest.mock import ANY
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import registry
+from .cache import LRUCache, catalog_cache
+from .checks import check_catalog_cache
+from .facets import facet_snapshot, rebuild_facets
+from .importer import (
+    ImportInterrupted,
+    PriceListError,
+    PriceListImporter,
+    get_price_list_upload,
+    import_price_list,
+    import_price_list_file,
+)
+from .jobs import claim_job, enqueue_price_list, requeue_stale_jobs, run_job
+from .jsonstream import JSONStreamError, iter_array
+from .models import (
+    Basket,
+    Category,
+    DeliveryAddress,
+    ImportJob,
+    Order,
+    OrderConfirmationCode,
+    OrderItem,
+    Parameter,
+    PriceListUpload,
+    Product,
+    ProductFacetCount,
+    ProductParameter,
+    Supplier,
+    User,
+)
+from .querysets import basket_totals, prefetch_basket
+from .signals import catalog_changed
+from .stock import deduct_order_stock
+from .versions import PARAMETERS_SCOPE, bump_catalog_version, get_catalog_version
+from .views import ProductViewSet
+
+_seq = count(1)
+
+
+def make_user(user_type="client"):
+    n = next(_seq)
+    return User.objects.create_user(
+        username=f"user{n}", email=f"user{n}@example.com", user_type=user_type
+    )
+
+
+def make_supplier():
+    return Supplier.objects.create(
+        user=make_user("supplier"), name=f"Поставщик {next(_seq)}"
+    )
+
+
+def make_product(supplier, category, params=("Цвет", "Вес"), **fields):
+    n = next(_seq)
+    defaults = {"name": f"Товар {n}", "price": 100, "quantity": 10}
+    defaults.update(fields)
+    product = Product.objects.create(
+        supplier=supplier, category=category, external_id=str(n), **defaults
+    )
+    for name in params:
+        parameter, _ = Parameter.objects.get_or_create(name=name)
+        ProductParameter.objects.create(
+            product=product, parameter=parameter, value=f"значение {n}"
+        )
+    return product
+
+
+class QueryBudgetMixin:
+    """Проверяет, что число запросов эндпоинта не растёт вместе с ответом."""
+
+    def assertQueryCountConstant(self, fetch, grow):
+        with CaptureQueriesContext(connection) as small:
+            fetch()
+        grow()
+        with CaptureQueriesContext(connection) as large:
+            fetch()
+        self.assertEqual(
+            len(small),
+            len(large),
+            "Число запросов растёт с размером ответа:\n"
+            + "\n".join(q["sql"] for q in large.captured_queries),
+        )
+
+
+class CatalogQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.supplier = make_supplier()
+        self.category = Category.objects.create(name="Смартфоны")
+        make_product(self.supplier, self.category)
+
+    def test_product_list(self):
+        def grow():
+            for _ in range(5):
+                make_product(
+                    make_supplier(), Category.objects.create(name=f"К{next(_seq)}")
+                )
+
+        def fetch():
+            response = self.client.get("/api/products/")
+            self.assertEqual(response.status_code, 200)
+
+        self.assertQueryCountConstant(fetch, grow)
+
+    def test_product_parameters_serialized(self):
+        response = self.client.get("/api/products/")
+        parameters = response.json()["results"][0]["parameters"]
+        self.assertEqual(
+            sorted(p["parameter"]["name"] for p in parameters), ["Вес", "Цвет"]
+        )
+
+    def test_order_list(self):
+        user = make_user()
+        address = DeliveryAddress.objects.create(
+            user=user, city="Москва", street="Тверская", house="1"
+        )
+        self.client.force_authenticate(user)
+
+        def add_order(lines):
+            order = Order.objects.create(user=user, address=address)
+            for _ in range(lines):
+                OrderItem.objects.create(
+                    order=order,
+                    product=make_product(self.supplier, self.category),
+                    quantity=1,
+                )
+
+        add_order(1)
+
+        def grow():
+            for _ in range(3):
+                add_order(4)
+
+        def fetch():
+            response = self.client.get("/api/orders/")
+            self.assertEqual(response.status_code, 200)
+
+        self.assertQueryCountConstant(fetch, grow)
+
+
+@override_settings(FAST_SERIALIZATION_ENDPOINTS=[])
+class ModelSerializerQueryBudgetTests(CatalogQueryBudgetTests):
+    """Те же бюджеты без быстрой сериализации: ModelSerializer и prefetch."""
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user())
+        supplier = make_supplier()
+        category = Category.objects.create(name="Ноутбуки")
+        # Повторяющиеся цены: порядок внутри цены задаёт id
+        self.products = [
+            make_product(supplier, category, params=(), price=price)
+            for price in (300, 100, 200, 100, 300)
+        ]
+
+    def cursor(self, **position):
+        raw = json.dumps(position).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def test_walks_every_page_forward_and_back(self):
+        # Обратная сортировка разворачивает и порядок id
+        ordered = sorted(self.products, key=lambda p: (p.price, p.id))
+        expected = [p.id for p in reversed(ordered)]
+        url, seen = "/api/products/?ordering=-price&page_size=2", []
+        while url:
+            page = self.client.get(url).data
+            seen += [row["id"] for row in page["results"]]
+            last_url, url = url, page["next"]
+        self.assertEqual(seen, expected)
+
+        previous = self.client.get(last_url).data["previous"]
+        page = self.client.get(previous).data
+        self.assertEqual([row["id"] for row in page["results"]], expected[2:4])
+
+    def test_rejects_invalid_cursors(self):
+        next_url = self.client.get("/api/products/?ordering=name&page_size=2").data[
+            "next"
+        ]
+        cursor = next_url.split("cursor=")[1].split("&")[0]
+        bad = [
+            # Курсор от другой сортировки
+            cursor,
+            self.cursor(o="price", v="x", id=1, r=False),
+            self.cursor(o="price", v="NaN", id=1, r=False),
+            self.cursor(o="price", v="100.00", id=1e400, r=False),
+            self.cursor(o="price", v="100.00", id=10**30, r=False),
+            "не-base64",
+        ]
+        for value in bad:
+            response = self.client.get(
+                "/api/products/", {"ordering": "price", "cursor": value}
+            )
+            self.assertEqual(response.status_code, 404, value)
+
+
+class FastSerializationTests(TestCase):
+    """Быстрый путь отдаёт тот же JSON, что и ModelSerializer."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = make_user()
+        supplier = make_supplier()
+        category = Category.objects.create(name="Ноутбуки")
+        address = DeliveryAddress.objects.create(
+            user=self.user, city="Москва", street="Тверская", house="1"
+        )
+        for order_address in (address, None):
+            order = Order.objects.create(user=self.user, address=order_address)
+            for _ in range(2):
+                OrderItem.objects.create(
+                    order=order, product=make_product(supplier, category), quantity=3
+                )
+        make_product(supplier, category, params=())
+        self.client.force_authenticate(self.user)
+        self.client.post(
+            "/api/basket/add/",
+            {"product_id": Product.objects.first().id, "quantity": 2},
+            format="json",
+        )
+
+    def assertSameOutput(self, url):
+        with self.settings(FAST_SERIALIZATION_ENDPOINTS=[]):
+            slow = self.client.get(url)
+        fast = self.client.get(url)
+        self.assertEqual(slow.status_code, 200)
+        self.assertEqual(slow.content, fast.content)
+
+    def test_products(self):
+        self.assertSameOutput("/api/products/?ordering=-price&page_size=2")
+
+    def test_orders(self):
+        self.assertSameOutput("/api/orders/")
+
+    def test_order_items(self):
+        self.assertSameOutput("/api/order-items/")
+
+    def test_basket(self):
+        self.assertSameOutput("/api/basket/")
+
+    def test_basket_totals_without_prefetch(self):
+        basket = Basket.objects.get(user=self.user)
+        with self.assertNumQueries(1):
+            totals = basket_totals(basket)
+            self.assertEqual(basket_totals(basket), totals)
+        prefetched = prefetch_basket(Basket.objects.get(user=self.user))
+        with self.assertNumQueries(0):
+            self.assertEqual(basket_totals(prefetched), totals)
+
+
+class RegistryTests(TestCase):
+    def setUp(self):
+        # Реестр живёт дольше транзакции теста
+        registry.parameters.clear()
+        self.addCleanup(registry.parameters.clear)
+
+    def test_resolve_creates_missing_then_uses_cache(self):
+        bump_catalog_version(PARAMETERS_SCOPE)
+        registry.parameters.all()
+        version = get_catalog_version()
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                ids = registry.resolve_parameters({"Цвет", "Вес"})
+        self.assertEqual(ids, dict(Parameter.objects.values_list("name", "id")))
+        # Версия справочника, вставка, чтение; после фиксации — новая версия
+        self.assertEqual(
+            [
+                query["sql"].split()[0]
+                for query in queries.captured_queries
+                if not query["sql"].startswith(("SAVEPOINT", "RELEASE"))
+            ],
+            ["SELECT", "INSERT", "SELECT", "UPDATE", "SELECT"],
+        )
+        # Глобальная версия (ETag всего каталога) не меняется
+        self.assertEqual(get_catalog_version(), version)
+        # Только сверка версии справочника
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                registry.resolve_parameters({"Цвет"}), {"Цвет": ids["Цвет"]}
+            )
+
+    def test_deletion_in_other_process_is_seen(self):
+        parameter = Parameter.objects.create(name="Цвет")
+        self.assertIn("Цвет", registry.parameters.all())
+        # Другой процесс удаляет параметр: общий у процессов только счётчик
+        # версии в БД, кэш у каждого свой
+        Parameter.objects.filter(id=parameter.id).delete()
+        bump_catalog_version(PARAMETERS_SCOPE)
+        with self.captureOnCommitCallbacks(execute=True):
+            ids = registry.resolve_parameters({"Цвет"})
+        self.assertNotEqual(ids["Цвет"], parameter.id)
+        self.assertTrue(Parameter.objects.filter(id=ids["Цвет"]).exists())
+
+    def test_change_invalidates_registry(self):
+        parameter = Parameter.objects.create(name="Цвет")
+        self.assertIn("Цвет", registry.parameters.all())
+        parameter.name = "Окрас"
+        parameter.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            catalog_changed.send(sender=Parameter)
+        self.assertEqual(registry.parameters.all(), {"Окрас": parameter.id})
+
+
+class FacetMaintenanceTests(TestCase):
+    """Счётчики фасетов после каждой правки совпадают с полным пересчётом."""
+
+    def setUp(self):
+        # Реестр живёт дольше транзакции теста
+        for cached in (registry.parameters, registry.categories):
+            cached.clear()
+            self.addCleanup(cached.clear)
+        self.client = APIClient()
+        self.client.force_authenticate(make_user())
+        self.supplier = make_supplier()
+        self.category = Category.objects.create(name="Ноутбуки")
+        self.products = [make_product(self.supplier, self.category) for _ in range(3)]
+        rebuild_facets()
+
+    def assertCountsFresh(self):
+        stored = {
+            (cat_id, param_id, value): n
+            for cat_id, param_id, value, n in ProductFacetCount.objects.values_list(
+                "category_id", "parameter_id", "value", "count"
+            )
+        }
+        self.assertEqual(stored, dict(facet_snapshot(Product.objects.all())))
+
+    def test_api_changes_update_counts(self):
+        first, second, third = self.products
+        product_parameter = first.parameters.first()
+        response = self.client.patch(
+            f"/api/product-parameters/{product_parameter.id}/",
+            {
+                "value": second.parameters.get(
+                    parameter=product_parameter.parameter
+                ).value
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertCountsFresh()
+
+        self.assertEqual(
+            self.client.delete(f"/api/products/{third.id}/").status_code, 204
+        )
+        self.assertCountsFresh()
+
+        parameter = Parameter.objects.get(name="Вес")
+        self.assertEqual(
+            self.client.delete(f"/api/parameters/{parameter.id}/").status_code, 204
+        )
+        self.assertCountsFresh()
+
+    def test_import_updates_counts(self):
+        data = {
+            "categories": [{"id": self.category.id, "name": self.category.name}],
+            "goods": [
+                {
+                    "id": self.products[0].external_id,
+                    "category": self.category.id,
+                    "name": "Товар",
+                    "price": 10,
+                    "quantity": 1,
+                    "parameters": {"Цвет": "чёрный"},
+                },
+                {
+                    "id": "new",
+                    "category": self.category.id,
+                    "name": "Новый",
+                    "price": 10,
+                    "quantity": 1,
+                    "parameters": {"Цвет": "чёрный", "Экран": "15"},
+                },
+            ],
+        }
+        import_price_list(self.supplier, data)
+        self.assertCountsFresh()
+
+    def test_created_product_is_counted(self):
+        class CreatedProduct:
+            def save(serializer):
+                return make_product(self.supplier, self.category)
+
+        ProductViewSet().perform_create(CreatedProduct())
+        self.assertCountsFresh()
+
+        response = self.client.get("/api/products/facets/")
+        colors = next(
+            facet["values"]
+            for facet in response.data["facets"]
+            if facet["parameter"]["name"] == "Цвет"
+        )
+        self.assertEqual(sum(value["count"] for value in colors), 4)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user())
+        self.supplier = make_supplier()
+        self.category = Category.objects.create(name="Ноутбуки")
+        self.lenovo = make_product(
+            self.supplier, self.category, params=(), name="Lenovo ThinkPad"
+        )
+        self.case = make_product(
+            self.supplier,
+            Category.objects.create(name="Чехлы"),
+            params=("Совместимость",),
+            name="Чехол",
+        )
+        self.case.parameters.update(value="Lenovo ThinkPad")
+        catalog_changed.send(
+            sender=Product,
+            supplier_id=self.supplier.id,
+            product_ids=[self.lenovo.id, self.case.id],
+        )
+
+    def search(self, text):
+        response = self.client.get("/api/products/search/", {"q": text})
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.data["results"]]
+
+    def test_ranks_name_above_parameters(self):
+        self.assertEqual(self.search("thinkpad"), [self.lenovo.id, self.case.id])
+        # Префиксы слов, все слова обязательны
+        self.assertEqual(self.search("ноутб lenov"), [self.lenovo.id])
+        self.assertEqual(self.search("ноутбук чехол"), [])
+
+    def test_changes_are_reindexed(self):
+        response = self.client.patch(
+            f"/api/products/{self.lenovo.id}/", {"name": "Yoga"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search("yoga"), [self.lenovo.id])
+        self.assertEqual(self.search("thinkpad"), [self.case.id])
+
+        self.client.delete(f"/api/products/{self.lenovo.id}/")
+        self.assertEqual(self.search("yoga"), [])
+
+    def test_created_product_is_indexed(self):
+        class CreatedProduct:
+            def save(serializer):
+                return make_product(
+                    self.supplier, self.category, params=(), name="MacBook Air"
+                )
+
+        ProductViewSet().perform_create(CreatedProduct())
+        self.assertEqual(len(self.search("macbook")), 1)
+
+
+class PriceListImporterTests(TestCase):
+    def setUp(self):
+        registry.categories.clear()
+        registry.parameters.clear()
+        self.addCleanup(registry.categories.clear)
+        self.addCleanup(registry.parameters.clear)
+        self.supplier = make_supplier()
+
+    def price_list(self, *goods):
+        return {
+            "categories": [{"id": 501, "name": "Смартфоны"}],
+            "goods": [
+                {
+                    "id": external_id,
+                    "name": f"Товар {external_id}",
+                    "category": 501,
+                    "price": price,
+                    "quantity": 5,
+                    "parameters": parameters,
+                }
+                for external_id, price, parameters in goods
+            ],
+        }
+
+    def parameters(self, external_id):
+        return dict(
+            ProductParameter.objects.filter(
+                product__external_id=external_id
+            ).values_list("parameter__name", "value")
+        )
+
+    def test_upsert(self):
+        result = import_price_list(
+            self.supplier,
+            self.price_list(("a", 10, {"Цвет": "белый"}), ("b", 20, {})),
+        )
+        self.assertEqual(
+            (result["created"], result["updated"], result["unchanged"]), (2, 0, 0)
+        )
+        result = import_price_list(
+            self.supplier,
+            self.price_list(
+                ("a", "10.00", {"Цвет": "белый"}), ("b", 25, {}), ("c", 30, {})
+            ),
+        )
+        self.assertEqual(
+            (result["created"], result["updated"], result["unchanged"]), (1, 1, 1)
+        )
+        self.assertEqual(
+            dict(
+                Product.objects.filter(supplier=self.supplier).values_list(
+                    "external_id", "price"
+                )
+            ),
+            {"a": Decimal("10.00"), "b": Decimal("25.00"), "c": Decimal("30.00")},
+        )
+        self.assertEqual(Category.objects.get(id=501).name, "Смартфоны")
+
+    def test_parameter_values_are_replaced(self):
+        import_price_list(self.supplier, self.price_list(("a", 10, {"Цвет": "белый"})))
+        import_price_list(
+            self.supplier,
+            self.price_list(("a", 10, {"Цвет": "чёрный", "Вес": 150})),
+        )
+        self.assertEqual(self.parameters("a"), {"Цвет": "чёрный", "Вес": "150"})
+        self.assertEqual(Parameter.objects.filter(name="Цвет").count(), 1)
+        # Параметр, убранный из строки, удаляется
+        import_price_list(self.supplier, self.price_list(("a", 10, {"Вес": 150})))
+        self.assertEqual(self.parameters("a"), {"Вес": "150"})
+        import_price_list(self.supplier, self.price_list(("a", 10, {})))
+        self.assertEqual(self.parameters("a"), {})
+
+    def test_unchanged_rows_are_skipped_until_changed_elsewhere(self):
+        data = self.price_list(("a", 10, {"Цвет": "белый"}))
+        import_price_list(self.supplier, data)
+        self.assertEqual(import_price_list(self.supplier, data)["unchanged"], 1)
+
+        # Заказ списал остаток: тот же прайс должен его вернуть
+        product = Product.objects.get(supplier=self.supplier, external_id="a")
+        order = Order.objects.create(user=make_user(), status="confirmed")
+        OrderItem.objects.create(order=order, product=product, quantity=2)
+        deduct_order_stock(order)
+        product.refresh_from_db()
+        self.assertEqual((product.quantity, product.content_hash), (3, ""))
+        self.assertEqual(import_price_list(self.supplier, data)["updated"], 1)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 5)
+        self.assertEqual(import_price_list(self.supplier, data)["unchanged"], 1)
+
+        # Правка через API — тоже
+        client = APIClient()
+        client.force_authenticate(self.supplier.user)
+        client.patch(f"/api/products/{product.id}/", {"price": 99}, format="json")
+        self.assertEqual(import_price_list(self.supplier, data)["updated"], 1)
+        product.refresh_from_db()
+        self.assertEqual(product.price, Decimal("10.00"))
+
+    def test_mark_missing(self):
+        import_price_list(self.supplier, self.price_list(("a", 10, {}), ("b", 20, {})))
+        result = import_price_list(
+            self.supplier, self.price_list(("a", 10, {})), mark_missing=True
+        )
+        self.assertEqual(result["out_of_stock"], 1)
+        self.assertEqual(
+            Product.objects.get(supplier=self.supplier, external_id="b").quantity, 0
+        )
+
+    def test_error_row_rolls_back_whole_price_list(self):
+        data = self.price_list(("a", 10, {}), ("b", "дорого", {}))
+        with self.assertRaisesMessage(PriceListError, "должна быть числом"):
+            import_price_list(self.supplier, data)
+        self.assertFalse(Product.objects.filter(supplier=self.supplier).exists())
+
+    def test_non_finite_values_are_row_errors(self):
+        for field, value in (("price", "NaN"), ("quantity", float("inf"))):
+            data = self.price_list(("a", 10, {}))
+            data["goods"][0][field] = value
+            with self.subTest(field=field):
+                with self.assertRaises(PriceListError):
+                    import_price_list(self.supplier, data)
+
+    def test_malformed_price_list_is_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.supplier.user)
+        good = self.price_list(("a", 10, {}))["goods"][0]
+        category = {"id": 501, "name": "Смартфоны"}
+        cases = [
+            {"categories": 5, "goods": [good]},
+            {"categories": [{"id": 501, "name": ["Смартфоны"]}], "goods": [good]},
+            {"categories": [category], "goods": 5},
+            {"categories": [category], "goods": [dict(good, category=[501])]},
+            {"categories": [category], "goods": [dict(good, parameters=["Цвет"])]},
+            {"categories": [category], "goods": [dict(good, parameters={"": 1})]},
+            {"categories": [category], "goods": [dict(good, id={"a": 1})]},
+            {"categories": [category], "goods": [dict(good, name="x" * 256)]},
+            {"categories": [category], "goods": [dict(good, quantity=10**12)]},
+            {"categories": [category], "goods": [dict(good, price=10**9)]},
+            {"categories": [category], "goods": [dict(good, price="NaN")]},
+            {"categories": [category], "goods": [dict(good, price="-Infinity")]},
+            {"categories": [category], "goods": [dict(good, price="1e30")]},
+        ]
+        for data in cases:
+            with self.subTest(data=data):
+                response = client.post(
+                    "/api/supplier/upload-price/", data, format="json"
+                )
+                self.assertEqual(response.status_code, 400)
+                response = client.post(
+                    "/api/supplier/upload-price/?dry_run=1", data, format="json"
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.data["valid"])
+        self.assertFalse(Product.objects.filter(supplier=self.supplier).exists())
+
+
+class ImportProductsCommandTests(TestCase):
+    def setUp(self):
+        registry.categories.clear()
+        registry.parameters.clear()
+        self.addCleanup(registry.categories.clear)
+        self.addCleanup(registry.parameters.clear)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def price_file(self, shop, price=10):
+        path = os.path.join(self.directory, f"{shop}.json")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "shop": shop,
+                    "categories": [{"id": 801, "name": "Чайники"}],
+                    "goods": [
+                        {
+                            "id": 1,
+                            "name": "Чайник",
+                            "category": 801,
+                            "price": price,
+                            "quantity": 3,
+                        }
+                    ],
+                },
+                file,
+            )
+        return path
+
+    def call(self, *paths):
+        out, err = io.StringIO(), io.StringIO()
+        try:
+            call_command(
+                "import_products", *paths, "--workers", "1", stdout=out, stderr=err
+            )
+        finally:
+            self.out, self.err = out.getvalue(), err.getvalue()
+
+    def test_summary(self):
+        self.call(self.price_file("first"), self.price_file("second"))
+        self.assertIn("Импорт успешно завершён! Файлов: 2, строк: 2", self.out)
+
+    def test_failed_file_keeps_summary_of_others(self):
+        good, bad = self.price_file("good"), self.price_file("bad", price="дорого")
+        with self.assertRaisesMessage(CommandError, "Файлов: 1, строк: 1"):
+            self.call(bad, good)
+        self.assertIn(f"{good} (good, новый поставщик): строк 1, создано 1", self.out)
+        self.assertIn(f"{bad}: Цена товара", self.err)
+        self.assertTrue(Product.objects.filter(supplier__name="good").exists())
+        self.assertFalse(Product.objects.filter(supplier__name="bad").exists())
+
+    def test_unreadable_files_are_reported(self):
+        malformed = os.path.join(self.directory, "bad.json")
+        with open(malformed, "w", encoding="utf-8") as file:
+            file.write('{"shop": "bad", "goods": [')
+        no_shop = os.path.join(self.directory, "no_shop.json")
+        with open(no_shop, "w", encoding="utf-8") as file:
+            json.dump({"goods": []}, file)
+        missing = os.path.join(self.directory, "missing.json")
+        good = self.price_file("good")
+        with self.assertRaisesMessage(CommandError, "файлов с ошибками: 3"):
+            self.call(malformed, no_shop, missing, good)
+        self.assertIn(f"{good} (good, новый поставщик)", self.out)
+        for path in (malformed, no_shop, missing):
+            self.assertIn(f"{path}: ", self.err)
+
+
+class JSONStreamTests(SimpleTestCase):
+    document = {
+        "meta": {"version": 12.75, "note": 'кавычка " и скобки ]}'},
+        "ratio": -1.5e3,
+        "categories": [{"id": 1, "name": "Чайники"}],
+        "goods": [
+            12.75,
+            -0.5e-3,
+            100,
+            'строка с "кавычкой" и ]',
+            {"id": 7, "price": 12.75, "name": "Чайник"},
+            True,
+            None,
+            [1, 2.5],
+        ],
+    }
+
+    def test_read_size_sweep(self):
+        raw = json.dumps(self.document, ensure_ascii=False).encode("utf-8")
+        for read_size in range(1, len(raw) + 1):
+            with self.subTest(read_size=read_size):
+                for key in ("goods", "categories"):
+                    self.assertEqual(
+                        list(iter_array(io.BytesIO(raw), key, read_size)),
+                        self.document[key],
+                    )
+
+    def test_missing_key(self):
+        self.assertEqual(list(iter_array(io.BytesIO(b'{"goods": [1]}'), "x")), [])
+
+    def test_invalid_document(self):
+        for raw in (b'{"goods": [1,', b'{"goods": [12.7.5]}', b"[1]"):
+            with self.subTest(raw=raw), self.assertRaises(JSONStreamError):
+                list(iter_array(io.BytesIO(raw), "goods", read_size=3))
+
+    def test_malformed_value_is_not_buffered_to_the_end(self):
+        for raw in (
+            b'{"goods": [{"id": 1 "name": "' + b"x" * 100_000 + b'"}]}',
+            b'{"skipped": "' + b"x" * 100_000,
+        ):
+            with self.subTest(raw=raw[:20]):
+                stream = io.BytesIO(raw)
+                with self.assertRaises(JSONStreamError):
+                    list(
+                        iter_array(stream, "goods", read_size=100, max_value_size=1000)
+                    )
+                # Ошибка — как только значение переросло предел
+                self.assertLess(stream.tell(), 2000)
+
+
+class PriceListFileResumeTests(TestCase):
+    def setUp(self):
+        registry.categories.clear()
+        registry.parameters.clear()
+        self.addCleanup(registry.categories.clear)
+        self.addCleanup(registry.parameters.clear)
+        goods = [
+            {
+                "id": n,
+                "name": f"Товар {n}",
+                "category": 601,
+                "price": 12.75 + n,
+                "quantity": 10 * n,
+                "parameters": {"Вес": 1.5 * n},
+            }
+            for n in range(1, 8)
+        ]
+        self.raw = json.dumps(
+            {"categories": [{"id": 601, "name": "Чайники"}], "goods": goods},
+            ensure_ascii=False,
+        ).encode("utf-8")
+        self.expected = {
+            str(good["id"]): (Decimal(str(good["price"])), good["quantity"])
+            for good in goods
+        }
+
+    def test_resume_with_any_read_size(self):
+        def interrupt(upload):
+            raise RuntimeError("сбой после пачки")
+
+        for read_size in (1, 2, 3, 5, 8, 13, 64, 4096):
+            with self.subTest(read_size=read_size):
+                supplier = make_supplier()
+                upload = get_price_list_upload(supplier, "checksum")
+                with self.assertRaises(RuntimeError):
+                    import_price_list_file(
+                        upload,
+                        io.BytesIO(self.raw),
+                        chunk_size=3,
+                        on_chunk=interrupt,
+                        read_size=read_size,
+                    )
+                upload = get_price_list_upload(supplier, "checksum")
+                result = import_price_list_file(
+                    upload, io.BytesIO(self.raw), chunk_size=3, read_size=read_size
+                )
+                self.assertEqual(
+                    (result["resumed_from"], result["rows"], result["created"]),
+                    (3, 4, 7),
+                )
+                products = Product.objects.filter(supplier=supplier)
+                self.assertEqual(
+                    {
+                        external_id: (price, quantity)
+                        for external_id, price, quantity in products.values_list(
+                            "external_id", "price", "quantity"
+                        )
+                    },
+                    self.expected,
+                )
+
+    @mock.patch("core.importer.PROGRESS_ROWS", 2)
+    def test_progress_is_reported_while_skipping(self):
+        supplier = make_supplier()
+        upload = get_price_list_upload(supplier, "checksum")
+        upload.rows_done = 5
+        upload.save()
+        reported = []
+
+        def interrupt(upload):
+            reported.append(upload.rows_done)
+            raise ImportInterrupted
+
+        with self.assertRaises(ImportInterrupted):
+            import_price_list_file(
+                upload, io.BytesIO(self.raw), chunk_size=3, on_progress=interrupt
+            )
+        # Остановлена ещё на пропуске записанных строк и не помечена упавшей
+        self.assertEqual(reported, [5])
+        upload.refresh_from_db()
+        self.assertEqual((upload.status, upload.rows_done), ("in_progress", 5))
+
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        registry.categories.clear()
+        registry.parameters.clear()
+        self.addCleanup(registry.categories.clear)
+        self.addCleanup(registry.parameters.clear)
+        jobs_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(jobs_dir.cleanup)
+        settings_override = override_settings(IMPORT_JOBS_DIR=jobs_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.supplier = make_supplier()
+
+    def enqueue(self, supplier=None):
+        raw = json.dumps(
+            {
+                "categories": [{"id": 701, "name": "Чайники"}],
+                "goods": [
+                    {
+                        "id": n,
+                        "name": f"Чайник {n}",
+                        "category": 701,
+                        "price": 10,
+                        "quantity": 1,
+                    }
+                    for n in range(3)
+                ],
+            }
+        ).encode("utf-8")
+        return enqueue_price_list(supplier or self.supplier, io.BytesIO(raw))
+
+    def make_stale(self, job):
+        ImportJob.objects.filter(id=job.id).update(
+            heartbeat_at=timezone.now() - timedelta(days=1)
+        )
+
+    def test_claim_order(self):
+        first, second = self.enqueue(), self.enqueue()
+        other = self.enqueue(make_supplier())
+        self.assertEqual(claim_job("w1").id, first.id)
+        # Второе задание поставщика ждёт первое
+        self.assertEqual(claim_job("w2").id, other.id)
+        self.assertIsNone(claim_job("w3"))
+        run_job(ImportJob.objects.get(id=first.id))
+        self.assertEqual(claim_job("w3").id, second.id)
+
+    def test_run_job(self):
+        self.enqueue()
+        job = run_job(claim_job("w1"))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result["created"]), ("done", 3))
+        self.assertFalse(os.path.exists(job.path))
+        self.assertEqual(Product.objects.filter(supplier=self.supplier).count(), 3)
+
+    def test_full_price_list_in_queue_marks_missing(self):
+        self.enqueue()
+        run_job(claim_job("w1"))
+        client = APIClient()
+        client.force_authenticate(self.supplier.user)
+        response = client.post(
+            "/api/supplier/upload-price/?async=1&full=1",
+            {
+                "categories": [{"id": 701, "name": "Чайники"}],
+                "goods": [
+                    {
+                        "id": 0,
+                        "name": "Чайник 0",
+                        "category": 701,
+                        "price": 10,
+                        "quantity": 1,
+                    }
+                ],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 202)
+        job = run_job(claim_job("w1"))
+        self.assertEqual((job.status, job.result["out_of_stock"]), ("done", 2))
+        self.assertEqual(
+            dict(
+                Product.objects.filter(supplier=self.supplier).values_list(
+                    "external_id", "quantity"
+                )
+            ),
+            {"0": 1, "1": 0, "2": 0},
+        )
+
+    def test_requeue_stale(self):
+        job = self.enqueue()
+        claim_job("w1")
+        self.assertEqual(requeue_stale_jobs(), 0)
+        self.make_stale(job)
+        self.assertEqual(requeue_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), ("queued", ""))
+
+    def test_lost_job_is_not_finished_by_old_worker(self):
+        self.enqueue()
+        job = claim_job("w1")
+        self.make_stale(job)
+        requeue_stale_jobs()
+        self.assertEqual(claim_job("w2").id, job.id)
+
+        with self.assertLogs("core.jobs", "WARNING"):
+            run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), ("running", "w2"))
+        self.assertTrue(os.path.exists(job.path))
+
+    def test_worker_stops_when_job_is_taken_over(self):
+        self.enqueue()
+        job = claim_job("w1")
+
+        def import_file(upload, fileobj, on_chunk, **kwargs):
+            # Пока воркер грузит пачку, задание отдают другому
+            self.make_stale(job)
+            requeue_stale_jobs()
+            claim_job("w2")
+            on_chunk(upload)
+            self.fail("Воркер продолжил загрузку чужого задания")
+
+        with mock.patch(
+            "core.jobs.import_price_list_file", import_file
+        ), self.assertLogs("core.jobs", "WARNING"):
+            run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker, job.error), ("running", "w2", ""))
+        self.assertTrue(os.path.exists(job.path))
+
+    @override_settings(PRICE_LIST_CHUNK_SIZE=1)
+    def test_lost_job_leaves_upload_to_new_owner(self):
+        self.enqueue()
+        job = claim_job("w1")
+        save_batch = PriceListImporter.save_batch
+
+        def take_over(importer, *args):
+            save_batch(importer, *args)
+            # Пачка записывается дольше срока — задание отдают другому
+            self.make_stale(job)
+            requeue_stale_jobs()
+            claim_job("w2")
+
+        with mock.patch.object(
+            PriceListImporter, "save_batch", take_over
+        ), self.assertLogs("core.jobs", "WARNING"):
+            run_job(job)
+        upload = PriceListUpload.objects.get()
+        self.assertEqual((upload.status, upload.rows_done), ("in_progress", 1))
+
+
+class SparseFieldsTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name="Смартфоны")
+        self.product = make_product(make_supplier(), self.category, params=())
+        self.order = Order.objects.create(user=self.user, status="new")
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2)
+
+    def test_product_list(self):
+        response = self.client.get(
+            "/api/products/?fields=id,name,category&include=categories"
+        )
+        self.assertEqual(
+            response.data["results"],
+            [
+                {
+                    "id": self.product.id,
+                    "name": self.product.name,
+                    "category": self.category.id,
+                }
+            ],
+        )
+        self.assertEqual(
+            response.data["included"]["categories"],
+            [{"id": self.category.id, "name": "Смартфоны"}],
+        )
+
+    def test_product_retrieve(self):
+        response = self.client.get(
+            f"/api/products/{self.product.id}/?fields=name,category.name"
+        )
+        self.assertEqual(
+            response.data,
+            {"name": self.product.name, "category": {"name": "Смартфоны"}},
+        )
+
+    def test_product_search(self):
+        catalog_changed.send(
+            sender=Product,
+            supplier_id=self.product.supplier_id,
+            product_ids=[self.product.id],
+        )
+        response = self.client.get(
+            "/api/products/search/",
+            {"q": self.product.name, "fields": "id,supplier", "include": "suppliers"},
+        )
+        [found] = response.data["results"]
+        self.assertEqual(set(found), {"id", "supplier", "rank"})
+        self.assertEqual(found["supplier"], self.product.supplier_id)
+        self.assertEqual(
+            [supplier["id"] for supplier in response.data["included"]["suppliers"]],
+            [self.product.supplier_id],
+        )
+
+    def test_order_list_nested_fields(self):
+        response = self.client.get(
+            "/api/orders/?fields=id,items.quantity,items.product.name"
+        )
+        self.assertEqual(
+            response.data["results"],
+            [
+                {
+                    "id": self.order.id,
+                    "items": [{"quantity": 2, "product": {"name": self.product.name}}],
+                }
+            ],
+        )
+
+    def test_order_items_include_products(self):
+        response = self.client.get("/api/order-items/?include=products")
+        self.assertEqual(
+            [item["product"] for item in response.data["results"]], [self.product.id]
+        )
+        product = response.data["included"]["products"][0]
+        self.assertEqual(product["id"], self.product.id)
+        # Вынесенные объекты отдаются со всеми полями
+        self.assertEqual(product["category"]["name"], "Смартфоны")
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user())
+        self.supplier = make_supplier()
+        self.category = Category.objects.create(name="Ноутбуки")
+        self.products = [
+            make_product(self.supplier, self.category, params=("Цвет",))
+            for _ in range(3)
+        ]
+        catalog_changed.send(
+            sender=Product,
+            supplier_id=self.supplier.id,
+            product_ids=[product.id for product in self.products],
+        )
+
+    def export(self, **params):
+        response = self.client.get("/api/products/export/", params)
+        self.assertEqual(response.status_code, 200)
+        content = b"".join(response.streaming_content).decode("utf-8")
+        return response, content
+
+    def ndjson(self, **params):
+        response, content = self.export(**params)
+        return response, [json.loads(line) for line in content.splitlines()]
+
+    def test_full_export(self):
+        response, records = self.ndjson()
+        self.assertEqual(
+            [record["id"] for record in records],
+            [product.id for product in self.products],
+        )
+        self.assertEqual(records[0]["parameters"][0]["parameter"]["name"], "Цвет")
+        self.assertEqual(
+            response.headers["X-Catalog-Version"],
+            str(get_catalog_version()[0]),
+        )
+
+    def test_since_reports_changed_and_deleted_products(self):
+        changed, deleted, unchanged = self.products
+        since = get_catalog_version()[0]
+        self.client.patch(
+            f"/api/products/{changed.id}/", {"name": "Новое"}, format="json"
+        )
+        self.client.delete(f"/api/products/{deleted.id}/")
+
+        response, records = self.ndjson(since=since)
+        self.assertEqual([record["id"] for record in records], [changed.id, deleted.id])
+        self.assertEqual(records[0]["name"], "Новое")
+        self.assertTrue(records[1]["deleted"])
+        self.assertEqual(records[1]["supplier_id"], self.supplier.id)
+        # Следующая выгрузка с новой версией ничего не повторяет
+        response, records = self.ndjson(since=response.headers["X-Catalog-Version"])
+        self.assertEqual(records, [])
+
+    def test_deleted_products_follow_filters(self):
+        since = get_catalog_version()[0]
+        self.client.delete(f"/api/products/{self.products[0].id}/")
+        other = make_supplier()
+        self.assertEqual(self.ndjson(since=since, supplier=other.id)[1], [])
+        self.assertEqual(len(self.ndjson(since=since, supplier=self.supplier.id)[1]), 1)
+
+    def test_category_deletion(self):
+        since = get_catalog_version()[0]
+        self.client.delete(f"/api/categories/{self.category.id}/")
+        response, records = self.ndjson(since=since)
+        self.assertEqual(
+            [(record["id"], record["deleted"]) for record in records],
+            [(product.id, True) for product in self.products],
+        )
+
+    def test_csv(self):
+        since = get_catalog_version()[0]
+        self.client.patch(
+            f"/api/products/{self.products[0].id}/", {"name": "Новое"}, format="json"
+        )
+        self.client.delete(f"/api/products/{self.products[1].id}/")
+        response, content = self.export(output="csv", since=since)
+        rows = list(csv.DictReader(content.splitlines()))
+        self.assertEqual(
+            [(row["id"], row["name"], row["deleted"]) for row in rows],
+            [
+                (str(self.products[0].id), "Новое", ""),
+                (str(self.products[1].id), "", "1"),
+            ],
+        )
+        self.assertEqual(json.loads(rows[0]["parameters"]), {"Цвет": ANY})
+
+    def test_invalid_parameters(self):
+        response = self.client.get("/api/products/export/", {"output": "xml"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get("/api/products/export/", {"since": "вчера"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ConditionalCatalogTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(make_user())
+        self.product = make_product(make_supplier(), Category.objects.create(name="К"))
+        bump_catalog_version()
+
+    def test_unchanged_version_is_answered_by_version_query(self):
+        response = self.client.get("/api/products/")
+        self.assertEqual(response.status_code, 200)
+        # Только чтение версии каталога
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                "/api/products/", HTTP_IF_NONE_MATCH=response.headers["ETag"]
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_object_is_not_modified_only_if_it_exists(self):
+        url = f"/api/products/{self.product.id}/"
+        etag = self.client.get(url).headers["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get("/api/products/999999/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("ETag", response.headers)
+
+
+@override_settings(CATALOG_CACHE_ENABLED=True)
+class CatalogCacheInvalidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_cache.lru.clear()
+        self.addCleanup(catalog_cache.lru.clear)
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.supplier = make_supplier()
+        self.product = make_product(
+            self.supplier, Category.objects.create(name="К"), params=()
+        )
+        self.url = f"/api/products/{self.product.id}/"
+        self.list_url = f"/api/products/?supplier={self.supplier.id}"
+
+    def quantities(self):
+        return (
+            self.client.get(self.url).data["quantity"],
+            self.client.get(self.list_url).data["results"][0]["quantity"],
+        )
+
+    def test_product_update(self):
+        self.assertEqual(self.client.get(self.url).data["name"], self.product.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {"name": "Новое"}, format="json")
+        self.assertEqual(self.client.get(self.url).data["name"], "Новое")
+
+    def test_invalidation_from_another_process(self):
+        self.client.get(self.url)
+        # Другой процесс меняет товар и версию тега в общем кэше
+        Product.objects.filter(pk=self.product.pk).update(name="Новое")
+        catalog_cache.invalidate([f"product:{self.product.pk}"])
+        self.assertEqual(self.client.get(self.url).data["name"], "Новое")
+
+    def test_order_confirmation_updates_stock(self):
+        self.assertEqual(self.quantities(), (10, 10))
+        order = Order.objects.create(user=self.user, status="new")
+        OrderItem.objects.create(order=order, product=self.product, quantity=3)
+        code = OrderConfirmationCode.objects.create(
+            order=order,
+            code="123456",
+            expires_at=timezone.now() + timedelta(minutes=15),
+        )
+        Basket.objects.create(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/api/orders/confirm/",
+                {"order_id": order.id, "confirmation_code": code.code},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), (7, 7))
+
+    def test_confirmation_without_stock_is_rejected(self):
+        other = make_product(self.supplier, self.product.category, params=())
+        order = Order.objects.create(user=self.user, status="new")
+        OrderItem.objects.create(order=order, product=other, quantity=3)
+        # Пока заказ ждал подтверждения, товар раскупили
+        OrderItem.objects.create(order=order, product=self.product, quantity=11)
+        OrderConfirmationCode.objects.create(
+            order=order,
+            code="123456",
+            expires_at=timezone.now() + timedelta(minutes=15),
+        )
+        Basket.objects.create(user=self.user)
+        response = self.client.post(
+            "/api/orders/confirm/",
+            {"order_id": order.id, "confirmation_code": "123456"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("доступно: 10", response.data["error"])
+        order.refresh_from_db()
+        self.assertEqual(order.status, "new")
+        # Ничего не списано, в том числе по другим позициям
+        self.assertEqual(
+            list(Product.objects.order_by("pk").values_list("quantity", flat=True)),
+            [10, 10],
+        )
+
+    def assertSupplierListRefreshed(self, change, read):
+        response = self.client.get(self.list_url)
+        etag = response.headers["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(read(response.data["results"][0]), "Новое")
+
+    def test_category_rename_refreshes_supplier_list(self):
+        self.assertSupplierListRefreshed(
+            lambda: self.client.patch(
+                f"/api/categories/{self.product.category_id}/",
+                {"name": "Новое"},
+                format="json",
+            ),
+            lambda product: product["category"]["name"],
+        )
+
+    def test_parameter_rename_refreshes_supplier_list(self):
+        registry.parameters.clear()
+        self.addCleanup(registry.parameters.clear)
+        parameter = Parameter.objects.create(name="Цвет")
+        ProductParameter.objects.create(
+            product=self.product, parameter=parameter, value="красный"
+        )
+        self.assertSupplierListRefreshed(
+            lambda: self.client.patch(
+                f"/api/parameters/{parameter.id}/", {"name": "Новое"}, format="json"
+            ),
+            lambda product: product["parameters"][0]["parameter"]["name"],
+        )
+
+    def test_lru_entries_expire(self):
+        lru = LRUCache(10, timeout=0)
+        lru.set("key", "value")
+        self.assertIsNone(lru.get("key"))
+        lru = LRUCache(10)
+        lru.set("key", "value")
+        self.assertEqual(lru.get("key"), "value")
+
+    def test_process_local_backend_is_reported(self):
+        self.assertEqual(
+            [error.id for error in check_catalog_cache(None)], ["core.W001"]
+        )
+        with self.settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.redis.RedisCache",
+                    "LOCATION": "redis://127.0.0.1:6379/1",
+                }
+            }
+        ):
+            self.assertEqual(check_catalog_cache(None), [])
@@ -0,0 +1,150 @@
+# Тело загрузки прайс-листа: JSON как есть, сжатый gzip или zstd
+# (заголовок Content-Encoding) или файл из multipart/form-data (поле
+# "file", сжатие — по расширению .gz / .zst). Сырые байты копируются во
+# временный файл блоками, распаковка идёт на лету при чтении: в памяти —
+# только текущий блок.
+
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+
+from django.conf import settings
+
+from .jsonstream import JSONStreamError
+
+try:
+    import zstandard
+except ImportError:  # zstd — только при установленном zstandard
+    zstandard = None
+
+SPOOL_BLOCK_SIZE = 1024 * 1024
+
+FILE_FIELD = "file"
+
+_EXTENSIONS = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+
+# Атрибут запроса с результатом spool_upload: тело читается один раз
+_SPOOLED = "_spooled_upload"
+
+
+class UploadError(Exception):
+    """Тело запроса в таком виде не принимается (ответ 415)."""
+
+
+def is_multipart(request):
+    return request.content_type.startswith("multipart/form-data")
+
+
+def upload_encoding(request):
+    """Сжатие тела запроса: "identity", "gzip" или "zstd"."""
+    if is_multipart(request):
+        upload = request.FILES.get(FILE_FIELD)
+        extension = os.path.splitext(upload.name)[1].lower() if upload else ""
+        encoding = _EXTENSIONS.get(extension, "identity")
+    else:
+        encoding = request.headers.get("Content-Encoding", "identity").lower()
+    if encoding not in ("identity", "gzip", "zstd"):
+        raise UploadError(f"Сжатие {encoding} не поддерживается")
+    if encoding == "zstd" and zstandard is None:
+        raise UploadError("Сжатие zstd не поддерживается: не установлен zstandard")
+    return encoding
+
+
+def is_large(request):
+    """Тело больше DATA_UPLOAD_MAX_MEMORY_SIZE — в память его не читаем."""
+    length = int(request.META.get("CONTENT_LENGTH") or 0)
+    limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    return limit is not None and length > limit
+
+
+def is_file_upload(request):
+    """Тело нужно читать потоком, а не через request.data."""
+    return (
+        is_multipart(request)
+        or upload_encoding(request) != "identity"
+        or is_large(request)
+    )
+
+
+def raw_upload(request):
+    """Сырой (ещё сжатый) поток тела или загруженный файл; None — тела нет."""
+    if is_multipart(request):
+        return request.FILES.get(FILE_FIELD)
+    spooled = getattr(request, _SPOOLED, None)
+    if spooled is not None:
+        # Тело уже прочитано в spool_upload
+        spooled[0].seek(0)
+        return spooled[0]
+    return request.stream
+
+
+def spool_upload(request):
+    """
+    (файл, sha256) с сырыми байтами тела.
+
+    Файл из multipart Django уже хранит на диске (если он больше
+    FILE_UPLOAD_MAX_MEMORY_SIZE) — его только дочитываем ради контрольной
+    суммы. Тело запроса копируется во временный файл. Повторный вызов для
+    того же запроса (core.idempotency сверяет тело по этой же сумме)
+    возвращает уже готовый результат.
+    """
+    spooled = getattr(request, _SPOOLED, None)
+    if spooled is not None:
+        spooled[0].seek(0)
+        return spooled
+
+    stream = raw_upload(request)
+    checksum = hashlib.sha256()
+    if is_multipart(request):
+        for block in stream.chunks(SPOOL_BLOCK_SIZE):
+            checksum.update(block)
+        stream.seek(0)
+        spool = stream
+    else:
+        spool = tempfile.TemporaryFile()
+        for block in iter(lambda: stream.read(SPOOL_BLOCK_SIZE), b""):
+            checksum.update(block)
+            spool.write(block)
+        spool.seek(0)
+    spooled = spool, checksum.hexdigest()
+    setattr(request, _SPOOLED, spooled)
+    return spooled
+
+
+def decompressed(fileobj, encoding):
+    """Файл с распакованным содержимым ``fileobj``."""
+    if encoding == "identity":
+        return fileobj
+    return DecompressedFile(fileobj, encoding)
+
+
+class DecompressedFile:
+    """
+    Распаковка на лету. seek(0) начинает распаковку сначала: потоковому
+    импорту (core.importer) нужно несколько проходов по файлу.
+    """
+
+    def __init__(self, fileobj, encoding):
+        self.file = fileobj
+        self.encoding = encoding
+        self.reader = self._open()
+
+    def _open(self):
+        if self.encoding == "gzip":
+            return gzip.GzipFile(fileobj=self.file, mode="rb")
+        return zstandard.ZstdDecompressor().stream_reader(self.file, closefd=False)
+
+    def read(self, size=-1):
+        try:
+            return self.reader.read(size)
+        except (OSError, EOFError, getattr(zstandard, "ZstdError", OSError)) as error:
+            raise JSONStreamError(f"Не удалось распаковать тело запроса: {error}")
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if offset or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Поддерживается только seek(0)")
+        self.file.seek(0)
+        self.reader = self._open()
+        return 0
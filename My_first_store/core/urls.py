@@ -19,5 +19,10 @@ urlpatterns = [
         views.update_order_status_view,
         name="update-order-status",
     ),
+    path(
+        "api/catalog/cache-stats/",
+        views.catalog_cache_stats_view,
+        name="catalog-cache-stats",
+    ),
     path("api/", include(router.urls)),
 ]
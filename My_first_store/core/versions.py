@@ -0,0 +1,82 @@
+# Версии каталога для условных GET (ETag / Last-Modified) и выгрузки
+# изменений. Любая запись в каталог увеличивает глобальную версию и версию
+# затронутого поставщика (или справочника категорий и параметров —
+# по ней сверяется core.registry, который глобальную версию не трогает);
+# изменённые товары
+# помечаются новой глобальной версией, удалённые — записью DeletedProduct
+# с той же версией.
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import CatalogVersion, DeletedProduct
+
+GLOBAL_SCOPE = "global"
+CATEGORIES_SCOPE = "categories"
+PARAMETERS_SCOPE = "parameters"
+
+
+def supplier_scope(supplier_id):
+    return f"supplier:{supplier_id}"
+
+
+def bump_catalog_version(*scopes):
+    """Увеличивает глобальную версию и версии ``scopes``; возвращает глобальную."""
+    scopes = {GLOBAL_SCOPE, *scopes}
+    now = timezone.now()
+    with transaction.atomic():
+        CatalogVersion.objects.bulk_create(
+            [CatalogVersion(scope=scope) for scope in scopes], ignore_conflicts=True
+        )
+        CatalogVersion.objects.filter(scope__in=scopes).update(
+            version=F("version") + 1, updated_at=now
+        )
+        return CatalogVersion.objects.values_list("version", flat=True).get(
+            scope=GLOBAL_SCOPE
+        )
+
+
+def bump_scope_version(scope):
+    """
+    Увеличивает версию одной области, без глобальной; возвращает её. Для
+    core.registry: новая запись справочника ответы о товарах не меняет.
+    """
+    versions = CatalogVersion.objects.filter(scope=scope)
+    now = timezone.now()
+    with transaction.atomic():
+        if not versions.update(version=F("version") + 1, updated_at=now):
+            CatalogVersion.objects.bulk_create(
+                [CatalogVersion(scope=scope)], ignore_conflicts=True
+            )
+            versions.update(version=F("version") + 1, updated_at=now)
+        return versions.values_list("version", flat=True).get()
+
+
+def record_deleted_products(products):
+    """
+    Запоминает удаляемые товары (queryset) для выгрузки изменений. Вызывается
+    до удаления; версию проставит catalog_changed с id этих товаров.
+    """
+    rows = products.values_list("id", "external_id", "supplier_id", "category_id")
+    DeletedProduct.objects.bulk_create(
+        [
+            DeletedProduct(
+                product_id=product_id,
+                external_id=external_id,
+                supplier_id=supplier_id,
+                category_id=category_id,
+            )
+            for product_id, external_id, supplier_id, category_id in rows
+        ]
+    )
+
+
+def get_catalog_version(scope=GLOBAL_SCOPE):
+    """(версия, время изменения) для области; (0, None), если записей не было."""
+    row = (
+        CatalogVersion.objects.filter(scope=scope)
+        .values_list("version", "updated_at")
+        .first()
+    )
+    return row or (0, None)
@@ -1,9 +1,10 @@
 from .models import User
 from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from .models import (
     Supplier,
     Category,
+    DeletedProduct,
     Product,
     Parameter,
     ProductParameter,
@@ -22,10 +23,191 @@ from .serializers import (
     OrderSerializer,
     OrderItemSerializer,
     UserSerializer,
+    build_included,
+    sparse_context,
 )
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from . import fast_serializers
+from .cache import catalog_cache
+from .export import EXPORTERS, FORMATS
+from .facets import add_facets, facet_counts, track_facets
+from .filters import ProductFilterBackend
+from .pagination import KeysetPagination
+from .search import search_products
+from .versions import (
+    CATEGORIES_SCOPE,
+    GLOBAL_SCOPE,
+    get_catalog_version,
+    record_deleted_products,
+    supplier_scope,
+)
+from .signals import catalog_changed, product_suppliers
+from .querysets import (
+    order_items_for_serializer,
+    orders_for_serializer,
+    prefetch_order,
+    products_for_serializer,
+)
+
+
+class CachedCatalogMixin:
+    """Отдаёт list/retrieve через read-through кэш каталога (core.cache)."""
+
+    def get_cache_tags(self, request):
+        """
+        Теги ответа (core.cache): его сбрасывает изменение любого из них.
+        По умолчанию — "products", который сбрасывает любое изменение
+        каталога; view с более узкими тегами переопределяют метод.
+        """
+        return ["products"]
+
+    def cached_response(self, request, render):
+        response = None
+
+        def compute():
+            nonlocal response
+            response = render()
+            # Кэшируем только успешные ответы
+            return response.data if response.status_code == 200 else None
+
+        data = catalog_cache.get_or_set(
+            request.get_full_path(), self.get_cache_tags(request), compute
+        )
+        return response if response is not None else Response(data)
+
+    def list(self, request, *args, **kwargs):
+        render = super().list
+        return self.cached_response(request, lambda: render(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        render = super().retrieve
+        return self.cached_response(request, lambda: render(request, *args, **kwargs))
+
+
+class ConditionalCatalogMixin:
+    """
+    Условные GET для list/retrieve по версии каталога (core.versions).
+
+    Если версия не менялась, список получает 304 без обращения к таблицам
+    товаров; объект — после проверки, что он существует (иначе 404).
+    """
+
+    def get_version_scope(self, request):
+        return GLOBAL_SCOPE
+
+    def object_exists(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            return queryset.filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            ).exists()
+        except (TypeError, ValueError, ValidationError):
+            return False
+
+    def conditional_response(self, request, render):
+        scope = self.get_version_scope(request)
+        version, updated_at = get_catalog_version(scope)
+        etag = quote_etag(f"{scope}-{version}")
+        last_modified = int(updated_at.timestamp()) if updated_at else None
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = render()
+        if response.status_code in (200, 304):
+            response.headers["ETag"] = etag
+            if last_modified is not None:
+                response.headers["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        render = super().list
+        return self.conditional_response(
+            request, lambda: render(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        render = super().retrieve
+        if not self.object_exists():
+            # Версия каталога общая: 304 не должен скрывать 404
+            return render(request, *args, **kwargs)
+        return self.conditional_response(
+            request, lambda: render(request, *args, **kwargs)
+        )
+
+
+class SparseFieldsViewMixin:
+    """
+    Поддержка ``?fields=`` и ``?include=`` в list/retrieve.
+
+    Вынесенные связи отдаются один раз в ключе "included" ответа.
+    """
+
+    def get_serializer_context(self):
+        # Один контекст на запрос: в нём копятся вынесенные объекты
+        if getattr(self, "_sparse_context", None) is None:
+            self._sparse_context = sparse_context(
+                self.request, format=self.format_kwarg, view=self
+            )
+        return self._sparse_context
+
+    def with_included(self, response):
+        included = build_included(self.get_serializer_context())
+        if included is None or response.status_code != 200:
+            return response
+        if isinstance(response.data, dict) and "results" in response.data:
+            response.data["included"] = included
+        elif isinstance(response.data, list):
+            response.data = {"results": response.data, "included": included}
+        else:
+            response.data = {"data": response.data, "included": included}
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.with_included(super().list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.with_included(super().retrieve(request, *args, **kwargs))
+
+
+class FastSerializationMixin:
+    """
+    Быстрый путь list через core.fast_serializers вместо ModelSerializer.
+
+    Эндпоинт включается в settings.FAST_SERIALIZATION_ENDPOINTS; запросы
+    с ``?fields=`` или ``?include=`` идут обычным путём.
+    """
+
+    fast_endpoint = None
+    # queryset → строки .values() и страница строк → данные ответа
+    fast_rows = None
+    fast_serialize = None
+
+    def use_fast_serialization(self, request):
+        params = request.query_params
+        return (
+            fast_serializers.is_enabled(self.fast_endpoint)
+            and "fields" not in params
+            and "include" not in params
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_fast_serialization(request):
+            return super().list(request, *args, **kwargs)
+        rows = self.fast_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.fast_serialize(page))
+        return Response(self.fast_serialize(rows))
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -44,31 +226,241 @@ class SupplierViewSet(viewsets.ModelViewSet):
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
+    keyset_ordering_fields = ("id", "name")
+
+    def perform_update(self, serializer):
+        supplier = serializer.save()
+        # Данные поставщика вложены в ответы его товаров
+        catalog_changed.send(sender=Supplier, supplier_id=supplier.id)
 
+    def perform_destroy(self, instance):
+        # Товары поставщика удаляются каскадно
+        products = Product.objects.filter(supplier=instance)
+        product_ids = list(products.values_list("id", flat=True))
+        with track_facets(products):
+            record_deleted_products(products)
+            instance.delete()
+            catalog_changed.send(
+                sender=Supplier, supplier_id=instance.pk, product_ids=product_ids
+            )
 
-class OrderViewSet(viewsets.ModelViewSet):
+
+class OrderViewSet(
+    SparseFieldsViewMixin, FastSerializationMixin, viewsets.ModelViewSet
+):
     """API эндпоинт для управления заказами."""
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    # Новые заказы — первыми
+    keyset_ordering = "-id"
+    fast_endpoint = "orders"
+    fast_rows = staticmethod(fast_serializers.order_rows)
+    fast_serialize = staticmethod(fast_serializers.serialize_orders)
 
     def get_queryset(self):
         # Показываем только заказы текущего пользователя
-        return Order.objects.filter(user=self.request.user)
+        return orders_for_serializer(Order.objects.filter(user=self.request.user))
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(
+    ConditionalCatalogMixin, CachedCatalogMixin, viewsets.ModelViewSet
+):
     """API эндпоинт для просмотра категорий."""
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
+    keyset_ordering_fields = ("id", "name")
+
+    def get_cache_tags(self, request):
+        return ["categories"]
+
+    def get_version_scope(self, request):
+        return CATEGORIES_SCOPE
+
+    def perform_create(self, serializer):
+        serializer.save()
+        catalog_changed.send(sender=Category)
+
+    def perform_update(self, serializer):
+        category = serializer.save()
+        product_ids, supplier_ids = product_suppliers(category.products.all())
+        # Название категории входит в поисковый документ и ответы её товаров,
+        # в том числе в списки их поставщиков
+        catalog_changed.send(
+            sender=Category, product_ids=product_ids, supplier_ids=supplier_ids
+        )
+
+    def perform_destroy(self, instance):
+        # Товары категории удаляются каскадно
+        product_ids, supplier_ids = product_suppliers(instance.products.all())
+        with track_facets(Product.objects.filter(category=instance)):
+            record_deleted_products(instance.products.all())
+            instance.delete()
+            catalog_changed.send(
+                sender=Category, product_ids=product_ids, supplier_ids=supplier_ids
+            )
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(
+    ConditionalCatalogMixin,
+    CachedCatalogMixin,
+    SparseFieldsViewMixin,
+    FastSerializationMixin,
+    viewsets.ModelViewSet,
+):
     """API эндпоинт для просмотра товаров."""
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    pagination_class = KeysetPagination
+    keyset_ordering_fields = ("id", "price", "name")
+    filter_backends = [ProductFilterBackend]
+    fast_endpoint = "products"
+    fast_rows = staticmethod(fast_serializers.product_rows)
+    fast_serialize = staticmethod(fast_serializers.serialize_products)
+
+    def get_queryset(self):
+        return products_for_serializer()
+
+    def get_cache_tags(self, request):
+        if self.action == "retrieve":
+            return [f"product:{self.kwargs['pk']}"]
+        suppliers = request.query_params.getlist("supplier")
+        if len(suppliers) == 1 and suppliers[0].isdigit():
+            # Список одного поставщика сбрасывается только его изменениями
+            return [f"supplier:{suppliers[0]}", "categories"]
+        return ["products", "categories"]
+
+    def get_version_scope(self, request):
+        suppliers = request.query_params.getlist("supplier")
+        if self.action == "list" and len(suppliers) == 1 and suppliers[0].isdigit():
+            return supplier_scope(suppliers[0])
+        return GLOBAL_SCOPE
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            product = serializer.save()
+            add_facets(Product.objects.filter(pk=product.pk))
+            # Поисковый документ, версия каталога и кэш нового товара
+            catalog_changed.send(
+                sender=Product,
+                supplier_id=product.supplier_id,
+                product_ids=[product.pk],
+            )
+
+    def perform_update(self, serializer):
+        with track_facets(Product.objects.filter(pk=serializer.instance.pk)):
+            # Правка вне прайса: отпечаток строки прайса больше не совпадает
+            product = serializer.save(content_hash="")
+            catalog_changed.send(
+                sender=Product,
+                supplier_id=product.supplier_id,
+                product_ids=[product.pk],
+            )
+
+    def perform_destroy(self, instance):
+        product_id, supplier_id = instance.pk, instance.supplier_id
+        with track_facets(Product.objects.filter(pk=product_id)):
+            record_deleted_products(Product.objects.filter(pk=product_id))
+            instance.delete()
+            catalog_changed.send(
+                sender=Product, supplier_id=supplier_id, product_ids=[product_id]
+            )
+
+    @action(detail=False, methods=["get"])
+    def facets(self, request):
+        """Счётчики фасетов (параметр → значение → число товаров)."""
+        filters = ProductFilterBackend().get_filters(request)
+        only_category = (
+            not filters["supplier"]
+            and not filters["param"]
+            and filters["price_min"] is None
+            and filters["price_max"] is None
+        )
+        if only_category:
+            # Частый случай витрины — готовые счётчики по категориям
+            facets = facet_counts(category_ids=filters["category"])
+        else:
+            facets = facet_counts(products=self.filter_queryset(Product.objects.all()))
+        return Response({"facets": facets})
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """Полнотекстовый поиск по названию, категории и параметрам."""
+        text = request.query_params.get("q", "").strip()
+        if not text:
+            return Response(
+                {"error": "Не указан поисковый запрос"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        limit = self.paginator.get_page_size(request)
+        products = self.filter_queryset(Product.objects.all())
+        ranked = search_products(text, products, limit)
+
+        found = self.get_queryset().in_bulk([product_id for product_id, _ in ranked])
+        results = []
+        for product_id, rank in ranked:
+            if product_id not in found:
+                continue
+            data = self.get_serializer(found[product_id]).data
+            data["rank"] = rank
+            results.append(data)
+        response = {"count": len(results), "results": results}
+        included = build_included(self.get_serializer_context())
+        if included is not None:
+            response["included"] = included
+        return Response(response)
+
+    @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
+    def export(self, request):
+        """
+        Потоковая выгрузка каталога: ``output=ndjson|csv``, фильтры
+        ``supplier``, ``category`` и ``since`` (версия каталога). С ``since``
+        в конце выгрузки идут товары, удалённые после этой версии.
+        """
+        # Не ?format=: этот параметр DRF использует для выбора рендерера
+        output = request.query_params.get("output", "ndjson")
+        if output not in EXPORTERS:
+            return Response(
+                {
+                    "error": f"Неизвестный формат выгрузки. Допустимые: {list(EXPORTERS)}"
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        products = self.filter_queryset(Product.objects.all())
+        deleted = None
+        since = request.query_params.get("since")
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return Response(
+                    {"error": "since должен быть номером версии каталога"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            products = products.filter(catalog_version__gt=since)
+            # Удалённые товары проверяются только по поставщику и категории
+            filters = ProductFilterBackend().get_filters(request)
+            deleted = DeletedProduct.objects.filter(catalog_version__gt=since)
+            if filters["supplier"]:
+                deleted = deleted.filter(supplier_id__in=filters["supplier"])
+            if filters["category"]:
+                deleted = deleted.filter(category_id__in=filters["category"])
+
+        # Версию берём до чтения: следующая выгрузка с since=версия ничего не потеряет
+        version, _ = get_catalog_version(GLOBAL_SCOPE)
+        response = StreamingHttpResponse(
+            EXPORTERS[output](products, deleted), content_type=FORMATS[output]
+        )
+        response.headers["X-Catalog-Version"] = str(version)
+        response.headers["Content-Disposition"] = (
+            f'attachment; filename="catalog-{version}.{output}"'
+        )
+        return response
 
 
 class ParameterViewSet(viewsets.ModelViewSet):
@@ -76,12 +468,61 @@ class ParameterViewSet(viewsets.ModelViewSet):
     queryset = Parameter.objects.all()
     serializer_class = ParameterSerializer
 
+    def perform_create(self, serializer):
+        serializer.save()
+        catalog_changed.send(sender=Parameter)
+
+    def perform_update(self, serializer):
+        parameter = serializer.save()
+        product_ids, supplier_ids = product_suppliers(
+            Product.objects.filter(parameters__parameter=parameter)
+        )
+        # Название параметра входит в отпечаток строки прайса
+        Product.objects.filter(id__in=product_ids).update(content_hash="")
+        # Название параметра вложено в ответы товаров и списки их поставщиков
+        catalog_changed.send(
+            sender=Parameter, product_ids=product_ids, supplier_ids=supplier_ids
+        )
+
+    def perform_destroy(self, instance):
+        product_ids, supplier_ids = product_suppliers(
+            Product.objects.filter(parameters__parameter=instance)
+        )
+        with track_facets(Product.objects.filter(id__in=product_ids)):
+            instance.delete()
+            Product.objects.filter(id__in=product_ids).update(content_hash="")
+        catalog_changed.send(
+            sender=Parameter, product_ids=product_ids, supplier_ids=supplier_ids
+        )
+
 
 class ProductParameterViewSet(viewsets.ModelViewSet):
     """API эндпоинт для просмотра параметров товаров."""
-    queryset = ProductParameter.objects.all()
+    queryset = ProductParameter.objects.select_related("parameter")
     serializer_class = ProductParameterSerializer
 
+    def perform_update(self, serializer):
+        product = serializer.instance.product
+        with track_facets(Product.objects.filter(pk=product.pk)):
+            serializer.save()
+            Product.objects.filter(pk=product.pk).update(content_hash="")
+            catalog_changed.send(
+                sender=ProductParameter,
+                supplier_id=product.supplier_id,
+                product_ids=[product.pk],
+            )
+
+    def perform_destroy(self, instance):
+        product = instance.product
+        with track_facets(Product.objects.filter(pk=product.pk)):
+            instance.delete()
+            Product.objects.filter(pk=product.pk).update(content_hash="")
+            catalog_changed.send(
+                sender=ProductParameter,
+                supplier_id=product.supplier_id,
+                product_ids=[product.pk],
+            )
+
 
 class DeliveryAddressViewSet(viewsets.ModelViewSet):
     """API эндпоинт для управления адресами доставки."""
@@ -97,11 +538,19 @@ class DeliveryAddressViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user)
 
 
-class OrderItemViewSet(viewsets.ModelViewSet):
+class OrderItemViewSet(
+    SparseFieldsViewMixin, FastSerializationMixin, viewsets.ModelViewSet
+):
     """API эндпоинт для просмотра товаров в заказе."""
     queryset = OrderItem.objects.all()
     serializer_class = OrderItemSerializer
     permission_classes = [IsAuthenticated]
+    fast_endpoint = "order_items"
+    fast_rows = staticmethod(fast_serializers.order_item_rows)
+    fast_serialize = staticmethod(fast_serializers.serialize_order_items)
+
+    def get_queryset(self):
+        return order_items_for_serializer()
 
 
 ### === Изменеие статуса заказа только Админы могут
@@ -142,5 +591,12 @@ def update_order_status_view(request, order_id):
     order.save()
 
     # Сериализуем и возвращаем обновлённый заказ
-    serializer = OrderSerializer(order)
+    serializer = OrderSerializer(prefetch_order(order))
     return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def catalog_cache_stats_view(request):
+    """Счётчики кэша каталога текущего процесса (только для администраторов)."""
+    return Response(catalog_cache.stats())
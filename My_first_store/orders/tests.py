@@ -1,3 +1,140 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core import mail
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import (
+    Basket,
+    BasketItem,
+    Category,
+    DeliveryAddress,
+    IdempotencyKey,
+    Order,
+)
+from core.tests import QueryBudgetMixin, make_product, make_supplier, make_user
+
+
+class OrderIdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.address = DeliveryAddress.objects.create(
+            user=self.user, city="Москва", street="Тверская", house="1"
+        )
+        basket = Basket.objects.create(user=self.user)
+        product = make_product(make_supplier(), Category.objects.create(name="К"))
+        BasketItem.objects.create(basket=basket, product=product, quantity=2)
+
+    def create(self, key, address_id=None):
+        return self.client.post(
+            "/api/orders/create/",
+            {"delivery_address_id": address_id or self.address.id},
+            format="json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_repeat_replays_stored_response(self):
+        first = self.create("order-1")
+        self.assertEqual(first.status_code, 201)
+        repeat = self.create("order-1")
+        self.assertEqual(repeat.status_code, 201)
+        self.assertEqual(repeat["Idempotent-Replayed"], "true")
+        self.assertEqual(repeat.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_same_key_with_other_body_is_rejected(self):
+        self.assertEqual(self.create("order-1").status_code, 201)
+        self.assertEqual(self.create("order-1", address_id=999).status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_server_error_is_not_stored(self):
+        with self.settings(
+            EMAIL_BACKEND="django.core.mail.backends.nonexistent.Backend"
+        ):
+            with self.assertRaises(ImportError):
+                self.create("order-1")
+        self.assertFalse(IdempotencyKey.objects.exists())
+        # Заказ упавшего запроса откатан: повтор создаёт ровно один
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.create("order-1").status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_taken_over_key_is_not_overwritten(self):
+        def take_over(*args, **kwargs):
+            # Пока запрос выполняется, ключ занимают как брошенный
+            IdempotencyKey.objects.all().delete()
+            IdempotencyKey.objects.create(
+                user=self.user,
+                endpoint="order_create_view",
+                key="order-1",
+                fingerprint="другой",
+                expires_at=timezone.now() + timedelta(hours=1),
+            )
+
+        with mock.patch("orders.views.send_mail", side_effect=take_over):
+            response = self.create("order-1")
+        self.assertEqual(response.status_code, 201)
+        # Ответ отдан, но запись нового владельца не тронута
+        record = IdempotencyKey.objects.get()
+        self.assertEqual((record.status, record.fingerprint), ("in_progress", "другой"))
+
+
+class OrderCreateQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.address = DeliveryAddress.objects.create(
+            user=self.user, city="Москва", street="Тверская", house="1"
+        )
+        self.basket = Basket.objects.create(user=self.user)
+        self.supplier = make_supplier()
+        self.category = Category.objects.create(name="К")
+        self.add_item()
+
+    def add_item(self):
+        BasketItem.objects.create(
+            basket=self.basket,
+            product=make_product(self.supplier, self.category),
+            quantity=2,
+        )
+
+    def test_create(self):
+        def fetch():
+            response = self.client.post(
+                "/api/orders/create/",
+                {"delivery_address_id": self.address.id},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.data["items"]), self.basket.items.count())
+
+        self.assertQueryCountConstant(
+            fetch, lambda: [self.add_item() for _ in range(5)]
+        )
 
-# Create your tests here.
+    def test_basket_is_read_once_inside_transaction(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post(
+                "/api/orders/create/",
+                {"delivery_address_id": self.address.id},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        table = BasketItem._meta.db_table
+        reads = [
+            query["sql"]
+            for query in captured
+            if query["sql"].startswith("SELECT") and f'FROM "{table}"' in query["sql"]
+        ]
+        # Проверка и позиции заказа — одно чтение, товары под блокировкой
+        self.assertEqual(len(reads), 1)
+        if connection.features.has_select_for_update_of:
+            self.assertIn("FOR UPDATE OF", reads[0])
@@ -6,6 +6,7 @@ from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.utils import timezone
+from django.db import transaction
 from datetime import timedelta
 import random
 import string
@@ -18,11 +19,18 @@ from core.models import (
     OrderConfirmationCode,
 )
 from core.serializers import OrderSerializer, OrderItemSerializer
+from core.querysets import prefetch_order
+from core.idempotency import idempotent
+from core.stock import InsufficientStock, deduct_order_stock
+from core.baskets import persisted_basket
+from basket.services import basket_errors, basket_items, stock_error
 from rest_framework import viewsets
 
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@persisted_basket
+@idempotent
 def order_create_view(request):
     """Создаёт новый заказ из корзины аутентифицированного пользователя."""
     # Получаем корзину пользователя
@@ -31,94 +39,94 @@ def order_create_view(request):
     except Basket.DoesNotExist:
         return Response({"error": "Корзина пуста"}, status=status.HTTP_400_BAD_REQUEST)
 
-    basket_items = basket.items.all()
-    if not basket_items.exists():
-        return Response({"error": "Корзина пуста"}, status=status.HTTP_400_BAD_REQUEST)
+    # Позиции читаются один раз и внутри транзакции: строки товаров
+    # заблокированы, поэтому проверяются и попадают в заказ одни и те же
+    # остатки
+    with transaction.atomic():
+        items = basket_items(basket, lock=True)
+        if not items:
+            return Response(
+                {"error": "Корзина пуста"}, status=status.HTTP_400_BAD_REQUEST
+            )
 
-    # Проверяем, есть ли товары в корзине
-    # Проверяем, принимает ли поставщик заказы
-    for item in basket_items:
-        if not item.product.supplier.accepts_orders:
+        # Проверяем все позиции: остатки и приём заказов поставщиками
+        errors = basket_errors(items)
+        if errors:
             return Response(
-                {
-                    "error": f'Поставщик "{item.product.supplier.name}" не принимает заказы. Невозможно оформить заказ с товаром "{item.product.name}".'
-                },
+                {"error": errors[0]["error"], "errors": errors},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Проверяем количество товара на складе
-        if item.product.quantity < item.quantity:
+        # Получаем адрес доставки из тела запроса
+        address_id = request.data.get("delivery_address_id")
+        if not address_id:
             return Response(
-                {
-                    "error": f'Недостаточно товара "{item.product.name}" на складе. Запрошено: {item.quantity}, доступно: {item.product.quantity}'
-                },
+                {"error": "Не указан адрес доставки"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-    # Получаем адрес доставки из тела запроса
-    address_id = request.data.get("delivery_address_id")
-    if not address_id:
-        return Response(
-            {"error": "Не указан адрес доставки"}, status=status.HTTP_400_BAD_REQUEST
-        )
+        try:
+            address_id = int(address_id)
+            if address_id < 0:  # Проверяем, что число неотрицательное
+                return Response(
+                    {"error": "ID адреса доставки не может быть отрицательным"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+        except (ValueError, TypeError):
+            return Response(
+                {"error": "ID адреса доставки должен быть целым числом"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-    try:
-        address_id = int(address_id)
-        if address_id < 0:  # Проверяем, что число неотрицательное
+        # Проверяем, что адрес принадлежит пользователю
+        try:
+            address = DeliveryAddress.objects.get(id=address_id, user=request.user)
+        except DeliveryAddress.DoesNotExist:
             return Response(
-                {"error": "ID адреса доставки не может быть отрицательным"},
+                {"error": "Адрес доставки не найден или не принадлежит пользователю"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-    except (ValueError, TypeError):
-        return Response(
-            {"error": "ID адреса доставки должен быть целым числом"},
-            status=status.HTTP_400_BAD_REQUEST,
-        )
 
-    # Проверяем, что адрес принадлежит пользователю
-    try:
-        address = DeliveryAddress.objects.get(id=address_id, user=request.user)
-    except DeliveryAddress.DoesNotExist:
-        return Response(
-            {"error": "Адрес доставки не найден или не принадлежит пользователю"},
-            status=status.HTTP_400_BAD_REQUEST,
+        # Если всё ок, создаём заказ: заказ, позиции и код подтверждения,
+        # позиции — одним bulk_create из проверенных строк
+        # НЕ УМЕНЬШАЕМ количество на складе пока
+        confirmation_code = "".join(random.choices(string.digits, k=6))
+        expires_at = timezone.now() + timedelta(minutes=15)  # Код действует 15 минут
+        order = Order.objects.create(
+            user=request.user, address=address, status="new"
+        )  # <-- Статус 'new'
+        OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=order, product_id=item.product_id, quantity=item.quantity
+                )
+                for item in items
+            ]
+        )
+        OrderConfirmationCode.objects.create(
+            order=order, code=confirmation_code, expires_at=expires_at
         )
 
-    # Если всё ок, создаём заказ
-    order = Order.objects.create(
-        user=request.user, address=address, status="new"
-    )  # <-- Статус 'new'
+        # Позиции с товарами — для письма и ответа
+        order = prefetch_order(order)
 
-    # Создаём OrderItem для каждого товара в корзине
-    # НЕ УМЕНЬШАЕМ количество на складе пока
-    for item in basket_items:
-        OrderItem.objects.create(
-            order=order, product=item.product, quantity=item.quantity
-        )
+        # --- Отправка email с кодом подтверждения ---
+        # В той же транзакции: если письмо не ушло, заказа нет и повтор
+        # запроса создаст его заново
 
-    # Генерируем код подтверждения
-    confirmation_code = "".join(random.choices(string.digits, k=6))
-    expires_at = timezone.now() + timedelta(minutes=15)  # Код действует 15 минут
-
-    OrderConfirmationCode.objects.create(
-        order=order, code=confirmation_code, expires_at=expires_at
-    )
-
-    # --- Отправка email с кодом подтверждения ---
-
-    subject_client = f"Подтверждение заказа #{order.id}"
-    html_message_client = render_to_string(
-        "email/order_confirmation_request.html",
-        {"order": order, "confirmation_code": confirmation_code},
-    )
-    plain_message_client = strip_tags(html_message_client)
-    send_mail(
-        subject_client,
-        plain_message_client,
-        None,  # Используем DEFAULT_FROM_EMAIL
-        [request.user.email],  # Email клиента
-        html_message=html_message_client,
-    )
+        subject_client = f"Подтверждение заказа #{order.id}"
+        html_message_client = render_to_string(
+            "email/order_confirmation_request.html",
+            {"order": order, "confirmation_code": confirmation_code},
+        )
+        plain_message_client = strip_tags(html_message_client)
+        send_mail(
+            subject_client,
+            plain_message_client,
+            None,  # Используем DEFAULT_FROM_EMAIL
+            [request.user.email],  # Email клиента
+            html_message=html_message_client,
+        )
 
     # Возвращаем информацию о созданном заказе (пока не подтверждён)
     serializer = OrderSerializer(order)
@@ -127,6 +135,8 @@ def order_create_view(request):
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@persisted_basket
+@idempotent
 def confirm_order_view(request):
     """Подтверждает заказ с помощью кода подтверждения."""
     order_id = request.data.get("order_id")
@@ -179,10 +189,15 @@ def confirm_order_view(request):
         )
 
     # --- Код верен и не истёк ---
-    # Уменьшаем количество на складе
-    for item in order.items.all():
-        item.product.quantity -= item.quantity
-        item.product.save()
+    # Уменьшаем количество на складе; если товар успели раскупить, заказ
+    # остаётся неподтверждённым
+    try:
+        deduct_order_stock(order)
+    except InsufficientStock as error:
+        return Response(
+            {"error": stock_error(error.name, error.requested, error.available)},
+            status=status.HTTP_409_CONFLICT,
+        )
 
     # Меняем статус заказа
     order.status = "confirmed"
@@ -196,5 +211,5 @@ def confirm_order_view(request):
     basket.items.all().delete()
 
     # Возвращаем информацию о подтверждённом заказе
-    serializer = OrderSerializer(order)
+    serializer = OrderSerializer(prefetch_order(order))
     return Response(serializer.data, status=status.HTTP_200_OK)
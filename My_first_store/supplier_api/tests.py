@@ -1,3 +1,288 @@
+import gzip
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.importer import PriceListImporter
+from core.models import Category, DeliveryAddress, Order, OrderItem, Product
+from core.tests import QueryBudgetMixin, make_product, make_supplier, make_user
+from core.versions import get_catalog_version, supplier_scope
+
+
+class SupplierOrdersQueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.supplier = make_supplier()
+        self.client = APIClient()
+        self.client.force_authenticate(self.supplier.user)
+        self.category = Category.objects.create(name="Смартфоны")
+        self.buyer = make_user()
+        self.address = DeliveryAddress.objects.create(
+            user=self.buyer, city="Москва", street="Тверская", house="1"
+        )
+        self.add_order(1)
+
+    def add_order(self, lines):
+        order = Order.objects.create(user=self.buyer, address=self.address)
+        for _ in range(lines):
+            OrderItem.objects.create(
+                order=order,
+                product=make_product(self.supplier, self.category),
+                quantity=1,
+            )
+
+    def test_supplier_orders_view(self):
+        def grow():
+            for _ in range(3):
+                self.add_order(4)
+
+        def fetch():
+            response = self.client.get("/api/supplier/orders/")
+            self.assertEqual(response.status_code, 200)
+
+        self.assertQueryCountConstant(fetch, grow)
+
+
+class SupplierStockTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.supplier = make_supplier()
+        self.client = APIClient()
+        self.client.force_authenticate(self.supplier.user)
+        self.category = Category.objects.create(name="Смартфоны")
+        self.products = [
+            make_product(self.supplier, self.category, content_hash="x")
+            for _ in range(3)
+        ]
+
+    def post(self, goods):
+        return self.client.post("/api/supplier/stock/", {"goods": goods}, format="json")
+
+    def test_updates_changed_and_reports_unmatched(self):
+        first, second, third = self.products
+        response = self.post(
+            [
+                {"id": first.external_id, "quantity": 0, "price": "150.50"},
+                {"id": second.external_id, "quantity": 10, "price": 100},
+                {"id": "нет-такого", "quantity": 1, "price": 1},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["updated"], 1)
+        self.assertEqual(response.data["unchanged"], 1)
+        self.assertEqual(response.data["unmatched"], ["нет-такого"])
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.quantity, str(first.price)), (0, "150.50"))
+        # Отпечаток изменённого товара сброшен: следующий прайс его перезапишет
+        self.assertEqual(first.content_hash, "")
+        self.assertEqual(second.content_hash, "x")
+        self.assertGreater(first.catalog_version, second.catalog_version)
+
+    def test_unchanged_rows_keep_catalog_version(self):
+        version = get_catalog_version(supplier_scope(self.supplier.id))
+        response = self.post(
+            [
+                {"id": product.external_id, "quantity": 10, "price": 100}
+                for product in self.products
+            ]
+        )
+        self.assertEqual(response.data["updated"], 0)
+        self.assertEqual(get_catalog_version(supplier_scope(self.supplier.id)), version)
+
+        self.post([{"id": self.products[0].external_id, "quantity": 1, "price": 1}])
+        self.assertGreater(
+            get_catalog_version(supplier_scope(self.supplier.id))[0], version[0]
+        )
+
+    def test_rejects_invalid_row(self):
+        response = self.post(
+            [
+                {"id": self.products[0].external_id, "quantity": 1, "price": 1},
+                {"id": self.products[1].external_id, "quantity": -1, "price": 1},
+            ]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("#1", response.data["error"])
+        self.assertEqual(Product.objects.filter(quantity=1).count(), 0)
+
+    def test_rejects_values_out_of_range(self):
+        external_id = self.products[0].external_id
+        for row in (
+            {"quantity": 1, "price": "NaN"},
+            {"quantity": 1, "price": "Infinity"},
+            {"quantity": 1, "price": "1e30"},
+            {"quantity": 10**10, "price": 1},
+        ):
+            with self.subTest(row=row):
+                response = self.post([{"id": external_id, **row}])
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("#0", response.data["error"])
+
+    def test_query_count(self):
+        def grow():
+            for _ in range(20):
+                self.products.append(make_product(self.supplier, self.category))
+
+        def fetch():
+            response = self.post(
+                [
+                    {"id": product.external_id, "quantity": 5, "price": 99}
+                    for product in self.products
+                ]
+            )
+            self.assertEqual(response.status_code, 200)
+
+        self.assertQueryCountConstant(fetch, grow)
+
+
+class PriceListDryRunTests(TestCase):
+    def setUp(self):
+        self.supplier = make_supplier()
+        self.client = APIClient()
+        self.client.force_authenticate(self.supplier.user)
+
+    def test_reports_every_error_without_writes(self):
+        data = {
+            "shop": "Связной",
+            "categories": [{"id": 1, "name": "Смартфоны"}, {"id": "x", "name": "?"}],
+            "goods": [
+                {"id": 1, "category": 1, "name": "A", "price": 10, "quantity": 1},
+                {"id": 2, "category": 1, "name": "B", "price": "?", "quantity": -1},
+                {"id": 3, "category": 9, "name": "C", "price": 10, "quantity": 1},
+                {"id": 4, "name": "D", "price": 10, "quantity": 1},
+            ],
+        }
+        with self.assertNumQueries(0):
+            response = self.client.post(
+                "/api/supplier/upload-price/?dry_run=1", data, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data["valid"])
+        self.assertEqual(response.data["errors_total"], 5)
+        self.assertEqual(
+            [error.get("row") for error in response.data["errors"]],
+            [None, 1, 1, 2, 3],
+        )
+        self.assertFalse(Product.objects.exists())
+
+    def test_non_finite_price_is_a_row_error(self):
+        for price in ("NaN", "-Infinity", "sNaN"):
+            data = {
+                "shop": "Связной",
+                "categories": [{"id": 1, "name": "Смартфоны"}],
+                "goods": [
+                    {"id": 1, "category": 1, "name": "A", "price": price, "quantity": 1}
+                ],
+            }
+            with self.subTest(price=price):
+                response = self.client.post(
+                    "/api/supplier/upload-price/?dry_run=1", data, format="json"
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.data["valid"])
+                self.assertEqual(
+                    [error.get("row") for error in response.data["errors"]], [0]
+                )
+
+
+class CompressedPriceListTests(TestCase):
+    def setUp(self):
+        self.supplier = make_supplier()
+        self.client = APIClient()
+        self.client.force_authenticate(self.supplier.user)
+        self.body = json.dumps(
+            {
+                "shop": self.supplier.name,
+                "categories": [{"id": 1, "name": "Смартфоны"}],
+                "goods": [
+                    {
+                        "id": n,
+                        "category": 1,
+                        "name": f"Товар {n}",
+                        "price": 10,
+                        "quantity": 1,
+                    }
+                    for n in range(50)
+                ],
+            }
+        ).encode()
+
+    def test_gzip_body(self):
+        response = self.client.generic(
+            "POST",
+            "/api/supplier/upload-price/",
+            gzip.compress(self.body),
+            content_type="application/json",
+            HTTP_CONTENT_ENCODING="gzip",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 50)
+
+    def test_multipart_gzip_file(self):
+        upload = SimpleUploadedFile("price.json.gz", gzip.compress(self.body))
+        response = self.client.post(
+            "/api/supplier/upload-price/", {"file": upload}, format="multipart"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Product.objects.filter(supplier=self.supplier).count(), 50)
+
+    def test_large_body_is_compared_by_checksum(self):
+        def upload(body):
+            return self.client.generic(
+                "POST",
+                "/api/supplier/upload-price/",
+                body,
+                content_type="application/json",
+                HTTP_IDEMPOTENCY_KEY="price-1",
+            )
+
+        with self.settings(DATA_UPLOAD_MAX_MEMORY_SIZE=100):
+            self.assertEqual(upload(self.body).status_code, 201)
+            # Тот же размер, другие цены
+            other = self.body.replace(b'"price": 10', b'"price": 20')
+            self.assertEqual(len(other), len(self.body))
+            self.assertEqual(upload(other).status_code, 422)
+            repeat = upload(self.body)
+        self.assertEqual(repeat.status_code, 201)
+        self.assertEqual(repeat["Idempotent-Replayed"], "true")
+        self.assertEqual(
+            set(Product.objects.values_list("price", flat=True)), {Decimal("10")}
+        )
+
+    def test_chunks_are_not_nested_in_key_transaction(self):
+        depths = []
+        save_batch = PriceListImporter.save_batch
+
+        def record_depth(importer, *args):
+            depths.append(len(connection.atomic_blocks))
+            return save_batch(importer, *args)
+
+        with mock.patch.object(PriceListImporter, "save_batch", record_depth):
+            for key in ("", "price-1"):
+                upload = SimpleUploadedFile("price.json.gz", gzip.compress(self.body))
+                response = self.client.post(
+                    "/api/supplier/upload-price/?full=1",
+                    {"file": upload},
+                    format="multipart",
+                    HTTP_IDEMPOTENCY_KEY=key,
+                )
+                self.assertEqual(response.status_code, 201)
+        # Пачка фиксируется своей транзакцией, а не точкой сохранения
+        # внутри транзакции ключа
+        self.assertEqual(len(depths), 2)
+        self.assertEqual(len(set(depths)), 1)
 
-# Create your tests here.
+    def test_unknown_encoding(self):
+        response = self.client.generic(
+            "POST",
+            "/api/supplier/upload-price/",
+            self.body,
+            content_type="application/json",
+            HTTP_CONTENT_ENCODING="br",
+        )
+        self.assertEqual(response.status_code, 415)
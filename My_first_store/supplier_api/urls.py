@@ -9,6 +9,21 @@ urlpatterns = [
         views.supplier_upload_price_view,
         name="supplier-upload-price",
     ),
+    path(
+        "api/supplier/upload-price/stream/",
+        views.supplier_upload_price_stream_view,
+        name="supplier-upload-price-stream",
+    ),
+    path(
+        "api/supplier/stock/",
+        views.supplier_update_stock_view,
+        name="supplier-update-stock",
+    ),
+    path(
+        "api/supplier/import-jobs/<int:job_id>/",
+        views.supplier_import_job_view,
+        name="supplier-import-job",
+    ),
     path(
         "api/supplier/toggle-accepts-orders/",
         views.toggle_supplier_accepts_orders,
@@ -2,17 +2,36 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from django.db import transaction
+from django.conf import settings
+from django.urls import reverse
 from core.models import (
     Supplier,
-    Category,
-    Product,
-    Parameter,
-    ProductParameter,
+    ImportJob,
     Order,
     OrderItem,
 )
 from core.serializers import OrderSerializer, SupplierSerializer
+from core.querysets import orders_for_serializer
+from core.importer import (
+    PriceListError,
+    get_price_list_upload,
+    import_price_list,
+    import_price_list_file,
+    validate_price_list,
+)
+from core.jsonstream import JSONStreamError, iter_array
+from core.signals import catalog_changed
+from core.stock import apply_stock_delta, parse_stock_rows
+from core.jobs import enqueue_price_list, job_progress
+from core.idempotency import idempotent
+from core.uploads import (
+    UploadError,
+    decompressed,
+    is_file_upload,
+    raw_upload,
+    spool_upload,
+    upload_encoding,
+)
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework import viewsets
 
@@ -20,6 +39,7 @@ from rest_framework import viewsets
 # API-эндпоинт, через который поставщик сможет загружать/обновлять свои товары в базу данных через API,
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
+@idempotent
 def supplier_upload_price_view(request):
     """Загружает или обновляет прайс-лист поставщика."""
     # Проверяем, является ли пользователь поставщиком
@@ -31,6 +51,19 @@ def supplier_upload_price_view(request):
             status=status.HTTP_403_FORBIDDEN,
         )
 
+    if _wants_async(request):
+        return _enqueue_response(request, supplier)
+    # Сжатое тело или multipart — потоком через временный файл
+    try:
+        if is_file_upload(request):
+            return _import_file_response(
+                request, supplier, mark_missing=_wants_full(request)
+            )
+    except UploadError as error:
+        return Response(
+            {"error": str(error)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        )
+
     # Получаем данные из тела запроса
     data = request.data
 
@@ -41,133 +74,215 @@ def supplier_upload_price_view(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
-    # Начинаем транзакцию для атомарности операций
-    with transaction.atomic():
-        # Создаём/обновим категории
-        category_map = {}
-        for cat_data in data.get("categories", []):
-            # Проверим ID категории на целое число, если оно есть
-            # (обычно ID из внешнего источника может быть строкой)
-            try:
-                cat_id = int(cat_data["id"])
-            except (ValueError, TypeError):
-                return Response(
-                    {
-                        "error": f'ID категории "{cat_data["name"]}" должно быть целым числом.'
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            cat, _ = Category.objects.get_or_create(
-                id=cat_id,  # Используем проверенное значение
-                defaults={"name": cat_data["name"]},
+    if _wants_dry_run(request):
+        return Response(
+            validate_price_list(data.get("categories", []), data["goods"]),
+            status=status.HTTP_200_OK,
+        )
+
+    # Вся загрузка — одна транзакция: при ошибке в любой строке откатывается
+    try:
+        # ?full=1 — прайс полный: отсутствующие в нём товары снимаются с остатка
+        result = import_price_list(
+            supplier,
+            data,
+            mark_missing=_wants_full(request),
+        )
+    except PriceListError as error:
+        return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(
+        {"message": "Прайс-лист успешно загружен", **result},
+        status=status.HTTP_201_CREATED,
+    )
+
+
+# Частое обновление только остатков и цен: {"goods": [{"id", "quantity",
+# "price"}, ...]} без названий, категорий и параметров
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def supplier_update_stock_view(request):
+    """Обновляет остатки и цены товаров поставщика по external_id."""
+    try:
+        supplier = request.user.supplier_profile
+    except Supplier.DoesNotExist:
+        return Response(
+            {"error": "Пользователь не является поставщиком"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+
+    data = request.data
+    if not isinstance(data, dict) or "goods" not in data:
+        return Response(
+            {"error": 'Неверный формат данных. Ожидается объект с полем "goods".'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        rows = parse_stock_rows(data["goods"])
+    except PriceListError as error:
+        return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+    changed, unmatched = apply_stock_delta(supplier, rows)
+    return Response(
+        {
+            "rows": len(rows),
+            "updated": len(changed),
+            "unchanged": len(rows) - len(changed) - len(unmatched),
+            # Этих товаров у поставщика нет: их нужно загрузить прайс-листом
+            "unmatched": unmatched,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+# Потоковая загрузка больших прайс-листов: тело запроса не разбирается
+# целиком, а копируется во временный файл и читается пачками; принимает
+# и сжатые тела, и multipart (core.uploads)
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def supplier_upload_price_stream_view(request):
+    """Загружает большой прайс-лист пачками с продолжением после сбоя."""
+    try:
+        supplier = request.user.supplier_profile
+    except Supplier.DoesNotExist:
+        return Response(
+            {"error": "Пользователь не является поставщиком"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+
+    if _wants_async(request):
+        return _enqueue_response(request, supplier)
+    return _import_file_response(request, supplier, mark_missing=_wants_full(request))
+
+
+# ?full=1 — прайс полный: отсутствующие в нём товары снимаются с остатка
+def _wants_full(request):
+    return request.query_params.get("full", "").lower() in ("1", "true")
+
+
+def _import_file_response(request, supplier, mark_missing=False):
+    # request.data не трогаем: иначе DRF разберёт весь JSON в память
+    try:
+        encoding = upload_encoding(request)
+    except UploadError as error:
+        return Response(
+            {"error": str(error)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        )
+    if raw_upload(request) is None:
+        return Response(
+            {"error": "Пустое тело запроса"}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    spool, checksum = spool_upload(request)
+    with spool:
+        fileobj = decompressed(spool, encoding)
+        if _wants_dry_run(request):
+            return _dry_run_response(fileobj)
+
+        upload = get_price_list_upload(supplier, checksum)
+        try:
+            result = import_price_list_file(
+                upload,
+                fileobj,
+                chunk_size=settings.PRICE_LIST_CHUNK_SIZE,
+                mark_missing=mark_missing,
             )
-            category_map[cat_id] = cat
-
-        # Создаём/обновим параметры
-        parameter_map = {}
-        for good in data["goods"]:
-            for param_name in good["parameters"]:
-                param, _ = Parameter.objects.get_or_create(name=param_name)
-                parameter_map[param_name] = param
-
-        # Обрабатываем товары
-        created_count = 0
-        updated_count = 0
-        for good in data["goods"]:
-            category = category_map.get(good["category"])
-            if not category:
-                return Response(
-                    {"error": f'Категория с ID {good["category"]} не найдена.'},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            # Проверка и обработка количества товара
-            try:
-                good_quantity = int(
-                    good["quantity"]
-                )  # good['quantity'] может быть строкой
-            except (ValueError, TypeError):
-                return Response(
-                    {
-                        "error": f'Количество товара "{good["name"]}" (ID: {good["id"]}) должно быть целым числом.'
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            # Проверка, что количество неотрицательное
-            if (
-                good_quantity < 0
-            ):  # Или <= 0, в зависимости от бизнес-логики (может быть 0 на складе)
-                return Response(
-                    {
-                        "error": f'Количество товара "{good["name"]}" (ID: {good["id"]}) не может быть отрицательным.'
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            # Проверка и обработка цены товара
-            try:
-                good_price = float(good["price"])  # Цена может быть строкой "123.45"
-                if good_price < 0:
-                    return Response(
-                        {
-                            "error": f'Цена товара "{good["name"]}" (ID: {good["id"]}) не может быть отрицательной.'
-                        },
-                        status=status.HTTP_400_BAD_REQUEST,
-                    )
-            except (ValueError, TypeError):
-                return Response(
-                    {
-                        "error": f'Цена товара "{good["name"]}" (ID: {good["id"]}) должна быть числом.'
-                    },
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            # Используем external_id и supplier для уникальности
-            # good['id'] - это external_id
-            product, created = Product.objects.get_or_create(
-                external_id=good[
-                    "id"
-                ],  # external_id может быть строкой, это нормально для CharField
-                supplier=supplier,
-                defaults={
-                    "name": good["name"],
-                    "category": category,
-                    "price": good_price,  # Используем проверенное значение
-                    "quantity": good_quantity,  # Используем проверенное значение
+        except PriceListError as error:
+            return Response(
+                {
+                    "error": str(error),
+                    "upload": upload.id,
+                    "rows_done": upload.rows_done,
                 },
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-            if not created:
-                # Если товар уже был, обновим поля
-                product.name = good["name"]
-                product.category = category
-                product.price = good_price  # Используем проверенное значение
-                product.quantity = good_quantity  # Используем проверенное значение
-                product.save()
-                updated_count += 1
-            else:
-                created_count += 1
-
-            for param_name, param_value in good["parameters"].items():
-                param = parameter_map[param_name]
-                ProductParameter.objects.update_or_create(
-                    product=product,
-                    parameter=param,
-                    defaults={"value": str(param_value)},
-                )
+    return Response(
+        {"message": "Прайс-лист успешно загружен", "upload": upload.id, **result},
+        status=status.HTTP_201_CREATED,
+    )
+
+
+# Проверка без загрузки (?dry_run=1): все ошибки с номерами строк, БД не
+# затрагивается
+def _wants_dry_run(request):
+    return request.query_params.get("dry_run", "").lower() in ("1", "true")
+
 
+def _dry_run_response(spool):
+    try:
+        spool.seek(0)
+        categories = list(iter_array(spool, "categories"))
+        spool.seek(0)
+        result = validate_price_list(categories, iter_array(spool, "goods"))
+    except JSONStreamError as error:
+        return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result, status=status.HTTP_200_OK)
+
+
+# Фоновая загрузка (?async=1): файл ставится в очередь core.jobs, ответ —
+# id задания; ход загрузки — через supplier_import_job_view
+def _wants_async(request):
+    # Проверка без загрузки в очередь не ставится
+    return not _wants_dry_run(request) and request.query_params.get(
+        "async", ""
+    ).lower() in ("1", "true")
+
+
+def _enqueue_response(request, supplier):
+    try:
+        encoding = upload_encoding(request)
+    except UploadError as error:
+        return Response(
+            {"error": str(error)}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        )
+    stream = raw_upload(request)
+    if stream is None:
+        return Response(
+            {"error": "Пустое тело запроса"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    # В очередь файл попадает уже распакованным
+    try:
+        job = enqueue_price_list(
+            supplier, decompressed(stream, encoding), mark_missing=_wants_full(request)
+        )
+    except JSONStreamError as error:
+        return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
     return Response(
         {
-            "message": "Прайс-лист успешно загружен",
-            "created": created_count,
-            "updated": updated_count,
+            "job": job.id,
+            "status": job.status,
+            "status_url": request.build_absolute_uri(
+                reverse("supplier-import-job", args=[job.id])
+            ),
         },
-        status=status.HTTP_201_CREATED,
+        status=status.HTTP_202_ACCEPTED,
     )
 
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def supplier_import_job_view(request, job_id):
+    """Ход фоновой загрузки прайс-листа: строки, скорость, ошибки."""
+    try:
+        supplier = request.user.supplier_profile
+    except Supplier.DoesNotExist:
+        return Response(
+            {"error": "Пользователь не является поставщиком"},
+            status=status.HTTP_403_FORBIDDEN,
+        )
+
+    try:
+        job = ImportJob.objects.select_related("upload").get(
+            id=job_id, supplier=supplier
+        )
+    except ImportJob.DoesNotExist:
+        return Response(
+            {"error": "Задание не найдено"}, status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(job_progress(job))
+
+
 # API-эндпоинт, чтобы поставщик мог изменить это поле через API.
 
 
@@ -197,6 +312,8 @@ def toggle_supplier_accepts_orders(request):
 
     supplier.accepts_orders = new_status
     supplier.save()
+    # Статус поставщика вложен в ответы каталога по его товарам
+    catalog_changed.send(sender=Supplier, supplier_id=supplier.id)
 
     return Response(
         {"accepts_orders": supplier.accepts_orders}, status=status.HTTP_200_OK
@@ -218,7 +335,9 @@ def supplier_orders_view(request):
         )
 
     # Находим заказы, в которых есть товары от этого поставщика
-    orders = Order.objects.filter(items__product__supplier=supplier).distinct()
+    orders = orders_for_serializer(
+        Order.objects.filter(items__product__supplier=supplier).distinct()
+    )
 
     # Сериализуем заказы
     serializer = OrderSerializer(orders, many=True)